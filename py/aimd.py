@@ -0,0 +1,208 @@
+import threading
+import time
+
+from utils import get_api
+
+# adaptive concurrency per API (additive increase, multiplicative decrease).
+# the engine starts each API at its configured concurrency, then:
+# - adds one completion slot after a full window of successful requests
+#   (as many as the current limit) while latency is stable.
+# - halves the limit on a throttled request (429, 5xx or timeout).
+# latency is a secondary signal: when the recent latency of a model and turn
+# rises well above its longer-term average, the limit stops growing, but it
+# only decreases on throttling. latencies are kept per model and turn, since
+# e.g. considerations turns take much longer than policies turns.
+# decreases are spaced by at least one request's latency, so a burst of
+# errors from the same window only counts once. latency is measured around
+# the API call only, time waiting for the rate limiter is not included.
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY_FACTOR = 4  # max limit, times the configured concurrency
+DECREASE_FACTOR = 0.5
+
+# latency averages, in seconds
+SHORT_ALPHA = 0.3
+LONG_ALPHA = 0.05
+LATENCY_RISE = 1.5  # short average over long average that counts as rising
+WARMUP_REQUESTS = 10  # requests of a model and turn before latency is used
+MIN_COOLDOWN = 0.1  # seconds between decreases, at least one request latency
+
+THROTTLE_STATUS = 429
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+class AimdController:
+    """
+    Thread-safe concurrency limit of one API, updated by request outcomes.
+
+    Args:
+      api: API name.
+      initial: starting limit.
+      maximum: max limit, MAX_CONCURRENCY_FACTOR times initial if None.
+      adaptive: False to keep the limit at initial and only count outcomes.
+    """
+
+    def __init__(self, api, initial, maximum=None, adaptive=True):
+        self.api = api
+        self.initial = initial
+        self.minimum = min(MIN_CONCURRENCY, initial)
+        self.maximum = maximum if maximum else initial * MAX_CONCURRENCY_FACTOR
+        self.adaptive = adaptive
+        self.lock = threading.Lock()
+
+        self.value = float(initial)
+        self.window = 0  # successes since the last change
+        # [requests, short average, long average] by (model, data_type)
+        self.latencies = {}
+        self.last_latency = None
+        self.last_decrease = 0
+
+        # run totals
+        self.increases = 0
+        self.decreases = 0
+        self.throttled = 0
+        self.peak = initial
+
+    @property
+    def limit(self):
+        return int(self.value)
+
+    def update_latency(self, key, latency):
+
+        self.last_latency = latency
+        if key not in self.latencies:
+            self.latencies[key] = [1, latency, latency]
+            return
+
+        averages = self.latencies[key]
+        averages[0] += 1
+        averages[1] += SHORT_ALPHA * (latency - averages[1])
+        averages[2] += LONG_ALPHA * (latency - averages[2])
+
+    def is_latency_rising(self, key):
+        requests, short_latency, long_latency = self.latencies[key]
+        return (
+            requests >= WARMUP_REQUESTS and short_latency > LATENCY_RISE * long_latency
+        )
+
+    def get_latency(self, key):
+        """Returns the recent latency of a model and turn, or the last one."""
+        if key in self.latencies:
+            return self.latencies[key][1]
+        return self.last_latency
+
+    def decrease(self, key):
+
+        now = time.monotonic()
+        cooldown = max(MIN_COOLDOWN, self.get_latency(key) or 0)
+        if now - self.last_decrease < cooldown:
+            return
+
+        self.value = max(self.minimum, self.value * DECREASE_FACTOR)
+        self.window = 0
+        self.last_decrease = now
+        self.decreases += 1
+
+    def on_success(self, key, latency):
+
+        with self.lock:
+            self.update_latency(key, latency)
+
+            if not self.adaptive:
+                return
+
+            if self.is_latency_rising(key):
+                # hold the limit until latency settles
+                self.window = 0
+                return
+
+            self.window += 1
+            if self.window >= self.limit and self.value < self.maximum:
+                self.value = min(self.maximum, self.value + 1)
+                self.window = 0
+                self.increases += 1
+                self.peak = max(self.peak, self.limit)
+
+    def on_throttle(self, key):
+
+        with self.lock:
+            self.throttled += 1
+            if self.adaptive:
+                # no increase until a full window succeeds again
+                self.window = 0
+                self.decrease(key)
+
+    def get_state(self):
+
+        with self.lock:
+            return {
+                "api": self.api,
+                "adaptive": self.adaptive,
+                "limit": self.limit,
+                "initial": self.initial,
+                "peak": self.peak,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "throttled": self.throttled,
+                "latency": self.last_latency,
+            }
+
+
+def get_status(error):
+    """Returns the HTTP status of an SDK error, or None."""
+
+    for attr in ["status_code", "status", "http_status", "code"]:
+        status = getattr(error, attr, None)
+        if isinstance(status, int):
+            return status
+
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_throttled(error):
+    """True for errors that mean the API is over capacity."""
+
+    if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+        return True
+
+    status = get_status(error)
+    return status is not None and (status == THROTTLE_STATUS or status >= 500)
+
+
+def open_controller(api, initial, adaptive=True):
+    """Starts a new controller for an API, replacing the previous run's."""
+
+    with _controllers_lock:
+        _controllers[api] = AimdController(api, initial, adaptive=adaptive)
+        return _controllers[api]
+
+
+def get_controller(api):
+    with _controllers_lock:
+        return _controllers.get(api)
+
+
+def report(model, data_type, latency=None, error=None):
+    """
+    Reports the outcome of one request of a turn (data_type): its latency in
+    seconds if it succeeded, or its error. Ignored for APIs the engine does
+    not run, e.g. batch requests.
+    """
+
+    controller = get_controller(get_api(model))
+    if controller is None:
+        return
+
+    key = (model, data_type)
+    if error is None:
+        controller.on_success(key, latency)
+    elif is_throttled(error):
+        controller.on_throttle(key)
+
+
+def get_state(api):
+    controller = get_controller(api)
+    return controller.get_state() if controller is not None else None
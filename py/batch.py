@@ -0,0 +1,301 @@
+import argparse
+import os
+import time
+
+import cost_ledger
+from cost_ledger import BudgetExceededError
+from generate_llm_data import get_check, handle_result, prepare_job, report_job
+from providers import get_api_module
+from utils import (
+    CONSIDERATIONS,
+    InvalidTurnError,
+    POLICIES,
+    PROMPT_R,
+    REASONS,
+    get_utc_time,
+    log_request,
+    parse_numbers_from_response,
+    parse_reasoning_from_response,
+)
+
+# APIs with an asynchronous batch endpoint
+BATCH_PROVIDERS = ["OpenAI API", "Anthropic API"]
+
+# seconds between batch status checks
+POLL_INTERVAL = 30
+
+# batch requests are billed at half the price of live requests
+BATCH_PRICE_FACTOR = 0.5
+
+
+def get_batch_provider(api):
+    if api not in BATCH_PROVIDERS:
+        raise ValueError(
+            f"Batch mode is not supported for {api}. Supported APIs are: {', '.join(BATCH_PROVIDERS)}"
+        )
+    return get_api_module(api)
+
+
+def run_batch(batch_provider, model, conversations, temperature, system_prompt, poll):
+
+    batch_id = batch_provider.submit_batch(
+        model, conversations, temperature, system_prompt
+    )
+
+    print(f"Submitted batch {batch_id} with {len(conversations)} request(s)", end="")
+
+    while not batch_provider.is_batch_done(batch_id):
+        print(".", end="", flush=True)
+        time.sleep(poll)
+
+    print(" DONE.")
+
+    return batch_provider.get_batch_results(model, batch_id)
+
+
+def run_batch_job(job, poll=POLL_INTERVAL):
+    """
+    Advances all completions of a job one turn at a time, with one batch per
+    turn, since each turn depends on the previous response.
+    """
+
+    batch_provider = get_batch_provider(job["api"])
+    model = job["model"]
+    temperature = job["temperature"]
+    system_prompt = job["system_prompt"]
+
+    job["start_time"] = time.time()
+    job["exec_date"] = get_utc_time()
+    job["price_factor"] = BATCH_PRICE_FACTOR
+
+    turns = [(CONSIDERATIONS, "c_prompt"), (POLICIES, "p_prompt")]
+    if job["reason"]:
+        turns.append((REASONS, None))
+
+    # conversation state of each completion, by cuid
+    completions = {c["cuid"]: c for c in job["completions"]}
+    messages = {cuid: [] for cuid in completions}
+    responses = {cuid: {} for cuid in completions}
+    tokens = {cuid: [0, 0] for cuid in completions}
+    cache_tokens = {cuid: [0, 0] for cuid in completions}  # reads, writes
+    dates = {cuid: get_utc_time() for cuid in completions}
+    errors = {}
+
+    checks = {cuid: get_check(job, c) for cuid, c in completions.items()}
+
+    for num_requests, (data_type, prompt_key) in enumerate(turns, start=1):
+
+        print(f"\nTurn: {data_type}")
+
+        # only valid conversations without errors move on to the next turn
+        active = [cuid for cuid in completions if cuid not in errors]
+        if not active:
+            break
+
+        # a budget stops the next batch, its completions are skipped
+        try:
+            job["ledger"].check(model)
+        except BudgetExceededError as e:
+            for cuid in active:
+                errors[cuid] = e
+            break
+
+        for cuid in active:
+            prompt = completions[cuid][prompt_key] if prompt_key else PROMPT_R
+            messages[cuid].append({"role": "user", "content": prompt})
+
+        results = run_batch(
+            batch_provider,
+            model,
+            {cuid: messages[cuid] for cuid in active},
+            temperature,
+            system_prompt,
+            poll,
+        )
+
+        for cuid in active:
+
+            if cuid not in results:
+                errors[cuid] = RuntimeError(f"{data_type} request failed in batch")
+                continue
+
+            (
+                response,
+                input_tokens,
+                output_tokens,
+                model_version,
+                cached_tokens,
+                cache_write_tokens,
+            ) = results[cuid]
+
+            # log request history to file
+            log_request(
+                cuid,
+                dates[cuid],
+                job["provider"],
+                model,
+                temperature,
+                system_prompt,
+                completions[cuid]["survey"],
+                data_type,
+                messages[cuid][-1]["content"],
+                response,
+                input_tokens,
+                output_tokens,
+                model_version,
+                cached_tokens,
+                job["store"],
+            )
+
+            messages[cuid].append({"role": "assistant", "content": response})
+            responses[cuid][data_type] = response
+            tokens[cuid][0] += input_tokens
+            tokens[cuid][1] += output_tokens
+            cache_tokens[cuid][0] += cached_tokens
+            cache_tokens[cuid][1] += cache_write_tokens
+            job["ledger"].record(
+                model,
+                input_tokens,
+                output_tokens,
+                BATCH_PRICE_FACTOR,
+                cached_tokens,
+                cache_write_tokens,
+            )
+
+            # invalid conversations drop out before the next batch
+            error = checks[cuid](data_type, response)
+            if error is not None:
+                errors[cuid] = InvalidTurnError(data_type, error, num_requests)
+
+    it_elapsed_time = round(time.time() - job["start_time"], 2)
+
+    print()
+    for cuid, completion in completions.items():
+
+        if cuid in errors:
+            handle_result(job, completion, None, errors[cuid], it_elapsed_time)
+            continue
+
+        if job["reason"]:
+            reason_text = parse_reasoning_from_response(responses[cuid][REASONS])
+        else:
+            reason_text = "Reasoning was not requested."
+
+        # parse ranks from response
+        c_ranks = parse_numbers_from_response(responses[cuid][CONSIDERATIONS])
+        p_ranks = parse_numbers_from_response(responses[cuid][POLICIES])
+
+        # set meta columns
+        meta = [dates[cuid], job["provider"], model, temperature] + tokens[cuid]
+
+        handle_result(
+            job,
+            completion,
+            (p_ranks, c_ranks, reason_text, meta, 0, cache_tokens[cuid]),
+            None,
+            it_elapsed_time,
+        )
+
+    job["end_time"] = time.time()
+
+
+def generate_data_batch(
+    model,
+    iterations,
+    temperature=0,
+    only_survey=None,
+    prompt_uid=None,
+    poll=POLL_INTERVAL,
+    budget=None,
+    daily_budget=None,
+):
+
+    job = prepare_job(
+        model,
+        iterations,
+        temperature,
+        only_survey,
+        prompt_uid,
+        ledger=cost_ledger.open_session(budget, daily_budget),
+        # the live probe needs the chat endpoint, batch APIs only have the
+        # batch endpoint
+        preflight=False,
+    )
+    if job is None:
+        return
+
+    # fail before any request is made
+    get_batch_provider(job["api"])
+
+    run_batch_job(job, poll)
+
+    report_job(job)
+
+    # audio notification
+    os.system('say "done"')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generates data through the provider's batch API."
+    )
+
+    # Define expected command-line arguments
+    parser.add_argument("model", type=str, help="model name")
+    parser.add_argument("iterations", type=int, help="number of iterations")
+    parser.add_argument(
+        "--temp", type=float, required=False, default=0, help="temperature"
+    )
+    parser.add_argument(
+        "--survey",
+        type=str,
+        required=False,
+        default=None,
+        help="single survey to generate data for",
+    )
+    parser.add_argument(
+        "--prompt",
+        type=str,
+        required=False,
+        default=None,
+        help="the unique identifier of a system prompt to use for the generation",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        required=False,
+        default=POLL_INTERVAL,
+        help="seconds between batch status checks",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        required=False,
+        default=None,
+        help="max cost of this run in USD, no new batches are sent once reached",
+    )
+    parser.add_argument(
+        "--daily-budget",
+        type=float,
+        required=False,
+        default=None,
+        help="max cost of all runs today (UTC) in USD, across processes",
+    )
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    generate_data_batch(
+        args.model,
+        args.iterations,
+        args.temp,
+        args.survey,
+        args.prompt,
+        args.poll,
+        args.budget,
+        args.daily_budget,
+    )
+
+
+if __name__ == "__main__":
+    main()
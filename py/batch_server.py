@@ -0,0 +1,420 @@
+import argparse
+import email.parser
+import email.policy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI Batch and Anthropic Message Batches APIs,
+# to test batch mode offline. Responses follow the data generation prompts:
+# valid ratings for considerations, a permutation for policies and a short
+# reason otherwise.
+#
+# Usage:
+#   python py/batch_server.py --port 8765
+#   OPENAI_BASE_URL=http://localhost:8765/v1 \
+#   ANTHROPIC_BASE_URL=http://localhost:8765 \
+#   python py/batch.py gpt-4o-mini 5 --poll 1
+
+DEFAULT_PORT = 8765
+
+# seconds before a batch is reported as done
+DEFAULT_DELAY = 2
+
+C_PATTERN = r"Rate each of the (\d+) \[Considerations\] below from 1 to (\d+)"
+P_PATTERN = r"rank the (\d+) \[Policies\]"
+
+
+def fake_response(prompt):
+
+    # same prompt, same response
+    rng = random.Random(prompt)
+
+    match = re.search(C_PATTERN, prompt)
+    if match:
+        n, likert = int(match[1]), int(match[2])
+        ranks = [rng.randint(1, likert) for _ in range(n)]
+        return "\n".join([f"{i+1}. {r}" for i, r in enumerate(ranks)])
+
+    match = re.search(P_PATTERN, prompt)
+    if match:
+        ranks = list(range(1, int(match[1]) + 1))
+        rng.shuffle(ranks)
+        return "\n".join([f"{i+1}. {r}" for i, r in enumerate(ranks)])
+
+    return "These ratings were generated by the local batch server."
+
+
+def get_last_prompt(messages):
+
+    content = [m for m in messages if m["role"] == "user"][-1]["content"]
+
+    # anthropic content blocks
+    if isinstance(content, list):
+        content = "".join([block.get("text", "") for block in content])
+
+    return content
+
+
+def count_tokens(text):
+    return len(text) // 4
+
+
+class BatchStore:
+
+    def __init__(self, delay=DEFAULT_DELAY):
+        self.delay = delay
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def add_file(self, content, filename="batch.jsonl", purpose="batch"):
+
+        file_id = f"file-{uuid.uuid4().hex}"
+
+        with self.lock:
+            self.files[file_id] = {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": filename,
+                "purpose": purpose,
+                "status": "processed",
+                "content": content,
+            }
+
+        return self.files[file_id]
+
+    def is_done(self, batch):
+        return time.time() - batch["submitted_at"] >= self.delay
+
+
+def openai_completion(body):
+
+    prompt = get_last_prompt(body["messages"])
+    response = fake_response(prompt)
+
+    prompt_tokens = count_tokens(json.dumps(body["messages"]))
+    completion_tokens = count_tokens(response)
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": response},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def anthropic_message(params):
+
+    prompt = get_last_prompt(params["messages"])
+    response = fake_response(prompt)
+
+    content = [{"type": "text", "text": response}]
+    if "thinking" in params:
+        content = [
+            {"type": "thinking", "thinking": "Local batch server.", "signature": ""}
+        ] + content
+
+    return {
+        "id": f"msg_{uuid.uuid4().hex}",
+        "type": "message",
+        "role": "assistant",
+        "model": params["model"],
+        "content": content,
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": count_tokens(json.dumps(params["messages"])),
+            "output_tokens": count_tokens(response),
+        },
+    }
+
+
+class BatchHandler(BaseHTTPRequestHandler):
+
+    store = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_text(self, text, content_type="application/jsonl"):
+        body = text.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def not_found(self):
+        self.send_json({"error": {"message": f"Not found: {self.path}"}}, 404)
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def get_base_url(self):
+        return f"http://{self.headers['Host']}"
+
+    def do_POST(self):
+
+        path = self.path.split("?")[0]
+
+        if path == "/v1/files":
+            return self.create_file()
+        if path == "/v1/batches":
+            return self.create_openai_batch()
+        if path == "/v1/messages/batches":
+            return self.create_anthropic_batch()
+
+        self.not_found()
+
+    def do_GET(self):
+
+        path = self.path.split("?")[0]
+
+        match = re.fullmatch(r"/v1/files/([^/]+)/content", path)
+        if match:
+            return self.get_file_content(match[1])
+
+        match = re.fullmatch(r"/v1/batches/([^/]+)", path)
+        if match:
+            return self.get_openai_batch(match[1])
+
+        match = re.fullmatch(r"/v1/messages/batches/([^/]+)", path)
+        if match:
+            return self.get_anthropic_batch(match[1])
+
+        match = re.fullmatch(r"/v1/messages/batches/([^/]+)/results", path)
+        if match:
+            return self.get_anthropic_results(match[1])
+
+        self.not_found()
+
+    ## OpenAI
+    def create_file(self):
+
+        # parse multipart form data
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            header + self.read_body()
+        )
+
+        content, filename, purpose = b"", "batch.jsonl", "batch"
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name == "file":
+                content = part.get_payload(decode=True)
+                filename = part.get_filename() or filename
+            elif name == "purpose":
+                purpose = part.get_payload(decode=True).decode("utf-8")
+
+        file = self.store.add_file(content, filename, purpose)
+        self.send_json({k: v for k, v in file.items() if k != "content"})
+
+    def get_file_content(self, file_id):
+
+        if file_id not in self.store.files:
+            return self.not_found()
+
+        self.send_text(self.store.files[file_id]["content"].decode("utf-8"))
+
+    def create_openai_batch(self):
+
+        params = json.loads(self.read_body())
+        input_file = self.store.files.get(params["input_file_id"])
+        if input_file is None:
+            return self.not_found()
+
+        # responses are computed up front, and released after the delay
+        lines = []
+        for line in input_file["content"].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            lines.append(
+                json.dumps(
+                    {
+                        "id": f"batch_req_{uuid.uuid4().hex}",
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "request_id": uuid.uuid4().hex,
+                            "body": openai_completion(request["body"]),
+                        },
+                        "error": None,
+                    }
+                )
+            )
+
+        output_file = self.store.add_file("\n".join(lines).encode("utf-8"))
+
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        with self.store.lock:
+            self.store.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": params["endpoint"],
+                "input_file_id": params["input_file_id"],
+                "completion_window": params["completion_window"],
+                "created_at": int(time.time()),
+                "submitted_at": time.time(),
+                "output_file_id": output_file["id"],
+                "request_counts": {
+                    "total": len(lines),
+                    "completed": len(lines),
+                    "failed": 0,
+                },
+            }
+
+        self.get_openai_batch(batch_id)
+
+    def get_openai_batch(self, batch_id):
+
+        batch = self.store.batches.get(batch_id)
+        if batch is None:
+            return self.not_found()
+
+        done = self.store.is_done(batch)
+        data = {k: v for k, v in batch.items() if k != "submitted_at"}
+        data["status"] = "completed" if done else "in_progress"
+        data["output_file_id"] = batch["output_file_id"] if done else None
+        data["error_file_id"] = None
+        data["errors"] = None
+
+        self.send_json(data)
+
+    ## Anthropic
+    def create_anthropic_batch(self):
+
+        params = json.loads(self.read_body())
+
+        results = [
+            json.dumps(
+                {
+                    "custom_id": request["custom_id"],
+                    "result": {
+                        "type": "succeeded",
+                        "message": anthropic_message(request["params"]),
+                    },
+                }
+            )
+            for request in params["requests"]
+        ]
+
+        batch_id = f"msgbatch_{uuid.uuid4().hex}"
+        with self.store.lock:
+            self.store.batches[batch_id] = {
+                "id": batch_id,
+                "type": "message_batch",
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "submitted_at": time.time(),
+                "results": "\n".join(results),
+            }
+
+        self.get_anthropic_batch(batch_id)
+
+    def get_anthropic_batch(self, batch_id):
+
+        batch = self.store.batches.get(batch_id)
+        if batch is None:
+            return self.not_found()
+
+        done = self.store.is_done(batch)
+        num_requests = len(batch["results"].splitlines())
+
+        self.send_json(
+            {
+                "id": batch_id,
+                "type": "message_batch",
+                "processing_status": "ended" if done else "in_progress",
+                "request_counts": {
+                    "processing": 0 if done else num_requests,
+                    "succeeded": num_requests if done else 0,
+                    "errored": 0,
+                    "canceled": 0,
+                    "expired": 0,
+                },
+                "created_at": batch["created_at"],
+                "expires_at": batch["created_at"],
+                "ended_at": batch["created_at"] if done else None,
+                "archived_at": None,
+                "cancel_initiated_at": None,
+                "results_url": (
+                    f"{self.get_base_url()}/v1/messages/batches/{batch_id}/results"
+                    if done
+                    else None
+                ),
+            }
+        )
+
+    def get_anthropic_results(self, batch_id):
+
+        batch = self.store.batches.get(batch_id)
+        if batch is None or not self.store.is_done(batch):
+            return self.not_found()
+
+        self.send_text(batch["results"], "application/binary")
+
+
+def serve(port=DEFAULT_PORT, delay=DEFAULT_DELAY):
+
+    BatchHandler.store = BatchStore(delay)
+    server = ThreadingHTTPServer(("localhost", port), BatchHandler)
+
+    print(f"Batch server listening on http://localhost:{port} (delay: {delay}s)")
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the OpenAI and Anthropic batch APIs."
+    )
+    parser.add_argument(
+        "--port", type=int, required=False, default=DEFAULT_PORT, help="port"
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        required=False,
+        default=DEFAULT_DELAY,
+        help="seconds before a batch is reported as done",
+    )
+
+    args = parser.parse_args()
+
+    server = serve(args.port, args.delay)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
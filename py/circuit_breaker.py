@@ -0,0 +1,151 @@
+import threading
+import time
+
+from aimd import get_status
+from utils import get_api
+
+# circuit breaker per API. after FAILURE_THRESHOLD consecutive failed
+# requests the circuit opens and requests to that API wait, instead of
+# failing one by one, while other APIs keep running. once the backoff has
+# passed a single request goes through as a probe: if it succeeds the
+# circuit closes and the waiting requests are sent, if it fails the backoff
+# doubles. after MAX_PROBES failed probes the API is given up for the run
+# and its requests fail at once with CircuitOpenError.
+FAILURE_THRESHOLD = 5
+BASE_BACKOFF = 30  # seconds before the first probe
+MAX_BACKOFF = 10 * 60
+MAX_PROBES = 8
+
+# client errors caused by the request itself, not by the API being down
+REQUEST_ERRORS = [400, 413, 422]
+
+CLOSED = "closed"
+OPEN = "open"
+GIVEN_UP = "given up"
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to an API that was given up."""
+
+    def __init__(self, api, failures):
+        super().__init__(f"{api} is down, gave up after {failures} failed probes")
+        self.api = api
+
+
+def is_failure(error):
+    """True for errors that may mean the API is down or misconfigured."""
+
+    status = get_status(error)
+    return status not in REQUEST_ERRORS
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker of one API.
+
+    Args:
+      api: API name.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.condition = threading.Condition()
+
+        self.state = CLOSED
+        self.failures = 0  # consecutive failed requests
+        self.failed_probes = 0
+        self.probing = False
+        self.retry_at = 0
+
+        # run totals
+        self.opened = 0
+
+    def get_backoff(self):
+        return min(MAX_BACKOFF, BASE_BACKOFF * 2**self.failed_probes)
+
+    def acquire(self):
+        """Blocks while the circuit is open, the caller may be the probe."""
+
+        with self.condition:
+            while True:
+                if self.state == CLOSED:
+                    return
+                if self.state == GIVEN_UP:
+                    raise CircuitOpenError(self.api, self.failed_probes)
+
+                wait = self.retry_at - time.monotonic()
+                if not self.probing and wait <= 0:
+                    self.probing = True
+                    return
+
+                # wait for the probe's result, or for the next probe
+                self.condition.wait(None if self.probing else wait)
+
+    def on_success(self):
+
+        with self.condition:
+            self.failures = 0
+            if self.state != CLOSED:
+                print(f"Circuit closed for {self.api}, resuming requests.")
+                self.state = CLOSED
+                self.failed_probes = 0
+                self.probing = False
+                self.condition.notify_all()
+
+    def on_failure(self, error):
+
+        if not is_failure(error):
+            # the API answered, the request was wrong
+            self.on_success()
+            return
+
+        with self.condition:
+            self.failures += 1
+
+            if self.state == CLOSED:
+                if self.failures >= FAILURE_THRESHOLD:
+                    self.state = OPEN
+                    self.opened += 1
+                    self.retry_at = time.monotonic() + self.get_backoff()
+                    print(
+                        f"Circuit opened for {self.api} after {self.failures} "
+                        f"failed requests, probing again in {self.get_backoff()}s: {error}"
+                    )
+                return
+
+            if self.state == OPEN and self.probing:
+                self.probing = False
+                self.failed_probes += 1
+                if self.failed_probes >= MAX_PROBES:
+                    self.state = GIVEN_UP
+                    print(f"Circuit for {self.api} gave up: {error}")
+                else:
+                    self.retry_at = time.monotonic() + self.get_backoff()
+                    print(
+                        f"Probe of {self.api} failed, probing again in "
+                        f"{self.get_backoff()}s: {error}"
+                    )
+                self.condition.notify_all()
+
+
+def get_breaker(api):
+
+    with _breakers_lock:
+        if api not in _breakers:
+            _breakers[api] = CircuitBreaker(api)
+        return _breakers[api]
+
+
+def acquire(model):
+    get_breaker(get_api(model)).acquire()
+
+
+def report(model, error=None):
+    breaker = get_breaker(get_api(model))
+    if error is None:
+        breaker.on_success()
+    else:
+        breaker.on_failure(error)
@@ -0,0 +1,219 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+from utils import OUTPUT_DIR, get_cost, get_llm_info, get_model_info, get_utc_time
+
+# running cost of every request, priced with utils.LLM_INFO_PATH when its
+# usage is known. the ledger is shared by all processes, so budgets hold
+# across runs and restarts:
+# - run budget: cost of the current run (process).
+# - daily budget: cost of all runs today (UTC).
+# - provider budget: cost of a provider's runs today, from the optional
+#   PROVIDER_BUDGET_COLUMN in utils.LLM_INFO_PATH (the lowest value of the
+#   provider's models applies).
+# once a budget is reached no new requests are sent, requests in flight
+# still finish and are recorded.
+LEDGER_FILE = "cost_ledger.sqlite"
+PROVIDER_BUDGET_COLUMN = "max_daily_cost"
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+class BudgetExceededError(Exception):
+    """Raised instead of sending a request once a budget is reached."""
+
+    def __init__(self, scope, spent, budget):
+        super().__init__(
+            f"{scope} budget of US${budget:.2f} reached (US${spent:.2f} spent)"
+        )
+        self.scope = scope
+        self.spent = spent
+        self.budget = budget
+
+
+def get_day():
+    return get_utc_time().date().isoformat()
+
+
+class CostLedger:
+    """
+    SQLite ledger of request costs, shared by all threads of a run and by
+    concurrent runs on the same file.
+
+    Args:
+      path: SQLite file path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS costs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                day TEXT NOT NULL,
+                run TEXT NOT NULL,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                input_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                cost REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS costs_day ON costs (day, provider);
+            CREATE INDEX IF NOT EXISTS costs_run ON costs (run);
+            """
+        )
+        self.conn.commit()
+
+    def record(self, run, provider, model, input_tokens, output_tokens, cost):
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT INTO costs (created_at, day, run, provider, model,
+                    input_tokens, output_tokens, cost)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    time.time(),
+                    get_day(),
+                    run,
+                    provider,
+                    model,
+                    int(input_tokens),
+                    int(output_tokens),
+                    float(cost),
+                ),
+            )
+
+    def get_spent(self, day=None, provider=None, run=None):
+        """Returns the total cost, optionally of one day, provider or run."""
+
+        conditions = []
+        params = []
+        for column, value in [("day", day), ("provider", provider), ("run", run)]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self.lock:
+            return self.conn.execute(
+                f"SELECT COALESCE(SUM(cost), 0) FROM costs {where}", params
+            ).fetchone()[0]
+
+
+class LedgerSession:
+    """
+    A run's view of the shared ledger, with its budgets.
+
+    Args:
+      ledger: CostLedger.
+      run_budget: max cost of this run in USD, or None.
+      daily_budget: max cost of all runs today in USD, or None.
+    """
+
+    def __init__(self, ledger, run_budget=None, daily_budget=None):
+        self.ledger = ledger
+        self.run = uuid.uuid4().hex
+        self.run_budget = run_budget
+        self.daily_budget = daily_budget
+        self.spent = 0
+        self.lock = threading.Lock()
+
+    def record(
+        self,
+        model,
+        input_tokens,
+        output_tokens,
+        price_factor=1,
+        cached_tokens=0,
+        cache_write_tokens=0,
+    ):
+        """
+        Adds the cost of one request, e.g. price_factor 0.5 for batches.
+        Prompt cache reads and writes are priced apart, see utils.get_cost.
+        """
+
+        if not input_tokens and not output_tokens:
+            return
+
+        cost_input, cost_output = get_cost(
+            model, input_tokens, output_tokens, cached_tokens, cache_write_tokens
+        )
+        cost = (cost_input + cost_output) * price_factor
+
+        with self.lock:
+            self.spent += cost
+
+        self.ledger.record(
+            self.run,
+            get_model_info(model)["provider"],
+            model,
+            input_tokens,
+            output_tokens,
+            cost,
+        )
+
+    def check(self, model):
+        """Raises BudgetExceededError if a request for model may not be sent."""
+
+        if self.run_budget is not None and self.spent >= self.run_budget:
+            raise BudgetExceededError("Run", self.spent, self.run_budget)
+
+        day = get_day()
+
+        if self.daily_budget is not None:
+            spent = self.ledger.get_spent(day=day)
+            if spent >= self.daily_budget:
+                raise BudgetExceededError("Daily", spent, self.daily_budget)
+
+        provider = get_model_info(model)["provider"]
+        provider_budget = get_provider_budget(provider)
+        if provider_budget is not None:
+            spent = self.ledger.get_spent(day=day, provider=provider)
+            if spent >= provider_budget:
+                raise BudgetExceededError(
+                    f"{provider} daily", spent, provider_budget
+                )
+
+
+def get_provider_budget(provider):
+
+    df = pd.DataFrame(get_llm_info().get_all("provider", provider))
+    if PROVIDER_BUDGET_COLUMN not in df.columns:
+        return None
+
+    values = df[PROVIDER_BUDGET_COLUMN].dropna()
+    if values.empty:
+        return None
+
+    return float(values.min())
+
+
+def get_ledger(path=None):
+
+    path = path if path else os.path.join(OUTPUT_DIR, LEDGER_FILE)
+
+    with _ledgers_lock:
+        if path not in _ledgers:
+            _ledgers[path] = CostLedger(path)
+        return _ledgers[path]
+
+
+def open_session(run_budget=None, daily_budget=None, path=None):
+    return LedgerSession(get_ledger(path), run_budget, daily_budget)
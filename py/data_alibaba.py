@@ -1,221 +1,79 @@
 import os
+from types import SimpleNamespace
 from openai import OpenAI
 
-from utils import (
-    CONSIDERATIONS,
-    POLICIES,
-    PROMPT_R,
-    REASONS,
-    get_utc_time,
-    log_request,
-    parse_numbers_from_response,
-    parse_reasoning_from_response,
-    get_provider,
-)
-
-# define openai client to access API
-client = OpenAI(
-    api_key=os.environ["DASHSCOPE_API_KEY"],
-    base_url="https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
-)
-
-
-def send_message(model, messages, temperature, qwq):
-
-    if qwq:
-        res = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            stream=True,
-            stream_options={"include_usage": True},
-        )
-    else:
-        res = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-        )
-    return res
+from data_llm import ChatCompletionsGenerator
+
+
+def is_qwq(model):
+    # QwQ model only supports streaming output calls
+    return model == "qwq-plus"
 
 
-def parse_response(res, qwq):
+def parse_stream(res):
 
     reasoning_content = ""  # Define complete thinking process
     answer_content = ""  # Define complete response
-    is_answering = (
-        False  # Determine if thinking process has ended and response has begun
-    )
-
-    if qwq:
-        # print("\n" + "=" * 20 + "Reasoning Process" + "=" * 20 + "\n")
-        for chunk in res:
-            # If chunk.choices is empty, print usage
-            if not chunk.choices:
-                usage = chunk.usage
+    usage = None
+
+    for chunk in res:
+        # If chunk.choices is empty, it holds the usage
+        if not chunk.choices:
+            usage = chunk.usage
+        else:
+            delta = chunk.choices[0].delta
+            if hasattr(delta, "reasoning_content") and delta.reasoning_content != None:
+                reasoning_content += delta.reasoning_content
             else:
-                delta = chunk.choices[0].delta
-                # Print thinking process
-                # print(hasattr(delta, "reasoning_content"))
-                # print(delta)
-                # print(delta.reasoning_content != None)
-                if (
-                    hasattr(delta, "reasoning_content")
-                    and delta.reasoning_content != None
-                ):
-                    # print(delta.reasoning_content, end="", flush=True)
-                    reasoning_content += delta.reasoning_content
-                else:
-                    # Start response
-                    if delta.content != "" and is_answering is False:
-                        # print("\n" + "=" * 20 + "Complete Response" + "=" * 20 + "\n")
-                        is_answering = True
-                    # Print response process
-                    # print(delta.content, end="", flush=True)
-                    answer_content += delta.content
-
-        # format reasoning like deepseek
-        reasoning_content = f"<think>{reasoning_content}</think>"
-
-        return usage, f"{reasoning_content}\n{answer_content}"
-
-    else:
-        return res.usage, res.choices[0].message.content
-
-
-def generate_data(
-    mp,
-    p_prompt,
-    c_prompt,
-    cuid,
-    model="qwen-plus",
-    temperature=0,
-    reason=False,
-):
-
-    # get current time
-    date = get_utc_time()
-
-    # get provider
-    provider = get_provider(model)
+                answer_content += delta.content
 
-    # QwQ model only supports streaming output calls
-    if model == "qwq-plus":
-        qwq = True
-    else:
-        qwq = False
-
-    # build initial message
-    messages = [
-        {"role": "user", "content": c_prompt},
-    ]
-
-    # send first message
-    res = send_message(model, messages, temperature, qwq)
-
-    usage, c_response = parse_response(res, qwq)
-
-    # get cost
-    input_tokens = usage.prompt_tokens
-    output_tokens = usage.completion_tokens
-
-    # log request history to file
-    log_request(
-        cuid,
-        date,
-        provider,
-        model,
-        temperature,
-        mp,
-        CONSIDERATIONS,
-        c_prompt,
-        c_response,
-        usage.prompt_tokens,
-        usage.completion_tokens,
-        model,
-    )
+    # format reasoning like deepseek
+    reasoning_content = f"<think>{reasoning_content}</think>"
 
-    # append response to messages
-    messages.append(
-        {"role": "assistant", "content": c_response},
+    return SimpleNamespace(
+        usage=usage, text=f"{reasoning_content}\n{answer_content}"
     )
 
-    # append policies prompt
-    messages.append(
-        {"role": "user", "content": p_prompt},
-    )
 
-    # get p prompt response
-    res = send_message(model, messages, temperature, qwq)
-
-    usage, p_response = parse_response(res, qwq)
-
-    # get cost
-    input_tokens += usage.prompt_tokens
-    output_tokens += usage.completion_tokens
-
-    # log request history to file
-    log_request(
-        cuid,
-        date,
-        provider,
-        model,
-        temperature,
-        mp,
-        POLICIES,
-        p_prompt,
-        p_response,
-        usage.prompt_tokens,
-        usage.completion_tokens,
-        model,
-    )
+class AlibabaGenerator(ChatCompletionsGenerator):
 
-    if reason:
+    DEFAULT_MODEL = "qwen-plus"
 
-        # append response to messages
-        messages.append(
-            {"role": "assistant", "content": p_response},
+    def create_client(self):
+        # define openai client to access API
+        return OpenAI(
+            api_key=os.environ["DASHSCOPE_API_KEY"],
+            base_url="https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
         )
 
-        # append reasoning prompt
-        messages.append(
-            {"role": "user", "content": PROMPT_R},
-        )
+    def get_params(self, model, messages, temperature, system_prompt=None):
 
-        res = send_message(model, messages, temperature, qwq)
-
-        usage, r_response = parse_response(res, qwq)
-
-        reason_text = parse_reasoning_from_response(r_response)
-
-        # get cost
-        input_tokens += usage.prompt_tokens
-        output_tokens += usage.completion_tokens
-
-        # log request history to file
-        log_request(
-            cuid,
-            date,
-            provider,
-            model,
-            temperature,
-            mp,
-            REASONS,
-            PROMPT_R,
-            r_response,
-            usage.prompt_tokens,
-            usage.completion_tokens,
-            model,
-        )
+        params = super().get_params(model, messages, temperature, system_prompt)
+
+        if is_qwq(model):
+            params["stream"] = True
+            params["stream_options"] = {"include_usage": True}
+
+        return params
+
+    def send(self, model, messages, temperature, system_prompt=None):
+
+        res = super().send(model, messages, temperature, system_prompt)
+
+        # drain the stream so the response reads like a regular one
+        if is_qwq(model):
+            return parse_stream(res)
+
+        return res
 
-    else:
-        reason_text = "Reasoning was not requested."
+    def get_text(self, model, res):
+        if is_qwq(model):
+            return res.text
+        return res.choices[0].message.content
 
-    # parse ranks from response
-    c_ranks = parse_numbers_from_response(c_response)
-    p_ranks = parse_numbers_from_response(p_response)
+    def get_model_version(self, model, res):
+        return model
 
-    # set meta columns
-    meta = [date, provider, model, temperature, input_tokens, output_tokens]
 
-    return p_ranks, c_ranks, reason_text, meta
+generator = AlibabaGenerator()
+generate_data = generator.generate_data
@@ -2,21 +2,8 @@ import os
 import re
 import anthropic
 
-from utils import (
-    CONSIDERATIONS,
-    POLICIES,
-    PROMPT_R,
-    REASONS,
-    get_utc_time,
-    log_request,
-    parse_numbers_from_response,
-    parse_reasoning_from_response,
-    get_provider,
-)
-
-client = anthropic.Anthropic(
-    api_key=os.environ.get("ANTHROPIC_API_KEY"),
-)
+from data_llm import DataGenerator
+from utils import split_prompt
 
 # should be enough for data generation
 MAX_TOKENS = 1024
@@ -42,207 +29,190 @@ REASONING_BUDGET = {"low": 1024, "high": 16000}
 # See https://github.com/anthropics/anthropic-sdk-python#long-requests for more details
 
 
-def send_message(model, messages, temperature, system_prompt=None):
+# prompt caching: https://docs.anthropic.com/en/docs/build-with-claude/prompt-caching
+# prompts shorter than the model's minimum cacheable length are not cached
+CACHE_CONTROL = {"type": "ephemeral"}
 
-    if is_reasoning(model):
 
-        # get model and reasoning effort
-        model, reasoning_effort = model.split("-think=")
-
-        return client.messages.create(
-            model=model,
-            system=system_prompt,
-            max_tokens=MAX_TOKENS
-            + REASONING_BUDGET[
-                reasoning_effort
-            ],  # set to MAX_TOKENS + REASONING_BUDGET to allow for response + reasoning
-            thinking={
-                "type": "enabled",
-                "budget_tokens": REASONING_BUDGET[reasoning_effort],
-            },
-            # temperature=temperature, # no temperature parameter for reasoning
-            messages=messages,
-        )
+def get_cached_system(system_prompt):
 
     if system_prompt is None:
-        return client.messages.create(
-            model=model,
-            max_tokens=MAX_TOKENS,
-            temperature=temperature,
-            messages=messages,
-        )
+        return None
+
+    return [{"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL}]
 
-    return client.messages.create(
-        model=model,
-        system=system_prompt,
-        max_tokens=MAX_TOKENS,
-        temperature=temperature,
-        messages=messages,
-    )
 
+def get_cached_messages(messages):
+    """
+    Adds cache breakpoints after the first prompt's instructions, which are
+    shared by every iteration of a survey, and at the end of the conversation,
+    so each turn reads the previous turns from cache.
+    """
 
-def get_response(model, res):
-    if is_reasoning(model):
+    cached = [dict(message) for message in messages]
 
-        for content_block in res.content:
-            if content_block.type == "thinking":
-                reasoning_content = content_block.thinking
-            elif content_block.type == "text":
-                response_content = content_block.text
+    # first prompt: instructions (cached) + shuffled statements
+    instructions, statements = split_prompt(cached[0]["content"])
+    blocks = [{"type": "text", "text": instructions, "cache_control": CACHE_CONTROL}]
+    if statements:
+        blocks.append({"type": "text", "text": statements})
+    cached[0]["content"] = blocks
 
-        # format response like DeepSeek
-        return f"<think>{reasoning_content}</think>{response_content}"
+    # last prompt
+    if len(cached) > 1:
+        cached[-1]["content"] = [{"type": "text", "text": cached[-1]["content"]}]
+    cached[-1]["content"][-1]["cache_control"] = CACHE_CONTROL
 
-    return res.content[0].text
+    return cached
 
 
 ## API: https://docs.anthropic.com/en/api/messages
-def generate_data(
-    mp,
-    p_prompt,
-    c_prompt,
-    cuid,
-    system_prompt=None,
-    model="claude-3-haiku-20240307",
-    temperature=0,
-    reason=False,
-):
-
-    # get current time
-    date = get_utc_time()
-
-    # get provider
-    provider = get_provider(model)
-
-    # build initial message
-    messages = [
-        {"role": "user", "content": c_prompt},
-    ]
-
-    # send first message
-    res = send_message(
-        model,
-        messages,
-        temperature,
-        system_prompt,
-    )
+class AnthropicGenerator(DataGenerator):
 
-    c_response = get_response(model, res)
-
-    # get cost
-    input_tokens = res.usage.input_tokens
-    output_tokens = res.usage.output_tokens
-
-    # log request history to file
-    log_request(
-        cuid,
-        date,
-        provider,
-        model,
-        temperature,
-        system_prompt,
-        mp,
-        CONSIDERATIONS,
-        c_prompt,
-        c_response,
-        res.usage.input_tokens,
-        res.usage.output_tokens,
-        res.model,
-    )
+    DEFAULT_MODEL = "claude-3-haiku-20240307"
 
-    # append response to messages
-    messages.append(
-        {"role": "assistant", "content": c_response},
-    )
+    def create_client(self):
+        return anthropic.Anthropic(
+            api_key=os.environ.get("ANTHROPIC_API_KEY"),
+        )
 
-    # append policies prompt
-    messages.append(
-        {"role": "user", "content": p_prompt},
-    )
+    def get_params(self, model, messages, temperature, system_prompt=None):
 
-    # get p prompt response
-    res = send_message(
-        model,
-        messages,
-        temperature,
-        system_prompt,
-    )
+        system_prompt = get_cached_system(system_prompt)
+        messages = get_cached_messages(messages)
 
-    p_response = get_response(model, res)
-
-    # get cost
-    input_tokens += res.usage.input_tokens
-    output_tokens += res.usage.output_tokens
-
-    # log request history to file
-    log_request(
-        cuid,
-        date,
-        provider,
-        model,
-        temperature,
-        system_prompt,
-        mp,
-        POLICIES,
-        p_prompt,
-        p_response,
-        res.usage.input_tokens,
-        res.usage.output_tokens,
-        res.model,
-    )
+        if is_reasoning(model):
 
-    if reason:
+            # get model and reasoning effort
+            model, reasoning_effort = model.split("-think=")
 
-        # append response to messages
-        messages.append(
-            {"role": "assistant", "content": p_response},
-        )
+            return {
+                "model": model,
+                "system": system_prompt,
+                # set to MAX_TOKENS + REASONING_BUDGET to allow for response + reasoning
+                "max_tokens": MAX_TOKENS + REASONING_BUDGET[reasoning_effort],
+                "thinking": {
+                    "type": "enabled",
+                    "budget_tokens": REASONING_BUDGET[reasoning_effort],
+                },
+                # "temperature": temperature, # no temperature parameter for reasoning
+                "messages": messages,
+            }
 
-        # append reasoning prompt
-        messages.append(
-            {"role": "user", "content": PROMPT_R},
-        )
+        params = {
+            "model": model,
+            "max_tokens": MAX_TOKENS,
+            "temperature": temperature,
+            "messages": messages,
+        }
+
+        if system_prompt is not None:
+            params["system"] = system_prompt
+
+        return params
 
-        res = send_message(
-            model,
-            messages,
-            temperature,
-            system_prompt,
+    def is_reasoning(self, model):
+        return is_reasoning(model)
+
+    def send(self, model, messages, temperature, system_prompt=None):
+        return self.client.messages.create(
+            **self.get_params(model, messages, temperature, system_prompt)
         )
 
-        r_response = get_response(model, res)
-
-        reason_text = parse_reasoning_from_response(r_response)
-
-        # get cost
-        input_tokens += res.usage.input_tokens
-        output_tokens += res.usage.output_tokens
-
-        # log request history to file
-        log_request(
-            cuid,
-            date,
-            provider,
-            model,
-            temperature,
-            system_prompt,
-            mp,
-            REASONS,
-            PROMPT_R,
-            r_response,
-            res.usage.input_tokens,
-            res.usage.output_tokens,
-            res.model,
+    def get_text(self, model, res):
+        if is_reasoning(model):
+
+            for content_block in res.content:
+                if content_block.type == "thinking":
+                    reasoning_content = content_block.thinking
+                elif content_block.type == "text":
+                    response_content = content_block.text
+
+            # format response like DeepSeek
+            return f"<think>{reasoning_content}</think>{response_content}"
+
+        return res.content[0].text
+
+    def get_usage(self, model, res):
+
+        # cached prompt tokens are reported apart from input_tokens, add them
+        # back so input_tokens is the full prompt size, like other providers.
+        # cache reads and writes are priced apart, see utils.get_cost
+        cached_tokens = res.usage.cache_read_input_tokens or 0
+        input_tokens = (
+            res.usage.input_tokens
+            + cached_tokens
+            + self.get_cache_write_tokens(model, res)
         )
 
-    else:
-        reason_text = "Reasoning was not requested."
+        return input_tokens, res.usage.output_tokens, cached_tokens
+
+    def get_cache_write_tokens(self, model, res):
+        return res.usage.cache_creation_input_tokens or 0
+
+    def get_model_version(self, model, res):
+        return res.model
+
+
+generator = AnthropicGenerator()
+generate_data = generator.generate_data
 
-    # parse ranks from response
-    c_ranks = parse_numbers_from_response(c_response)
-    p_ranks = parse_numbers_from_response(p_response)
 
-    # set meta columns
-    meta = [date, provider, model, temperature, input_tokens, output_tokens]
+## Message Batches API: https://docs.anthropic.com/en/docs/build-with-claude/batch-processing
+def submit_batch(model, conversations, temperature, system_prompt=None):
+    """
+    Submits one request per conversation to the Message Batches API.
+
+    Args:
+      conversations: dict of custom_id -> list of user/assistant messages.
+
+    Returns:
+      The batch id.
+    """
+
+    batch = generator.client.messages.batches.create(
+        requests=[
+            {
+                "custom_id": custom_id,
+                "params": generator.get_params(
+                    model, messages, temperature, system_prompt
+                ),
+            }
+            for custom_id, messages in conversations.items()
+        ]
+    )
+
+    return batch.id
+
+
+def is_batch_done(batch_id):
+    batch = generator.client.messages.batches.retrieve(batch_id)
+    return batch.processing_status == "ended"
+
+
+def get_batch_results(model, batch_id):
+    """
+    Returns a dict of custom_id -> (response, input_tokens, output_tokens,
+    model_version, cached_tokens, cache_write_tokens). Requests that errored
+    or expired are left out.
+    """
+
+    results = {}
+
+    for row in generator.client.messages.batches.results(batch_id):
+
+        if row.result.type != "succeeded":
+            continue
+
+        res = row.result.message
+        input_tokens, output_tokens, cached_tokens = generator.get_usage(model, res)
+        results[row.custom_id] = (
+            generator.get_text(model, res),
+            input_tokens,
+            output_tokens,
+            res.model,
+            cached_tokens,
+            generator.get_cache_write_tokens(model, res),
+        )
 
-    return p_ranks, c_ranks, reason_text, meta
+    return results
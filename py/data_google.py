@@ -1,142 +1,55 @@
-from datetime import datetime, timezone
 from google import genai
 from google.genai import types
 import os
 
-from utils import (
-    CONSIDERATIONS,
-    POLICIES,
-    PROMPT_R,
-    REASONS,
-    log_request,
-    parse_numbers_from_response,
-    parse_reasoning_from_response,
-    get_provider,
-)
+from data_llm import DataGenerator
 
-client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
 
+def get_contents(messages):
+    # gemini calls the assistant role "model"
+    return [
+        {
+            "role": "model" if message["role"] == "assistant" else "user",
+            "parts": [{"text": message["content"]}],
+        }
+        for message in messages
+    ]
 
-def generate_data(
-    mp,
-    p_prompt,
-    c_prompt,
-    cuid,
-    system_prompt=None,
-    model="gemini-1.5-flash",
-    temperature=0,
-    reason=False,
-):
 
-    # get current time
-    date = datetime.now(timezone.utc)
+class GoogleGenerator(DataGenerator):
 
-    # get provider
-    provider = get_provider(model)
+    DEFAULT_MODEL = "gemini-1.5-flash"
 
-    # start chat
-    # set temperature and system prompt in runtime
-    if system_prompt is None:
-        chat = client.chats.create(
-            model=model, config=types.GenerateContentConfig(temperature=temperature)
-        )
-    else:
-        chat = client.chats.create(
-            model=model,
-            config=types.GenerateContentConfig(
-                temperature=temperature, system_instruction=system_prompt
-            ),
-        )
-
-    # send first message
-    res = chat.send_message(c_prompt)
-    c_response = res.text
-    # print(res.usage_metadata)
-
-    # get cost
-    input_tokens = res.usage_metadata.prompt_token_count
-    output_tokens = res.usage_metadata.candidates_token_count
-
-    # log request history to file
-    log_request(
-        cuid,
-        date,
-        provider,
-        model,
-        temperature,
-        system_prompt,
-        mp,
-        CONSIDERATIONS,
-        c_prompt,
-        c_response,
-        res.usage_metadata.prompt_token_count,
-        res.usage_metadata.candidates_token_count,
-        res.model_version,
-    )
+    def create_client(self):
+        return genai.Client(api_key=os.environ["GEMINI_API_KEY"])
 
-    # get p prompt response
-    res = chat.send_message(p_prompt)
-    p_response = res.text
-    # print(res.usage_metadata)
+    def send(self, model, messages, temperature, system_prompt=None):
 
-    # get cost
-    input_tokens += res.usage_metadata.prompt_token_count
-    output_tokens += res.usage_metadata.candidates_token_count
-
-    # log request history to file
-    log_request(
-        cuid,
-        date,
-        provider,
-        model,
-        temperature,
-        system_prompt,
-        mp,
-        POLICIES,
-        p_prompt,
-        p_response,
-        res.usage_metadata.prompt_token_count,
-        res.usage_metadata.candidates_token_count,
-        res.model_version,
-    )
-
-    if reason:
-
-        res = chat.send_message(PROMPT_R)
-        r_response = res.text
-        # print(res.usage_metadata)
+        # set temperature and system prompt in runtime
+        if system_prompt is None:
+            config = types.GenerateContentConfig(temperature=temperature)
+        else:
+            config = types.GenerateContentConfig(
+                temperature=temperature, system_instruction=system_prompt
+            )
 
-        # get cost
-        input_tokens += res.usage_metadata.prompt_token_count
-        output_tokens += res.usage_metadata.candidates_token_count
+        return self.client.models.generate_content(
+            model=model, contents=get_contents(messages), config=config
+        )
 
-        reason_text = parse_reasoning_from_response(r_response)
+    def get_text(self, model, res):
+        return res.text
 
-        # log request history to file
-        log_request(
-            cuid,
-            date,
-            provider,
-            model,
-            temperature,
-            system_prompt,
-            mp,
-            REASONS,
-            PROMPT_R,
-            r_response,
+    def get_usage(self, model, res):
+        return (
             res.usage_metadata.prompt_token_count,
             res.usage_metadata.candidates_token_count,
-            res.model_version,
+            res.usage_metadata.cached_content_token_count or 0,
         )
 
-    else:
-        reason_text = "Reasoning was not requested."
-
-    # parse ranks from response
-    c_ranks = parse_numbers_from_response(c_response)
-    p_ranks = parse_numbers_from_response(p_response)
+    def get_model_version(self, model, res):
+        return res.model_version
 
-    # set meta columns
-    meta = [date, provider, model, temperature, input_tokens, output_tokens]
 
-    return p_ranks, c_ranks, reason_text, meta
+generator = GoogleGenerator()
+generate_data = generator.generate_data
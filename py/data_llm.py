@@ -1,13 +1,413 @@
+import threading
+import time
 from abc import ABC, abstractmethod
 
+import aimd
+import circuit_breaker
+import deadlines
+import metrics
+import rate_limit
+import response_cache
+import tracing
+
+from utils import (
+    CONSIDERATIONS,
+    InvalidTurnError,
+    POLICIES,
+    PROMPT_R,
+    REASONS,
+    get_utc_time,
+    log_request,
+    parse_numbers_from_response,
+    parse_reasoning_from_response,
+    get_provider,
+)
+
+
+def get_outcome(error):
+    """Returns the metrics outcome of a failed request."""
+
+    if isinstance(error, TimeoutError):
+        return "timeout"
+    if aimd.is_throttled(error):
+        return "throttled"
+    return "error"
+
+
+# preflight request, as cheap as possible
+PROBE_MESSAGES = [{"role": "user", "content": "Reply with OK."}]
+
 
 class DataGenerator(ABC):
+    """
+    Provider adapter. Subclasses implement how a request is sent and how the
+    response text and token usage are read, generate_data() drives the
+    considerations -> policies -> reasons conversation for every provider.
+    """
 
-    @abstractmethod
-    def __init__(self, model):
+    DEFAULT_MODEL = None
+
+    def __init__(self, client=None):
         super().__init__()
-        self.model = model
+        self._client = client
+        self._client_lock = threading.Lock()
+
+    def create_client(self):
+        """Builds the API client, called on first use."""
+        return None
+
+    @property
+    def client(self):
+        # clients are built lazily, so importing an adapter is cheap and
+        # missing API keys only fail when the provider is used
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self.create_client()
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    @abstractmethod
+    def send(self, model, messages, temperature, system_prompt=None):
+        """Sends the conversation so far and returns the raw response."""
+        pass
+
+    @abstractmethod
+    def get_text(self, model, res):
+        """
+        Returns the response text. Reasoning content, if any, is wrapped in
+        <think></think> tags before the answer, like DeepSeek.
+        """
+        pass
 
     @abstractmethod
-    def generate_data(self):
+    def get_usage(self, model, res):
+        """
+        Returns (input_tokens, output_tokens, cached_tokens). input_tokens is
+        the full prompt size, cached_tokens the part read from the prompt cache.
+        """
         pass
+
+    def get_cache_write_tokens(self, model, res):
+        """Returns the prompt tokens written to the prompt cache."""
+        return 0
+
+    def get_model_version(self, model, res):
+        return model
+
+    def is_reasoning(self, model):
+        """True for models that think before answering, never hedged."""
+        return False
+
+    def probe(self, model):
+        """
+        Sends one tiny request, so missing credentials or an unknown model
+        fail before a run starts. Raises the API's error.
+        """
+
+        estimate = rate_limit.acquire(model, PROBE_MESSAGES)
+        res = self.send(model, PROBE_MESSAGES, 0)
+        input_tokens, output_tokens, _ = self.get_usage(model, res)
+        rate_limit.settle(model, estimate, input_tokens + output_tokens)
+
+        return self.get_text(model, res)
+
+    def send_turn(
+        self,
+        model,
+        messages,
+        temperature,
+        system_prompt=None,
+        cache=None,
+        ledger=None,
+        data_type=None,
+        hedge=False,
+    ):
+        """
+        Sends one turn through the API's rate limiter. With a response cache
+        session, deterministic requests are answered from the cache when
+        possible; cache hits cost nothing, so their token counts are 0. With
+        a cost ledger session, the turn is not sent once a budget is reached
+        (cost_ledger.BudgetExceededError) and its cost is recorded. Turns wait
+        while the API's circuit breaker is open, and fail once they run past
+        the deadline of their data_type; with hedge=True a slow turn is sent
+        twice and the first reply is used, see deadlines.py.
+
+        Returns:
+          A tuple of (response, input_tokens, output_tokens, cached_tokens,
+          cache_write_tokens, model_version).
+        """
+
+        key = None
+        if cache is not None and response_cache.is_cacheable(temperature):
+            with tracing.span("cache"):
+                key = response_cache.get_key(
+                    model, messages, temperature, system_prompt
+                )
+                value = cache.get(key)
+            if value is not None:
+                metrics.observe_request(model, data_type, "cached")
+                return value["response"], 0, 0, 0, 0, value["model_version"]
+
+        if ledger is not None:
+            ledger.check(model)
+
+        # wait while the API is down, then for rate limit budget
+        with tracing.span("circuit_wait"):
+            circuit_breaker.acquire(model)
+        with tracing.span("rate_limit_wait"):
+            estimate = rate_limit.acquire(model, messages, system_prompt)
+
+        # outcomes drive the API's adaptive concurrency
+        start_time = time.monotonic()
+        try:
+            with tracing.span("send", hedge=hedge):
+                res = deadlines.send(
+                    self,
+                    model,
+                    messages,
+                    temperature,
+                    system_prompt,
+                    data_type,
+                    hedge,
+                    ledger,
+                )
+        except Exception as e:
+            aimd.report(model, data_type, error=e)
+            circuit_breaker.report(model, e)
+            metrics.observe_request(model, data_type, get_outcome(e))
+            raise
+        latency = time.monotonic() - start_time
+        aimd.report(model, data_type, latency=latency)
+        circuit_breaker.report(model)
+
+        input_tokens, output_tokens, cached_tokens = self.get_usage(model, res)
+        cache_write_tokens = self.get_cache_write_tokens(model, res)
+        rate_limit.settle(model, estimate, input_tokens + output_tokens)
+
+        metrics.observe_request(
+            model, data_type, "success", latency, input_tokens, output_tokens
+        )
+
+        if ledger is not None:
+            ledger.record(
+                model,
+                input_tokens,
+                output_tokens,
+                cached_tokens=cached_tokens,
+                cache_write_tokens=cache_write_tokens,
+            )
+
+        response = self.get_text(model, res)
+        model_version = self.get_model_version(model, res)
+
+        if key is not None:
+            cache.put(key, {"response": response, "model_version": model_version})
+
+        return (
+            response,
+            input_tokens,
+            output_tokens,
+            cached_tokens,
+            cache_write_tokens,
+            model_version,
+        )
+
+    def generate_data(
+        self,
+        mp,
+        p_prompt,
+        c_prompt,
+        cuid,
+        system_prompt=None,
+        model=None,
+        temperature=0,
+        reason=False,
+        check=None,
+        repair=None,
+        max_repairs=0,
+        cache=None,
+        store=None,
+        ledger=None,
+        hedge=False,
+    ):
+        """
+        Runs the considerations -> policies (-> reasons) conversation.
+
+        Args:
+          check: optional function (data_type, response) -> error message or
+            None. When a turn fails the check, the conversation stops and
+            InvalidTurnError is raised, so later turns are not paid for.
+          repair: optional function (data_type, error) -> follow-up prompt
+            asking the model to fix an invalid response.
+          max_repairs: max repair turns per completion.
+          cache: optional response_cache.CacheSession.
+          store: optional results_store.ResultsStore for the request logs.
+          ledger: optional cost_ledger.LedgerSession.
+          hedge: send a duplicate of slow turns, see deadlines.py.
+
+        Returns:
+          A tuple of (p_ranks, c_ranks, reason_text, meta, repairs,
+          cache_tokens), cache_tokens being [cached_tokens, cache_write_tokens]
+          of all turns.
+        """
+
+        model = model if model else self.DEFAULT_MODEL
+
+        # get current time
+        date = get_utc_time()
+
+        # get provider
+        provider = get_provider(model)
+
+        turns = [(CONSIDERATIONS, c_prompt), (POLICIES, p_prompt)]
+        if reason:
+            turns.append((REASONS, PROMPT_R))
+
+        # system prompt is passed apart, each API sends it its own way
+        messages = []
+        responses = {}
+
+        input_tokens = 0
+        output_tokens = 0
+        cache_tokens = [0, 0]  # prompt cache reads and writes
+
+        num_requests = 0
+        repairs = 0
+
+        for data_type, prompt in turns:
+
+            while True:
+
+                # append prompt to messages
+                messages.append({"role": "user", "content": prompt})
+
+                with tracing.span("turn", turn=data_type, attempt=repairs):
+
+                    (
+                        response,
+                        r_input_tokens,
+                        r_output_tokens,
+                        r_cached_tokens,
+                        r_cache_write_tokens,
+                        version,
+                    ) = self.send_turn(
+                        model,
+                        messages,
+                        temperature,
+                        system_prompt,
+                        cache,
+                        ledger,
+                        data_type,
+                        hedge,
+                    )
+                    num_requests += 1
+
+                    # get cost
+                    input_tokens += r_input_tokens
+                    output_tokens += r_output_tokens
+                    cache_tokens[0] += r_cached_tokens
+                    cache_tokens[1] += r_cache_write_tokens
+
+                    # log request history to file
+                    with tracing.span("log_request"):
+                        log_request(
+                            cuid,
+                            date,
+                            provider,
+                            model,
+                            temperature,
+                            system_prompt,
+                            mp,
+                            data_type,
+                            prompt,
+                            response,
+                            r_input_tokens,
+                            r_output_tokens,
+                            version,
+                            r_cached_tokens,
+                            store,
+                        )
+
+                    # append response to messages
+                    messages.append({"role": "assistant", "content": response})
+
+                    with tracing.span("validate"):
+                        error = check(data_type, response) if check else None
+
+                if error is not None:
+                    metrics.observe_invalid(model, data_type, error)
+                if error is None or repair is None or repairs >= max_repairs:
+                    break
+
+                # tell the model what was wrong, the repaired response
+                # replaces the invalid one
+                repairs += 1
+                metrics.observe_repair(model, data_type)
+                prompt = repair(data_type, error)
+
+            responses[data_type] = response
+
+            # stop early if this turn already makes the completion invalid
+            if error is not None:
+                raise InvalidTurnError(data_type, error, num_requests)
+
+        with tracing.span("parse"):
+            if reason:
+                reason_text = parse_reasoning_from_response(responses[REASONS])
+            else:
+                reason_text = "Reasoning was not requested."
+
+            # parse ranks from response
+            c_ranks = parse_numbers_from_response(responses[CONSIDERATIONS])
+            p_ranks = parse_numbers_from_response(responses[POLICIES])
+
+        # set meta columns
+        meta = [date, provider, model, temperature, input_tokens, output_tokens]
+
+        return p_ranks, c_ranks, reason_text, meta, repairs, cache_tokens
+
+
+class ChatCompletionsGenerator(DataGenerator):
+    """
+    Adapter for OpenAI-compatible chat completions APIs.
+    """
+
+    def get_messages(self, messages, system_prompt=None):
+        if system_prompt is None:
+            return messages
+        return [{"role": "system", "content": system_prompt}] + messages
+
+    def get_params(self, model, messages, temperature, system_prompt=None):
+        return {
+            "model": model,
+            "messages": self.get_messages(messages, system_prompt),
+            "temperature": temperature,
+        }
+
+    def send(self, model, messages, temperature, system_prompt=None):
+        return self.client.chat.completions.create(
+            **self.get_params(model, messages, temperature, system_prompt)
+        )
+
+    def get_text(self, model, res):
+        return res.choices[0].message.content
+
+    def get_cached_tokens(self, usage):
+        details = getattr(usage, "prompt_tokens_details", None)
+        if details is None:
+            return 0
+        return details.cached_tokens or 0
+
+    def get_usage(self, model, res):
+        return (
+            res.usage.prompt_tokens,
+            res.usage.completion_tokens,
+            self.get_cached_tokens(res.usage),
+        )
+
+    def get_model_version(self, model, res):
+        return res.model
@@ -1,191 +1,167 @@
+import hashlib
+import json
 import re
 from openai import OpenAI
 
-from utils import (
-    CONSIDERATIONS,
-    POLICIES,
-    PROMPT_R,
-    REASONS,
-    get_utc_time,
-    log_request,
-    parse_numbers_from_response,
-    parse_reasoning_from_response,
-    get_provider,
-)
-
-# define openai client to access API
-client = OpenAI(
-    organization="org-5vaJcJj36BER6kXQMdkKKpZP",
-    project="proj_k8Gv8E3GjDirposW9zEqvdfq",
-)
+from data_llm import ChatCompletionsGenerator
+from utils import split_prompt
 
 # default reasoning effort
 R_EFFORT = "medium"
 
 
-def send_message(model, messages, temperature):
+def get_cache_key(messages):
 
-    # check if model contains "o{digit}" such as o1-mini, o1
-    # NOTE: temperature parameter is not used
-    if re.search(r"o\d", model):
-        return client.chat.completions.create(model=model, messages=messages)
+    # prompt caching is automatic for the longest shared prefix, the key
+    # routes requests that share the system prompt and instructions together
+    # https://platform.openai.com/docs/guides/prompt-caching
+    prefix = []
+    for message in messages:
+        if message["role"] == "user":
+            prefix.append(split_prompt(message["content"])[0])
+            break
+        prefix.append(message["content"])
 
-    return client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature,
-    )
+    return hashlib.sha256("\n".join(prefix).encode("utf-8")).hexdigest()[:32]
 
 
-def generate_data(
-    mp,
-    p_prompt,
-    c_prompt,
-    cuid,
-    system_prompt=None,
-    model="gpt-4o",
-    temperature=0,
-    reason=False,
-):
-
-    # get current time
-    date = get_utc_time()
-
-    # get provider
-    provider = get_provider(model)
-
-    # build initial message
-    if system_prompt is None:
-        messages = [
-            {"role": "user", "content": c_prompt},
-        ]
-    else:
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": c_prompt},
-        ]
-
-    # send first message
-    res = send_message(
-        model,
-        messages,
-        temperature,
-    )
+class OpenAIGenerator(ChatCompletionsGenerator):
 
-    c_response = res.choices[0].message.content
-
-    # get cost
-    input_tokens = res.usage.prompt_tokens
-    output_tokens = res.usage.completion_tokens
-
-    # log request history to file
-    log_request(
-        cuid,
-        date,
-        provider,
-        model,
-        temperature,
-        system_prompt,
-        mp,
-        CONSIDERATIONS,
-        c_prompt,
-        c_response,
-        res.usage.prompt_tokens,
-        res.usage.completion_tokens,
-        res.model,
-    )
+    DEFAULT_MODEL = "gpt-4o"
 
-    # append response to messages
-    messages.append(
-        {"role": "assistant", "content": c_response},
-    )
+    def create_client(self):
+        # define openai client to access API
+        return OpenAI(
+            organization="org-5vaJcJj36BER6kXQMdkKKpZP",
+            project="proj_k8Gv8E3GjDirposW9zEqvdfq",
+        )
+
+    def is_reasoning(self, model):
+        # o-series models, e.g. o1-mini, o3
+        return re.search(r"o\d", model) is not None
+
+    def get_params(self, model, messages, temperature, system_prompt=None):
+
+        messages = self.get_messages(messages, system_prompt)
+
+        params = {
+            "model": model,
+            "messages": messages,
+            "prompt_cache_key": get_cache_key(messages),
+        }
+
+        # check if model contains "o{digit}" such as o1-mini, o1
+        # NOTE: temperature parameter is not used
+        if not self.is_reasoning(model):
+            params["temperature"] = temperature
+
+        return params
+
+    def send(self, model, messages, temperature, system_prompt=None):
+
+        params = self.get_params(model, messages, temperature, system_prompt)
+
+        # the pinned SDK has no prompt_cache_key argument, it goes in the
+        # request body as is. batch bodies keep it as a regular field
+        extra_body = {"prompt_cache_key": params.pop("prompt_cache_key")}
+
+        return self.client.chat.completions.create(**params, extra_body=extra_body)
+
+
+generator = OpenAIGenerator()
+generate_data = generator.generate_data
+
+
+## Batch API: https://platform.openai.com/docs/guides/batch
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_WINDOW = "24h"
+BATCH_FAILED = ["failed", "expired", "cancelling", "cancelled"]
 
-    # append policies prompt
-    messages.append(
-        {"role": "user", "content": p_prompt},
-    )
 
-    # get p prompt response
-    res = send_message(
-        model,
-        messages,
-        temperature,
+def submit_batch(model, conversations, temperature, system_prompt=None):
+    """
+    Submits one request per conversation to the Batch API.
+
+    Args:
+      conversations: dict of custom_id -> list of user/assistant messages.
+
+    Returns:
+      The batch id.
+    """
+
+    lines = [
+        json.dumps(
+            {
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": generator.get_params(
+                    model, messages, temperature, system_prompt
+                ),
+            }
+        )
+        for custom_id, messages in conversations.items()
+    ]
+
+    batch_file = generator.client.files.create(
+        file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
     )
 
-    p_response = res.choices[0].message.content
-
-    # get cost
-    input_tokens += res.usage.prompt_tokens
-    output_tokens += res.usage.completion_tokens
-
-    # log request history to file
-    log_request(
-        cuid,
-        date,
-        provider,
-        model,
-        temperature,
-        system_prompt,
-        mp,
-        POLICIES,
-        p_prompt,
-        p_response,
-        res.usage.prompt_tokens,
-        res.usage.completion_tokens,
-        res.model,
+    batch = generator.client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_WINDOW,
     )
 
-    if reason:
+    return batch.id
 
-        # append response to messages
-        messages.append(
-            {"role": "assistant", "content": p_response},
-        )
 
-        # append reasoning prompt
-        messages.append(
-            {"role": "user", "content": PROMPT_R},
-        )
+def is_batch_done(batch_id):
 
-        res = send_message(
-            model,
-            messages,
-            temperature,
-        )
+    batch = generator.client.batches.retrieve(batch_id)
 
-        r_response = res.choices[0].message.content
-
-        reason_text = parse_reasoning_from_response(r_response)
-
-        # get cost
-        input_tokens += res.usage.prompt_tokens
-        output_tokens += res.usage.completion_tokens
-
-        # log request history to file
-        log_request(
-            cuid,
-            date,
-            provider,
-            model,
-            temperature,
-            system_prompt,
-            mp,
-            REASONS,
-            PROMPT_R,
-            r_response,
-            res.usage.prompt_tokens,
-            res.usage.completion_tokens,
-            res.model,
-        )
+    if batch.status in BATCH_FAILED:
+        raise RuntimeError(f"Batch {batch_id} {batch.status}: {batch.errors}")
+
+    return batch.status == "completed"
 
-    else:
-        reason_text = "Reasoning was not requested."
 
-    # parse ranks from response
-    c_ranks = parse_numbers_from_response(c_response)
-    p_ranks = parse_numbers_from_response(p_response)
+def get_batch_results(model, batch_id):
+    """
+    Returns a dict of custom_id -> (response, input_tokens, output_tokens,
+    model_version, cached_tokens, cache_write_tokens). Requests that failed in
+    the batch are left out.
+    """
 
-    # set meta columns
-    meta = [date, provider, model, temperature, input_tokens, output_tokens]
+    batch = generator.client.batches.retrieve(batch_id)
+
+    results = {}
+
+    if batch.output_file_id is None:
+        return results
+
+    content = generator.client.files.content(batch.output_file_id).text
+
+    for line in content.splitlines():
+
+        if not line.strip():
+            continue
+
+        row = json.loads(line)
+        res = row["response"]
+
+        if row.get("error") or res is None or res["status_code"] != 200:
+            continue
+
+        body = res["body"]
+        details = body["usage"].get("prompt_tokens_details") or {}
+        results[row["custom_id"]] = (
+            body["choices"][0]["message"]["content"],
+            body["usage"]["prompt_tokens"],
+            body["usage"]["completion_tokens"],
+            body["model"],
+            details.get("cached_tokens") or 0,
+            0,  # prompt cache writes are not billed
+        )
 
-    return p_ranks, c_ranks, reason_text, meta
+    return results
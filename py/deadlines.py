@@ -0,0 +1,226 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+import metrics
+import rate_limit
+from utils import get_api, get_cost
+
+# per-turn deadlines and hedged requests. the latency of every successful
+# request is kept per model and turn (considerations, policies, reasons):
+# - deadline: a request that takes longer than DEADLINE_FACTOR times the
+#   p99 latency fails with DeadlineExceededError, instead of stalling its
+#   completion. until MIN_SAMPLES requests are observed DEFAULT_DEADLINE
+#   applies, long enough for reasoning models.
+# - hedging (opt-in): when a request is still running after the p95
+#   latency, a duplicate is sent and the first reply is used. the other
+#   reply is still paid for, its cost goes to the ledger and the run
+#   summary. reasoning models are not hedged, their latency varies with the
+#   thinking budget and duplicates are expensive.
+# SDK calls cannot be interrupted, a request past its deadline is left to
+# finish in the background, and its cost is reported apart from hedging's.
+LATENCY_WINDOW = 200  # latest requests per model and turn
+MIN_SAMPLES = 20
+DEADLINE_PERCENTILE = 99
+DEADLINE_FACTOR = 3
+MIN_DEADLINE = 30  # seconds
+DEFAULT_DEADLINE = 15 * 60
+HEDGE_PERCENTILE = 95
+
+# requests run here so they can be waited on with a timeout
+MAX_WORKERS = 256
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="send")
+_latencies = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a request takes longer than its turn's deadline."""
+
+    def __init__(self, model, data_type, deadline):
+        super().__init__(f"{model} {data_type} request exceeded {deadline:.0f}s")
+        self.model = model
+        self.data_type = data_type
+        self.deadline = deadline
+
+
+def observe(model, data_type, latency):
+    with _lock:
+        key = (model, data_type)
+        if key not in _latencies:
+            _latencies[key] = deque(maxlen=LATENCY_WINDOW)
+        _latencies[key].append(latency)
+
+
+def get_percentile(model, data_type, q):
+    """Returns the q-th latency percentile, or None without enough samples."""
+
+    with _lock:
+        latencies = list(_latencies.get((model, data_type), []))
+
+    if len(latencies) < MIN_SAMPLES:
+        return None
+
+    return float(np.percentile(latencies, q))
+
+
+def get_deadline(model, data_type):
+
+    latency = get_percentile(model, data_type, DEADLINE_PERCENTILE)
+    if latency is None:
+        return DEFAULT_DEADLINE
+
+    return max(MIN_DEADLINE, DEADLINE_FACTOR * latency)
+
+
+def get_empty_stats():
+    return {
+        "timeouts": 0,
+        "timeout_cost": 0,
+        "hedged": 0,
+        "hedge_won": 0,
+        "hedge_cost": 0,
+    }
+
+
+def get_stats(api):
+    with _lock:
+        return dict(_stats.get(api, get_empty_stats()))
+
+
+def add_stats(api, **values):
+    with _lock:
+        stats = _stats.setdefault(api, get_empty_stats())
+        for key, value in values.items():
+            stats[key] += value
+
+
+def timed(func, *args):
+    start_time = time.monotonic()
+    res = func(*args)
+    return res, time.monotonic() - start_time
+
+
+def send_hedge(generator, model, messages, temperature, system_prompt):
+
+    # the duplicate counts against the API's rate limits too
+    estimate = rate_limit.acquire(model, messages, system_prompt)
+    res = generator.send(model, messages, temperature, system_prompt)
+    input_tokens, output_tokens, _ = generator.get_usage(model, res)
+    rate_limit.settle(model, estimate, input_tokens + output_tokens)
+
+    return res
+
+
+def record_unused(generator, model, future, ledger=None, stat="hedge_cost"):
+    """
+    Accounts for a reply that was not used: the loser of a hedged pair
+    (hedge_cost), or a request abandoned past its deadline (timeout_cost).
+    """
+
+    if future.cancelled() or future.exception() is not None:
+        return
+
+    res, _ = future.result()
+    input_tokens, output_tokens, cached_tokens = generator.get_usage(model, res)
+    cache_write_tokens = generator.get_cache_write_tokens(model, res)
+
+    cost_input, cost_output = get_cost(
+        model, input_tokens, output_tokens, cached_tokens, cache_write_tokens
+    )
+    add_stats(get_api(model), **{stat: cost_input + cost_output})
+
+    if ledger is not None:
+        ledger.record(
+            model,
+            input_tokens,
+            output_tokens,
+            cached_tokens=cached_tokens,
+            cache_write_tokens=cache_write_tokens,
+        )
+
+
+def send(
+    generator,
+    model,
+    messages,
+    temperature,
+    system_prompt,
+    data_type,
+    hedge=False,
+    ledger=None,
+):
+    """
+    Sends a request with the turn's deadline, and a hedged duplicate if
+    hedge is set, and returns the first response.
+
+    Args:
+      ledger: optional cost_ledger.LedgerSession for the unused reply.
+    """
+
+    deadline = get_deadline(model, data_type)
+    start_time = time.monotonic()
+
+    # each submission gets its own copy of the messages, the caller appends
+    # to its list once a reply is returned, while the other may still run
+    args = (model, list(messages), temperature, system_prompt)
+    futures = [_executor.submit(timed, generator.send, *args)]
+
+    hedge_delay = None
+    if hedge and not generator.is_reasoning(model):
+        hedge_delay = get_percentile(model, data_type, HEDGE_PERCENTILE)
+
+    if hedge_delay is not None and hedge_delay < deadline:
+        done, _ = wait(futures, timeout=hedge_delay)
+        if not done:
+            hedge_args = (model, list(messages), temperature, system_prompt)
+            futures.append(
+                _executor.submit(timed, send_hedge, generator, *hedge_args)
+            )
+            add_stats(get_api(model), hedged=1)
+            metrics.observe_hedge(model, data_type)
+
+    winner = None
+    error = None
+    pending = list(futures)
+    while pending and winner is None:
+        timeout = deadline - (time.monotonic() - start_time)
+        done, _ = wait(pending, timeout=max(0, timeout), return_when=FIRST_COMPLETED)
+        if not done:
+            # still paid for if they finish
+            for future in pending:
+                future.add_done_callback(
+                    lambda f: record_unused(generator, model, f, ledger, "timeout_cost")
+                )
+            add_stats(get_api(model), timeouts=1)
+            metrics.observe_deadline_timeout(model, data_type)
+            raise DeadlineExceededError(model, data_type, deadline)
+        for future in done:
+            pending.remove(future)
+            if future.exception() is None:
+                winner = future
+                break
+            error = future.exception()
+
+    if winner is None:
+        raise error
+
+    if winner is not futures[0]:
+        add_stats(get_api(model), hedge_won=1)
+
+    res, latency = winner.result()
+    observe(model, data_type, latency)
+
+    # paid for even if it is not used
+    for future in futures:
+        if future is not winner:
+            future.add_done_callback(
+                lambda f: record_unused(generator, model, f, ledger)
+            )
+
+    return res
@@ -0,0 +1,135 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import aimd
+import metrics
+import tracing
+
+# number of completions in flight per API, unless overridden in runtime.
+# each completion runs its turns (considerations -> policies -> reasons)
+# in order, so this is the number of concurrent conversations. with adaptive
+# concurrency this is the starting point, see aimd.py.
+PROVIDER_CONCURRENCY = {
+    "Anthropic API": 8,
+    "Cohere API": 4,
+    "DeepSeek API": 8,
+    "Google Could": 8,
+    "ollama": 1,  # local models, one at a time
+    "Mistral AI API": 2,
+    "OpenAI API": 16,
+    "Alibaba Cloud": 4,
+    "Together AI": 4,
+    "xAI API": 8,
+}
+DEFAULT_CONCURRENCY = 4
+
+# provider SDKs are synchronous, each in-flight completion holds a thread
+MAX_WORKERS = 128
+
+
+class AdaptiveSemaphore:
+    """
+    Semaphore whose number of slots follows an aimd.AimdController. Waiters
+    are admitted in order as slots are released; when the limit drops,
+    running completions finish and no new ones start until the count is
+    under the new limit.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.in_flight = 0
+        self._waiters = deque()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.controller.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+        self._observe()
+
+    def _observe(self):
+        metrics.set_queue(
+            self.controller.api,
+            len(self._waiters),
+            self.in_flight,
+            self.controller.limit,
+        )
+
+    async def __aenter__(self):
+
+        if not self._waiters and self.in_flight < self.controller.limit:
+            self.in_flight += 1
+            self._observe()
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._observe()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # admitted just before being cancelled, pass the slot on
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake()
+            raise
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._wake()
+
+
+class CompletionEngine:
+    """
+    Runs blocking provider calls on a thread pool, bounded by a
+    per-API concurrency limit.
+
+    Args:
+      concurrency: optional dict of API name -> max completions in flight,
+        overriding PROVIDER_CONCURRENCY.
+      adaptive: adjust each API's limit to its throttling and latency, see
+        aimd.py, starting from the limits above. False keeps them fixed.
+    """
+
+    def __init__(self, concurrency=None, adaptive=True):
+        self.concurrency = concurrency if concurrency else {}
+        self.adaptive = adaptive
+        self._semaphores = {}
+
+    def get_concurrency(self, api):
+        if api in self.concurrency:
+            return self.concurrency[api]
+        return PROVIDER_CONCURRENCY.get(api, DEFAULT_CONCURRENCY)
+
+    def _get_semaphore(self, api):
+        # semaphores are created lazily so they bind to the running loop
+        if api not in self._semaphores:
+            controller = aimd.open_controller(
+                api, self.get_concurrency(api), self.adaptive
+            )
+            self._semaphores[api] = AdaptiveSemaphore(controller)
+        return self._semaphores[api]
+
+    async def submit(self, api, func, *args, **kwargs):
+        semaphore = self._get_semaphore(api)
+
+        with tracing.span("slot_wait", api=api):
+            await semaphore.__aenter__()
+        try:
+            # the thread runs in a copy of this context, spans nest
+            return await asyncio.to_thread(func, *args, **kwargs)
+        finally:
+            await semaphore.__aexit__(None, None, None)
+
+    def run(self, main):
+
+        async def runner():
+            loop = asyncio.get_running_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=MAX_WORKERS))
+            return await main
+
+        # new loop per run, drop semaphores bound to a previous one
+        self._semaphores = {}
+        return asyncio.run(runner())
@@ -1,23 +1,33 @@
 import argparse
+import asyncio
+import json
 import os
 import sys
+from functools import partial
 from prompts import build_system_prompt
-from surveys import get_surveys_data, get_policies_and_considerations
+from surveys import get_survey_params, get_survey_statements
 from utils import (
     check_params,
+    flush_output,
     get_api,
     get_current_time,
-    get_model_info,
+    get_cost,
     get_or_create_output,
     get_prompts,
     append_data_to_file,
+    check_turn,
+    get_repair_prompt,
+    InvalidTurnError,
     POLICIES,
     CONSIDERATIONS,
     REASONS,
+    REPAIRS,
+    REPAIRS_COLUMNS,
     get_provider,
     get_utc_time,
     is_valid_response,
     log_execution,
+    OUTPUT_DIR,
     get_or_create_progress_tracker,
     print_progress,
     shuffle_p_and_c,
@@ -29,78 +39,362 @@ import pandas as pd
 import random
 import uuid
 
-import data_google
-import data_openai
-import data_cohere
-import data_mistral
-import data_ollama
-import data_deepseek
-import data_anthropic
-import data_alibaba
-import data_together
-import data_xai
+import aimd
+import deadlines
+import metrics
+import tracing
+from cost_ledger import BudgetExceededError
+from engine import CompletionEngine
+from providers import get_llm_provider, probe_model
+from parquet_store import append_data_to_dataset
+from writer import get_writer
+import cost_ledger
+import response_cache
+import results_store
 
+# execution constants
+REASON = True
 
-def get_llm_provider(model):
 
-    api = get_api(model)
-    if api == "Anthropic API":
-        return data_anthropic
-    elif api == "Cohere API":
-        return data_cohere
-    elif api == "DeepSeek API":
-        return data_deepseek
-    elif api == "Google Could":
-        return data_google
-    elif api == "ollama":
-        return data_ollama
-    elif api == "Mistral AI API":
-        return data_mistral
-    elif api == "OpenAI API":
-        return data_openai
-    elif api == "Alibaba Cloud":
-        return data_alibaba
-    elif api == "Together AI":
-        return data_together
-    elif api == "xAI API":
-        return data_xai
-    else:
-        raise (f"The API for {model} is not setup!")
-
-
-def generate_data(model, iterations, temperature=0, only_survey=None, prompt_uid=None):
+def build_completions(
+    survey, iterations, policies, considerations, scale_max, q_method, cuids=None
+):
+
+    completions = []
+
+    for i in range(iterations):
+
+        # generate a unique id for the completion, unless it was leased
+        completion_uid = cuids[i] if cuids else str(uuid.uuid4())
+
+        with tracing.span("build_prompts", completion_uid, survey=survey):
+
+            # shuffle policies and considerations
+            rand_p, rand_c, p_indexes, c_indexes = shuffle_p_and_c(
+                policies, considerations
+            )
+
+            # create policy and consideration prompts
+            p_prompt, c_prompt = get_prompts(rand_p, rand_c, scale_max, q_method)
+
+        completions.append(
+            {
+                "survey": survey,
+                "iteration": i,
+                "cuid": completion_uid,
+                "p_indexes": p_indexes,
+                "c_indexes": c_indexes,
+                "p_prompt": p_prompt,
+                "c_prompt": c_prompt,
+            }
+        )
+
+    return completions
+
+
+async def run_completion(engine, api, llm_provider, completion, **kwargs):
+
+    # record start time
+    it_start_time = time.time()
+
+    try:
+        # requests are paced by the API's rate limiter in send_turn
+        with tracing.span(
+            "completion",
+            completion["cuid"],
+            survey=completion["survey"],
+            model=kwargs.get("model"),
+        ):
+            result = await engine.submit(
+                api,
+                llm_provider.generate_data,
+                completion["survey"],
+                completion["p_prompt"],
+                completion["c_prompt"],
+                completion["cuid"],
+                **kwargs,
+            )
+        error = None
+    except Exception as e:
+        result = None
+        error = e
+
+    it_elapsed_time = round(time.time() - it_start_time, 2)
+
+    return completion, result, error, it_elapsed_time
+
+
+async def run_completions(engine, job):
+
+    tasks = [
+        asyncio.create_task(
+            run_completion(
+                engine,
+                job["api"],
+                job["llm_provider"],
+                completion,
+                system_prompt=job["system_prompt"],
+                model=job["model"],
+                temperature=job["temperature"],
+                reason=job["reason"],
+                check=get_check(job, completion),
+                repair=get_repair(job, completion),
+                max_repairs=job["max_repairs"],
+                cache=job["cache"],
+                store=job["store"],
+                ledger=job["ledger"],
+                hedge=job["hedge"],
+            )
+        )
+        for completion in job["completions"]
+    ]
+
+    # results are handled on the event loop thread, one at a time
+    for task in asyncio.as_completed(tasks):
+        completion, result, error, it_elapsed_time = await task
+        handle_result(job, completion, result, error, it_elapsed_time)
+
+
+def get_check(job, completion):
+
+    policies, considerations, scale_max, q_method = job["survey_params"][
+        completion["survey"]
+    ]
+
+    return partial(
+        check_turn,
+        considerations=considerations,
+        policies=policies,
+        likert=scale_max,
+        q_method=q_method,
+    )
+
+
+def get_repair(job, completion):
+
+    policies, considerations, scale_max, q_method = job["survey_params"][
+        completion["survey"]
+    ]
+
+    return partial(
+        get_repair_prompt,
+        considerations=considerations,
+        policies=policies,
+        likert=scale_max,
+        q_method=q_method,
+    )
+
+
+def finish_completion(job, completion, record=None):
+    """Saves a handled completion, record is None if it failed."""
+
+    with tracing.span("finish"):
+
+        # requests of failed completions are saved without a completion record
+        if job["store"] is not None:
+            job["store"].save_completion(completion["cuid"], record)
+
+        if job["queue"] is not None:
+            if record is None:
+                # back to the queue under a new cuid, for the next run
+                job["queue"].release(completion["cuid"])
+                metrics.observe_retry(job["model"])
+            else:
+                # marked done by the writer thread once the rows are journaled,
+                # so a done completion always has its rows
+                complete = partial(job["queue"].complete, completion["cuid"])
+                get_writer(OUTPUT_DIR).call(complete)
+
+
+def handle_result(job, completion, result, error, it_elapsed_time):
+
+    with tracing.span("handle", completion["cuid"]):
+        handle_completion(job, completion, result, error, it_elapsed_time)
+
+
+def handle_completion(job, completion, result, error, it_elapsed_time):
+
+    model = job["model"]
+    stats = job["stats"]
+
+    survey = completion["survey"]
+    policies, considerations, scale_max, q_method = job["survey_params"][survey]
+    p_df, c_df, r_df = job["outputs"][survey]
+    prompt_uid = job["prompt_uid"]
+
+    print(
+        f"- {model}/{survey} iteration {completion['iteration']+1} of {job['iterations']}... ",
+        end="",
+    )
+
+    # budget reached, the completion is left for a later run
+    if isinstance(error, BudgetExceededError):
+        print(f"SKIPPED: {error}")
+        stats["num_skipped"] += 1
+        metrics.observe_completion(model, "skipped")
+        finish_completion(job, completion)
+        return
+
+    # invalid turn, the rest of the conversation was skipped
+    if isinstance(error, InvalidTurnError):
+        print(f"ERROR: {error}")
+        stats["num_requests"] += error.num_requests
+        stats["num_invalid"] += 1
+        stats["num_aborted"] += 1
+        metrics.observe_completion(model, "invalid")
+        finish_completion(job, completion)
+        return
+
+    if error is not None:
+        print(f"ERROR: {error}")
+        stats["num_errors"] += 1
+        metrics.observe_completion(model, "error")
+        finish_completion(job, completion)
+        return
+
+    p_ranks, c_ranks, reason_text, meta, repairs, cache_tokens = result
+
+    # record number of requests
+    stats["num_requests"] += (3 if job["reason"] else 2) + repairs
+
+    with tracing.span("validate"):
+        is_valid = is_valid_response(
+            c_ranks, p_ranks, considerations, policies, scale_max, q_method
+        )
+
+    if not is_valid:
+        stats["num_invalid"] += 1
+        metrics.observe_completion(model, "invalid")
+        finish_completion(job, completion)
+        return
+
+    # sort ranks based on original order
+    p_ranks = [x for _, x in sorted(zip(completion["p_indexes"], p_ranks))]
+    c_ranks = [x for _, x in sorted(zip(completion["c_indexes"], c_ranks))]
+
+    # create output dataframes
+    completion_uid = completion["cuid"]
+    p_df.loc[0] = [completion_uid] + meta + [prompt_uid] + p_ranks
+    c_df.loc[0] = [completion_uid] + meta + [prompt_uid] + c_ranks
+    r_df.loc[0] = [completion_uid] + meta + [prompt_uid] + [reason_text]
+
+    # read costs
+    stats["input_tokens"] += meta[4]
+    stats["output_tokens"] += meta[5]
+    stats["cached_tokens"] += cache_tokens[0]
+    stats["cache_write_tokens"] += cache_tokens[1]
+
+    # append data to files
+    print(f"SUCCESS. ({it_elapsed_time}s)")
+    with tracing.span("write"):
+        append_data_to_file(survey, model, p_df, POLICIES)
+        append_data_to_file(survey, model, c_df, CONSIDERATIONS)
+        append_data_to_file(survey, model, r_df, REASONS)
+        if repairs:
+            repairs_df = pd.DataFrame(
+                [[completion_uid, repairs]], columns=REPAIRS_COLUMNS
+            )
+            append_data_to_file(survey, model, repairs_df, REPAIRS)
+        if job["parquet"]:
+            append_data_to_dataset(survey, model, p_df, POLICIES)
+            append_data_to_dataset(survey, model, c_df, CONSIDERATIONS)
+            append_data_to_dataset(survey, model, r_df, REASONS)
+    finish_completion(
+        job,
+        completion,
+        {
+            "cuid": completion_uid,
+            "created_at": meta[0],
+            "provider": meta[1],
+            "model": meta[2],
+            "survey": survey,
+            "prompt_uid": prompt_uid,
+            "temperature": meta[3],
+            "input_tokens": meta[4],
+            "output_tokens": meta[5],
+            "repairs": repairs,
+            "reason": reason_text,
+            "policies": json.dumps(p_ranks),
+            "considerations": json.dumps(c_ranks),
+        },
+    )
+
+    stats["num_success"] += 1
+    metrics.observe_completion(model, "success")
+    if repairs:
+        stats["num_repaired"] += 1
+    job["surveys_success"][survey] += 1
+
+
+def prepare_job(
+    model,
+    iterations,
+    temperature=0,
+    only_survey=None,
+    prompt_uid=None,
+    surveys=None,
+    max_repairs=0,
+    cache=False,
+    parquet=False,
+    store=False,
+    cuids=None,
+    queue=None,
+    ledger=None,
+    preflight=True,
+    hedge=False,
+):
+    """
+    Resolves the provider, output files and shuffled prompts for one
+    model/survey/prompt run. Returns None if the model's API is not setup.
+
+    max_repairs is the max number of follow-up turns per completion that ask
+    the model to fix an invalid response, 0 to discard invalid completions.
+    With cache=True, deterministic requests go through the response cache.
+    With parquet=True, completions are also written to the parquet store.
+    With store=True, completions, requests and progress are also saved in
+    the SQLite results store.
+
+    With preflight=True, one tiny request checks the credentials and the
+    model name first. With hedge=True, turns slower than the model's p95
+    latency are sent twice and the first reply is used.
+
+    ledger is the cost_ledger.LedgerSession of the run, shared by its jobs so
+    the run budget covers all of them; a session without budgets if None.
+
+    cuids and queue are set by job_queue: one completion uid per iteration
+    of only_survey, and the queue to mark them done or failed in.
+    """
+
+    if cuids is not None and (only_survey is None or len(cuids) != iterations):
+        raise ValueError(
+            "Leased completion uids need a single survey and one uid per iteration."
+        )
 
     # execution params
-    model_info = get_model_info(model)
     provider = get_provider(model)
+    api = get_api(model)
     system_prompt = build_system_prompt(prompt_uid) if prompt_uid else None
 
     try:
         llm_provider = get_llm_provider(model)
+        # build the client now, so missing API keys fail before any work
+        llm_provider.generator.client
     except Exception as e:
         print(e)
-        return
+        return None
+
+    if preflight:
+        error = probe_model(model)
+        if error is not None:
+            print(f"ERROR: preflight of {model} failed: {error}")
+            return None
 
     # get surveys data
-    surveys = get_surveys_data(deliberative_cases=True)
+    if surveys is None:
+        surveys = get_survey_params(deliberative_cases=True)
 
     # progress_df = get_or_create_progress_tracker(surveys)
 
-    # execution constants
-    REASON = True
-
-    # execution numbers
-    num_invalid = 0  # LLM errors
-    num_errors = 0  # critical errors
-    num_success = 0  # successful runs
-    num_requests = 0  # LLM requests
-
-    input_tokens = 0
-    output_tokens = 0
-
-    # track execution data on each survey
-    surveys_success = {survey_name: 0 for survey_name in surveys}
-
     # testing params
     subset_surveys = (
         [only_survey] if only_survey else []
@@ -111,10 +405,6 @@ def generate_data(model, iterations, temperature=0, only_survey=None, prompt_uid
     # set reproduceable seed
     random.seed(1)
 
-    # record start time
-    start_time = time.time()
-    exec_date = get_utc_time()
-
     # llms = get_available_llms()
     # providers = llms["provider"].drop_duplicates().tolist()
 
@@ -132,110 +422,119 @@ def generate_data(model, iterations, temperature=0, only_survey=None, prompt_uid
     print(f"Model: {model}")
     print(f"Temperature: {temperature}")
     print(f"System prompt: [{prompt_uid}] {system_prompt}")
-
-    # iterate over each survey
+    print(f"Max repairs: {max_repairs}")
+    print(f"Response cache: {'on' if cache else 'off'}")
+    print(f"Parquet store: {'on' if parquet else 'off'}")
+    print(f"Results store: {'on' if store else 'off'}")
+    print(f"Hedged requests: {'on' if hedge else 'off'}")
+
+    if ledger is None:
+        ledger = cost_ledger.open_session()
+
+    # prepare all completions up front, in the same order as a sequential
+    # run, so the seeded shuffles match regardless of completion order
+    survey_params = {}
+    outputs = {}
+    completions = []
     for i, survey in enumerate(surveys_exec):
 
         # get policies and consideration statements
         try:
-            policies, considerations, scale_max, q_method = (
-                get_policies_and_considerations(surveys[survey])
-            )
+            survey_params[survey] = get_survey_statements(surveys[survey])
         except Exception as e:
             print(f"ERROR: {survey} not formatted correctly: {e}")
             break
 
+        policies, considerations, scale_max, q_method = survey_params[survey]
+
         print(f"\nSurvey: {survey} ({(i+1)} of {len(surveys_exec)})")
         print(f"Scale: 1-{scale_max}")
-        print(f"Q: {q_method}\n")
+        print(f"Q: {q_method}")
 
         # create policy and consideration files if they don't exist
-        p_df, c_df, r_df = get_or_create_output(survey, model, policies, considerations)
+        outputs[survey] = get_or_create_output(survey, model, policies, considerations)
+
+        completions += build_completions(
+            survey, iterations, policies, considerations, scale_max, q_method, cuids
+        )
 
-        # get X completions from the LLM API, where X is _iterations_
-        for i in range(iterations):
+    return {
+        "model": model,
+        "provider": provider,
+        "api": api,
+        "llm_provider": llm_provider,
+        "iterations": iterations,
+        "temperature": temperature,
+        "prompt_uid": prompt_uid,
+        "system_prompt": system_prompt,
+        "reason": REASON,
+        "max_repairs": max_repairs,
+        "cache": response_cache.open_session() if cache else None,
+        "parquet": parquet,
+        "store": results_store.get_store() if store else None,
+        "queue": queue,
+        "ledger": ledger,
+        "hedge": hedge,
+        "surveys_exec": surveys_exec,
+        "survey_params": survey_params,
+        "outputs": outputs,
+        "completions": completions,
+        # execution numbers, updated by the completion handler
+        "stats": {
+            "num_invalid": 0,  # LLM errors
+            "num_aborted": 0,  # LLM errors caught before the last turn
+            "num_repaired": 0,  # successful runs that needed repair turns
+            "num_errors": 0,  # critical errors
+            "num_skipped": 0,  # not sent, a budget was reached
+            "num_success": 0,  # successful runs
+            "num_requests": 0,  # LLM requests
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cached_tokens": 0,  # prompt cache reads, part of input_tokens
+            "cache_write_tokens": 0,  # prompt cache writes, part of input_tokens
+        },
+        # track execution data on each survey
+        "surveys_success": {survey_name: 0 for survey_name in surveys},
+    }
+
+
+async def run_job(engine, job):
 
-            print(f"- iteration {i+1} of {iterations}... ", end="", flush=True)
+    # record start time
+    job["start_time"] = time.time()
+    job["exec_date"] = get_utc_time()
 
-            # record start time
-            it_start_time = time.time()
+    await run_completions(engine, job)
 
-            # generate a unique id for the completion
-            completion_uid = str(uuid.uuid4())
+    job["end_time"] = time.time()
 
-            # shuffle policies and considerations
-            rand_p, rand_c, p_indexes, c_indexes = shuffle_p_and_c(
-                policies, considerations
-            )
 
-            # create policy and consideration prompts
-            p_prompt, c_prompt = get_prompts(rand_p, rand_c, scale_max, q_method)
+def report_job(job):
+
+    # make sure the job's rows are on disk before reporting
+    flush_output()
 
-            # make API call
-            try:
-                p_ranks, c_ranks, reason, meta = llm_provider.generate_data(
-                    survey,
-                    p_prompt,
-                    c_prompt,
-                    completion_uid,
-                    system_prompt=system_prompt,
-                    model=model,
-                    temperature=temperature,
-                    reason=REASON,
-                )
-            except Exception as e:
-                print(f"ERROR: {e}")
-                num_errors += 1
-                continue
-
-            # record number of requests
-            num_requests += 3 if REASON else 2
-
-            if not is_valid_response(
-                c_ranks, p_ranks, considerations, policies, scale_max, q_method
-            ):
-                num_invalid += 1
-                continue
-
-            # sort ranks based on original order
-            p_ranks = [x for _, x in sorted(zip(p_indexes, p_ranks))]
-            c_ranks = [x for _, x in sorted(zip(c_indexes, c_ranks))]
-
-            # create output dataframes
-            p_df.loc[0] = [completion_uid] + meta + [prompt_uid] + p_ranks
-            c_df.loc[0] = [completion_uid] + meta + [prompt_uid] + c_ranks
-            r_df.loc[0] = [completion_uid] + meta + [prompt_uid] + [reason]
-
-            # read costs
-            input_tokens += meta[4]
-            output_tokens += meta[5]
-
-            it_end_time = time.time()
-
-            it_elapsed_time = round(it_end_time - it_start_time, 2)
-
-            # append data to files
-            print(f"SUCCESS. ({it_elapsed_time}s)")
-            append_data_to_file(survey, model, p_df, POLICIES)
-            append_data_to_file(survey, model, c_df, CONSIDERATIONS)
-            append_data_to_file(survey, model, r_df, REASONS)
-
-            # save progress to file
-            # note: progress_df passed by reference, so values here are updated too
-            # update_progress(progress_df, provider, model, survey, prompt_uid)
-
-            num_success += 1
-            surveys_success[survey] += 1
-
-            time.sleep(1)
+    model = job["model"]
+    provider = job["provider"]
+    temperature = job["temperature"]
+    iterations = job["iterations"]
+    surveys_exec = job["surveys_exec"]
+    surveys_success = job["surveys_success"]
+    stats = job["stats"]
 
+    num_invalid = stats["num_invalid"]
+    num_errors = stats["num_errors"]
+    num_success = stats["num_success"]
+    num_requests = stats["num_requests"]
+    input_tokens = stats["input_tokens"]
+    output_tokens = stats["output_tokens"]
+
+    for survey in job["survey_params"]:
         print(
             f"Success rate for {survey}: {int((surveys_success[survey] * 100) / iterations)}%"
         )
 
-    end_time = time.time()
-
-    elapsed_time = end_time - start_time
+    elapsed_time = job["end_time"] - job["start_time"]
 
     # Calculate hours, minutes, and seconds
     et_hours = int(elapsed_time // 3600)
@@ -247,8 +546,17 @@ def generate_data(model, iterations, temperature=0, only_survey=None, prompt_uid
     success_rate = (
         int(num_success * 100 / num_completions) if num_completions > 0 else 0
     )
-    cost_input = (input_tokens / 1000000) * model_info["price_1M_input"]
-    cost_output = (output_tokens / 1000000) * model_info["price_1M_output"]
+    cost_input, cost_output = get_cost(
+        model,
+        input_tokens,
+        output_tokens,
+        stats["cached_tokens"],
+        stats["cache_write_tokens"],
+    )
+
+    # e.g. discounted batch requests
+    cost_input *= job.get("price_factor", 1)
+    cost_output *= job.get("price_factor", 1)
 
     print(f"\n=============== S U M M A R Y ===============")
     print(f"Execution complete for {provider}/{model}")
@@ -264,7 +572,17 @@ def generate_data(model, iterations, temperature=0, only_survey=None, prompt_uid
     print(f"Total cost: US${cost_input + cost_output:.2f}")
 
     print(f"Invalid LLM completions: {num_invalid}")
+    print(f"Aborted LLM completions: {stats['num_aborted']}")
+    print(f"Repaired LLM completions: {stats['num_repaired']}")
+    if job["cache"] is not None:
+        print(f"Cache hits/misses: {job['cache'].hits}/{job['cache'].misses}")
     print(f"Data generation errors: {num_errors}")
+    concurrency = aimd.get_state(job["api"])
+    if concurrency is not None:
+        print_concurrency(concurrency)
+    print_deadlines(deadlines.get_stats(job["api"]))
+    if stats["num_skipped"]:
+        print(f"Skipped LLM completions (budget reached): {stats['num_skipped']}")
     print(
         f"Successful LLM completions: {sum([surveys_success[s] for s in surveys_success])}"
     )
@@ -273,15 +591,16 @@ def generate_data(model, iterations, temperature=0, only_survey=None, prompt_uid
         f"Elapsed time: {et_hours} hour(s), {et_minutes} minute(s), and {et_seconds} second(s)"
     )
     print(f"Average time per completion: {time_per_completion:.2f}s")
+    print_ledger(job["ledger"])
     print(f"Finished on: {get_current_time()}")
     print(f"=============================================\n")
 
     log_execution(
-        exec_date,
+        job["exec_date"],
         provider,
         model,
         temperature,
-        prompt_uid,
+        job["prompt_uid"],
         iterations,
         num_requests,
         num_completions,
@@ -294,7 +613,98 @@ def generate_data(model, iterations, temperature=0, only_survey=None, prompt_uid
         cost_output,
         surveys_exec,
         surveys_success,
+        stats["num_aborted"],
+        stats["num_repaired"],
+        job["cache"].hits if job["cache"] else None,
+        job["cache"].misses if job["cache"] else None,
+        input_tokens,
+        output_tokens,
+        concurrency,
+    )
+
+
+def print_concurrency(state):
+
+    mode = "adaptive" if state["adaptive"] else "fixed"
+    print(
+        f"Concurrency ({mode}, {state['api']}): {state['initial']} -> {state['limit']} "
+        f"(peak {state['peak']}, {state['increases']} up, {state['decreases']} down)"
     )
+    print(f"Throttled LLM requests: {state['throttled']}")
+
+
+def print_deadlines(stats):
+
+    # per API, shared by all jobs on it
+    print(f"Requests past their deadline: {stats['timeouts']}", end="")
+    if stats["timeout_cost"]:
+        print(f", abandoned replies cost US${stats['timeout_cost']:.2f}", end="")
+    print()
+    if stats["hedged"]:
+        print(
+            f"Hedged requests: {stats['hedged']} ({stats['hedge_won']} won by the hedge), "
+            f"unused replies cost US${stats['hedge_cost']:.2f}"
+        )
+
+
+def print_ledger(ledger):
+
+    print(f"Run spend (all jobs): US${ledger.spent:.2f}", end="")
+    if ledger.run_budget is not None:
+        print(f" of US${ledger.run_budget:.2f}", end="")
+    print()
+
+    spent_today = ledger.ledger.get_spent(cost_ledger.get_day())
+    print(f"Today's spend (all runs): US${spent_today:.2f}", end="")
+    if ledger.daily_budget is not None:
+        print(f" of US${ledger.daily_budget:.2f}", end="")
+    print()
+
+
+def generate_data(
+    model,
+    iterations,
+    temperature=0,
+    only_survey=None,
+    prompt_uid=None,
+    concurrency=None,
+    max_repairs=0,
+    cache=False,
+    parquet=False,
+    store=False,
+    budget=None,
+    daily_budget=None,
+    adaptive=True,
+    preflight=True,
+    hedge=False,
+):
+
+    job = prepare_job(
+        model,
+        iterations,
+        temperature,
+        only_survey,
+        prompt_uid,
+        max_repairs=max_repairs,
+        cache=cache,
+        parquet=parquet,
+        store=store,
+        ledger=cost_ledger.open_session(budget, daily_budget),
+        preflight=preflight,
+        hedge=hedge,
+    )
+    if job is None:
+        return
+
+    engine = CompletionEngine(
+        {job["api"]: concurrency} if concurrency else None, adaptive
+    )
+
+    print(f"\nConcurrency: {engine.get_concurrency(job['api'])}\n")
+
+    engine.run(run_job(engine, job))
+
+    report_job(job)
 
     # audio notification
     os.system('say "done"')
@@ -325,12 +735,113 @@ def main():
         default=None,
         help="the unique identifier of a system prompt to use for the generation",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        required=False,
+        default=None,
+        help="max completions in flight for the model's API, the starting point with adaptive concurrency",
+    )
+    parser.add_argument(
+        "--fixed-concurrency",
+        action="store_true",
+        help="keep the concurrency fixed instead of adapting it to throttling and latency",
+    )
+    parser.add_argument(
+        "--skip-preflight",
+        action="store_true",
+        help="do not check the credentials and model with a tiny request first",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="send a duplicate of turns slower than the p95 latency, first reply wins",
+    )
+    parser.add_argument(
+        "--repairs",
+        type=int,
+        required=False,
+        default=0,
+        help="max follow-up turns per completion to fix invalid responses",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse cached responses to identical requests at temperature 0",
+    )
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help="also write the completions to the partitioned parquet store",
+    )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="also save completions, requests and progress in the SQLite store",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        required=False,
+        default=None,
+        help="max cost of this run in USD, no new requests are sent once reached",
+    )
+    parser.add_argument(
+        "--daily-budget",
+        type=float,
+        required=False,
+        default=None,
+        help="max cost of all runs today (UTC) in USD, across processes",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        required=False,
+        default=None,
+        help="serve Prometheus metrics on this local port while running",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        required=False,
+        default=None,
+        help="write Prometheus metrics to this textfile while running",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        required=False,
+        default=None,
+        help="append spans of each completion to this JSONL file, see tracing.py",
+    )
 
     # Parse the arguments
     args = parser.parse_args()
 
+    metrics.start(args.metrics_port, args.metrics_file)
+    tracing.start(args.trace)
+
     # Call the generate_data function with parsed arguments
-    generate_data(args.model, args.iterations, args.temp, args.survey, args.prompt)
+    generate_data(
+        args.model,
+        args.iterations,
+        args.temp,
+        args.survey,
+        args.prompt,
+        args.concurrency,
+        args.repairs,
+        args.cache,
+        args.parquet,
+        args.store,
+        args.budget,
+        args.daily_budget,
+        not args.fixed_concurrency,
+        not args.skip_preflight,
+        args.hedge,
+    )
+
+    metrics.stop()
+    tracing.stop()
 
 
 if __name__ == "__main__":
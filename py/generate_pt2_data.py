@@ -2,6 +2,8 @@ import subprocess
 import pandas as pd
 import os
 
+from run_manifest import MANIFEST_COLUMNS, run_manifest
+
 # --- Step 1: Run the R script to generate the progress report ---
 print("Running R script to generate progress.csv...")
 try:
@@ -65,35 +67,10 @@ else:
         f"Found {len(unique_combinations)} unique combinations with N < 5. Starting data generation..."
     )
     print(unique_combinations)
-    for index, row in unique_combinations.iterrows():
-        model = row["model"]
-        survey = row["survey"]
-        prompt_uid = row["prompt_uid"]
-
-        # Construct the command to call the other Python script.
-        # The number '5' is hardcoded as per your request.
-        command = [
-            "python",
-            "./py/generate_llm_data.py",
-            model,
-            "5",
-            "--survey",
-            survey,
-            "--prompt",
-            prompt_uid,
-        ]
 
-        print(f"Executing command: {' '.join(command)}")
-        try:
-            # Execute the command using subprocess.run.
-            # `check=True` will raise an error if the command fails.
-            subprocess.run(command, check=True)
-            print(
-                f"Successfully generated data for model: {model}, prompt_uid: {prompt_uid}"
-            )
-        except subprocess.CalledProcessError as e:
-            print(f"Error generating data for model: {model}, prompt_uid: {prompt_uid}")
-            print(f"Subprocess failed with exit code {e.returncode}")
-            # Continue to the next iteration even if one fails.
+    # run all combinations as jobs of a single manifest, in this process
+    # NOTE: the number of completions (5) is hardcoded as per your request.
+    manifest = unique_combinations.assign(temperature=0, n=5)[MANIFEST_COLUMNS]
+    run_manifest(manifest)
 
 print("Script finished.")
@@ -0,0 +1,689 @@
+import argparse
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+import cost_ledger
+import metrics
+import tracing
+import scheduler
+from engine import CompletionEngine
+from generate_llm_data import prepare_job, report_job
+from run_manifest import read_manifest, run_jobs
+from surveys import get_survey_params
+from utils import OUTPUT_DIR, POLICIES, flush_output, get_api, get_provider
+from writer import get_writer, lock_file
+
+# persistent queue of completions for long campaigns. a unit is a (model,
+# survey, prompt_uid, temperature) combination, and each completion it still
+# needs is a slot with its own cuid. a run leases pending slots, generates
+# them with their cuids and marks each slot done once its rows are journaled
+# by the writer. slots of a run that died (its process is gone, or its lease
+# expired) are done if their cuid is in the output files and pending again
+# otherwise, so restarting resumes exactly where it stopped. several runs
+# can share a queue: each journals its rows in its own file and appends
+# under a file lock (see writer.py), and a run only settles the leases and
+# journals of runs that are gone.
+QUEUE_FILE = "job_queue.sqlite"
+LEASE_SECONDS = 15 * 60  # renewed by the worker while it runs
+LEASE_SLOTS = 1000  # slots per lease, the others stay pending for other runs
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+SCHEMA = """
+-- prompt_uid is '' without a system prompt, NULLs would not be unique
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model TEXT NOT NULL,
+    survey TEXT NOT NULL,
+    prompt_uid TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    created_at REAL NOT NULL,
+    UNIQUE (model, survey, prompt_uid, temperature)
+);
+
+CREATE TABLE IF NOT EXISTS slots (
+    cuid TEXT PRIMARY KEY,
+    unit_id INTEGER NOT NULL REFERENCES units (id),
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS slots_unit ON slots (unit_id, state);
+CREATE INDEX IF NOT EXISTS slots_lease ON slots (state, lease_expires);
+"""
+
+
+class JobQueue:
+    """
+    SQLite queue of completion slots, shared by all threads of a run and
+    by concurrent runs on the same file.
+
+    Args:
+      path: SQLite file path.
+      lease_seconds: how long leased slots stay reserved without renewal.
+    """
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def add(self, model, survey, prompt_uid, temperature, n):
+        """Adds n completions to a unit, creating it if needed."""
+
+        now = time.time()
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT OR IGNORE INTO units
+                    (model, survey, prompt_uid, temperature, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (model, survey, prompt_uid or "", float(temperature), now),
+            )
+            unit_id = self.conn.execute(
+                """
+                SELECT id FROM units
+                WHERE model = ? AND survey = ? AND prompt_uid = ? AND temperature = ?
+                """,
+                (model, survey, prompt_uid or "", float(temperature)),
+            ).fetchone()[0]
+            self.conn.executemany(
+                """
+                INSERT INTO slots (cuid, unit_id, state, updated_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                [(str(uuid.uuid4()), unit_id, PENDING, now) for _ in range(n)],
+            )
+
+    def lease(self, worker, limit=LEASE_SLOTS, before=None):
+        """
+        Leases up to limit pending slots to a worker, in the order they were
+        added.
+
+        Args:
+          before: only slots pending since before this time, e.g. not the
+            ones the run released.
+
+        Returns:
+          A list of ((model, survey, prompt_uid, temperature), cuids).
+        """
+
+        self.reclaim()
+
+        now = time.time()
+        before = now if before is None else before
+
+        with self.lock, self.conn:
+            # BEGIN IMMEDIATE, so concurrent runs never lease the same slots
+            self.conn.execute("BEGIN IMMEDIATE")
+            rows = self.conn.execute(
+                """
+                SELECT slots.cuid, units.model, units.survey, units.prompt_uid,
+                    units.temperature
+                FROM slots JOIN units ON units.id = slots.unit_id
+                WHERE slots.state = ? AND slots.updated_at <= ?
+                ORDER BY units.id, slots.rowid
+                LIMIT ?
+                """,
+                (PENDING, before, limit),
+            ).fetchall()
+            self.conn.executemany(
+                """
+                UPDATE slots SET state = ?, worker = ?, lease_expires = ?,
+                    updated_at = ?
+                WHERE cuid = ?
+                """,
+                [(LEASED, worker, now + self.lease_seconds, now, r[0]) for r in rows],
+            )
+
+        units = {}
+        for cuid, model, survey, prompt_uid, temperature in rows:
+            key = (model, survey, prompt_uid or None, temperature)
+            units.setdefault(key, []).append(cuid)
+
+        return list(units.items())
+
+    def renew(self, worker):
+        """Extends the leases of a running worker."""
+
+        now = time.time()
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                UPDATE slots SET lease_expires = ?
+                WHERE state = ? AND worker = ?
+                """,
+                (now + self.lease_seconds, LEASED, worker),
+            )
+
+    def complete(self, cuid):
+        """Marks a slot done, called once its rows are journaled."""
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                UPDATE slots SET state = ?, worker = NULL, lease_expires = NULL,
+                    updated_at = ?
+                WHERE cuid = ?
+                """,
+                (DONE, time.time(), cuid),
+            )
+
+    def release(self, cuid):
+        """
+        Returns a failed slot to the queue. It gets a new cuid, since the
+        failed completion's requests are logged under the old one.
+        """
+
+        with self.lock, self.conn:
+            self.conn.execute(
+                """
+                UPDATE slots SET cuid = ?, state = ?, worker = NULL,
+                    lease_expires = NULL, attempts = attempts + 1, updated_at = ?
+                WHERE cuid = ? AND state = ?
+                """,
+                (str(uuid.uuid4()), PENDING, time.time(), cuid, LEASED),
+            )
+
+    def reclaim(self):
+        """
+        Settles the slots of runs that died: slots whose rows were written
+        are done, the others are pending again.
+        """
+
+        with self.lock:
+            leased = self.conn.execute(
+                """
+                SELECT slots.cuid, units.model, units.survey, slots.worker,
+                    slots.lease_expires
+                FROM slots JOIN units ON units.id = slots.unit_id
+                WHERE slots.state = ?
+                """,
+                (LEASED,),
+            ).fetchall()
+
+        now = time.time()
+        alive = {}
+        rows = []
+        for cuid, model, survey, worker, lease_expires in leased:
+            if worker not in alive:
+                alive[worker] = is_worker_alive(worker)
+            if lease_expires < now or not alive[worker]:
+                rows.append((cuid, model, survey))
+
+        if not rows:
+            return
+
+        # write the rows dead runs left in their journals first. journals of
+        # live runs are locked and left alone
+        get_writer(OUTPUT_DIR).recover_journals()
+
+        written = set()
+        for model, survey in set([(model, survey) for _, model, survey in rows]):
+            written |= get_written_cuids(model, survey)
+
+        for cuid, _, _ in rows:
+            if cuid in written:
+                self.complete(cuid)
+            else:
+                self.release(cuid)
+
+        num_done = sum([cuid in written for cuid, _, _ in rows])
+        print(
+            f"Reclaimed {len(rows)} lease(s) of stopped runs: {num_done} done, "
+            f"{len(rows) - num_done} pending."
+        )
+
+    def get_pending(self):
+        """Returns the units with pending completions, with n of them."""
+
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT units.model, units.survey, units.prompt_uid, units.temperature,
+                    COUNT(*)
+                FROM units JOIN slots ON units.id = slots.unit_id
+                WHERE slots.state = ?
+                GROUP BY units.id
+                ORDER BY units.id
+                """,
+                (PENDING,),
+            ).fetchall()
+
+        return [
+            {
+                "model": model,
+                "survey": survey,
+                "prompt_uid": prompt_uid or None,
+                "temperature": temperature,
+                "n": n,
+            }
+            for model, survey, prompt_uid, temperature, n in rows
+        ]
+
+    def get_status(self):
+
+        with self.lock:
+            rows = self.conn.execute(
+                """
+                SELECT units.model, units.survey, units.prompt_uid, units.temperature,
+                    SUM(slots.state = ?), SUM(slots.state = ?), SUM(slots.state = ?),
+                    SUM(slots.attempts)
+                FROM units JOIN slots ON units.id = slots.unit_id
+                GROUP BY units.id
+                ORDER BY units.id
+                """,
+                (DONE, LEASED, PENDING),
+            ).fetchall()
+
+        return pd.DataFrame(
+            rows,
+            columns=[
+                "model",
+                "survey",
+                "prompt_uid",
+                "temperature",
+                DONE,
+                LEASED,
+                PENDING,
+                "retries",
+            ],
+        )
+
+
+def get_worker_id():
+    # host and pid let other runs on the host see when this run is gone
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def is_worker_alive(worker):
+
+    try:
+        host, pid, _ = worker.split(":", 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return True
+
+    # workers on other hosts are only reclaimed when their lease expires
+    if host != socket.gethostname():
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def get_written_cuids(model, survey):
+
+    file_path = os.path.join(
+        OUTPUT_DIR, get_provider(model), model, survey, f"{POLICIES}.csv"
+    )
+    if not os.path.exists(file_path):
+        return set()
+
+    # live runs may be appending, read whole batches only
+    with open(file_path, newline="", encoding="utf-8") as f:
+        lock_file(f, shared=True)
+        return set(pd.read_csv(f, usecols=["cuid"])["cuid"])
+
+
+def get_queue(path=None, lease_seconds=LEASE_SECONDS):
+
+    path = path if path else os.path.join(OUTPUT_DIR, QUEUE_FILE)
+
+    with _queues_lock:
+        if path not in _queues:
+            _queues[path] = JobQueue(path, lease_seconds)
+        return _queues[path]
+
+
+def get_units(manifest, surveys):
+    """Splits the jobs of a manifest dataframe into one unit per survey."""
+
+    # same surveys as prepare_job when a job has no survey
+    all_surveys = [s for s in surveys if s[0] != "~" and s != "template"]
+
+    units = []
+    for _, row in manifest.iterrows():
+
+        survey_names = [row["survey"]] if pd.notna(row["survey"]) else all_surveys
+        prompt_uid = row["prompt_uid"] if pd.notna(row["prompt_uid"]) else None
+        temperature = row["temperature"] if pd.notna(row["temperature"]) else 0
+
+        for survey in survey_names:
+            units.append(
+                {
+                    "model": row["model"],
+                    "survey": survey,
+                    "prompt_uid": prompt_uid,
+                    "temperature": temperature,
+                    "n": int(row["n"]),
+                }
+            )
+
+    return units
+
+
+def add_manifest(queue, manifest, surveys):
+    for unit in get_units(manifest, surveys):
+        queue.add(
+            unit["model"],
+            unit["survey"],
+            unit["prompt_uid"],
+            unit["temperature"],
+            unit["n"],
+        )
+
+
+def order_units(units, objective):
+    """Orders leased units with the scheduler and prints its projection."""
+
+    schedule = scheduler.plan(
+        [
+            {
+                "model": model,
+                "survey": survey,
+                "prompt_uid": prompt_uid,
+                "temperature": temperature,
+                "n": len(cuids),
+                "unit": i,
+            }
+            for i, ((model, survey, prompt_uid, temperature), cuids) in enumerate(
+                units
+            )
+        ],
+        objective,
+    )
+    scheduler.print_plan(schedule)
+
+    return [units[i] for i in schedule["unit"]]
+
+
+def run_queue(
+    queue,
+    concurrency=None,
+    max_repairs=0,
+    cache=False,
+    parquet=False,
+    store=False,
+    objective=None,
+    budget=None,
+    daily_budget=None,
+    adaptive=True,
+    preflight=True,
+    hedge=False,
+):
+    """
+    Leases the pending completions of the queue, LEASE_SLOTS at a time, and
+    runs them as jobs in this process until none are left. Completions that
+    fail, or are not sent once a budget is reached, are pending again for
+    the next run. With an objective ("cost" or "time"), the scheduler orders
+    the jobs of each lease.
+    """
+
+    worker = get_worker_id()
+    units = queue.lease(worker, LEASE_SLOTS)
+
+    if not units:
+        print("No pending completions in the queue.")
+        return []
+
+    # slots released from now on are left for the next run
+    started = time.time()
+
+    # keep the leases while the jobs run
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(queue.lease_seconds / 3):
+            queue.renew(worker)
+
+    renewer = threading.Thread(target=renew, name="queue-lease", daemon=True)
+    renewer.start()
+
+    all_jobs = []
+    try:
+        surveys = get_survey_params(deliberative_cases=True)
+        ledger = cost_ledger.open_session(budget, daily_budget)
+        engine = CompletionEngine(concurrency, adaptive)
+
+        # models are checked once per run, not once per lease
+        checked = set()
+
+        while units:
+
+            if objective:
+                units = order_units(units, objective)
+
+            jobs = []
+            for (model, survey, prompt_uid, temperature), cuids in units:
+                job = prepare_job(
+                    model,
+                    len(cuids),
+                    temperature,
+                    survey,
+                    prompt_uid,
+                    surveys=surveys,
+                    max_repairs=max_repairs,
+                    cache=cache,
+                    parquet=parquet,
+                    store=store,
+                    cuids=cuids,
+                    queue=queue,
+                    ledger=ledger,
+                    preflight=preflight and model not in checked,
+                    hedge=hedge,
+                )
+                checked.add(model)
+                if job is None or not job["completions"]:
+                    # e.g. API not setup or preflight failed, leave the slots
+                    # for another run
+                    for cuid in cuids:
+                        queue.release(cuid)
+                    continue
+                jobs.append(job)
+
+            if jobs:
+                print(f"\nRunning {len(jobs)} job(s) from the queue:")
+                for api in sorted(set(job["api"] for job in jobs)):
+                    print(f"- {api}: concurrency {engine.get_concurrency(api)}")
+
+                engine.run(run_jobs(engine, jobs))
+
+                for job in jobs:
+                    report_job(job)
+
+                # completions are marked done by the writer
+                flush_output()
+
+                all_jobs += jobs
+
+            units = queue.lease(worker, LEASE_SLOTS, before=started)
+
+        if not all_jobs:
+            print("No jobs to run.")
+
+    finally:
+        stop.set()
+
+    return all_jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Queues generation jobs and runs them, resuming exactly after a crash."
+    )
+    parser.add_argument(
+        "--queue",
+        type=str,
+        required=False,
+        default=None,
+        help=f"SQLite file, defaults to {OUTPUT_DIR}/{QUEUE_FILE}",
+    )
+
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = commands.add_parser("add", help="add the jobs of a manifest csv file")
+    add_parser.add_argument("manifest", type=str, help="path to the manifest csv file")
+
+    run_parser = commands.add_parser("run", help="run the pending completions")
+    run_parser.add_argument(
+        "--concurrency",
+        type=int,
+        required=False,
+        default=None,
+        help="max completions in flight per API, the starting point with adaptive concurrency",
+    )
+    run_parser.add_argument(
+        "--fixed-concurrency",
+        action="store_true",
+        help="keep the concurrency fixed instead of adapting it to throttling and latency",
+    )
+    run_parser.add_argument(
+        "--skip-preflight",
+        action="store_true",
+        help="do not check the credentials and models with a tiny request first",
+    )
+    run_parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="send a duplicate of turns slower than the p95 latency, first reply wins",
+    )
+    run_parser.add_argument(
+        "--repairs",
+        type=int,
+        required=False,
+        default=0,
+        help="max follow-up turns per completion to fix invalid responses",
+    )
+    run_parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse cached responses to identical requests at temperature 0",
+    )
+    run_parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help="also write the completions to the partitioned parquet store",
+    )
+    run_parser.add_argument(
+        "--store",
+        action="store_true",
+        help="also save completions, requests and progress in the SQLite store",
+    )
+    run_parser.add_argument(
+        "--order",
+        type=str,
+        required=False,
+        default=None,
+        choices=scheduler.OBJECTIVES,
+        help="run the cheapest or the fastest jobs first, see scheduler.py",
+    )
+    run_parser.add_argument(
+        "--budget",
+        type=float,
+        required=False,
+        default=None,
+        help="max cost of this run in USD, no new requests are sent once reached",
+    )
+    run_parser.add_argument(
+        "--daily-budget",
+        type=float,
+        required=False,
+        default=None,
+        help="max cost of all runs today (UTC) in USD, across processes",
+    )
+    run_parser.add_argument(
+        "--metrics-port",
+        type=int,
+        required=False,
+        default=None,
+        help="serve Prometheus metrics on this local port while running",
+    )
+    run_parser.add_argument(
+        "--metrics-file",
+        type=str,
+        required=False,
+        default=None,
+        help="write Prometheus metrics to this textfile while running",
+    )
+    run_parser.add_argument(
+        "--trace",
+        type=str,
+        required=False,
+        default=None,
+        help="append spans of each completion to this JSONL file, see tracing.py",
+    )
+
+    commands.add_parser("status", help="show the completions left per job")
+
+    args = parser.parse_args()
+
+    queue = get_queue(args.queue)
+
+    if args.command == "add":
+        surveys = get_survey_params(deliberative_cases=True)
+        add_manifest(queue, read_manifest(args.manifest), surveys)
+
+    elif args.command == "run":
+        concurrency = None
+        if args.concurrency:
+            # apply the same limit to every API in the queue
+            models = queue.get_status()["model"].unique()
+            concurrency = {get_api(model): args.concurrency for model in models}
+
+        metrics.start(args.metrics_port, args.metrics_file)
+        tracing.start(args.trace)
+
+        run_queue(
+            queue,
+            concurrency,
+            args.repairs,
+            args.cache,
+            args.parquet,
+            args.store,
+            args.order,
+            args.budget,
+            args.daily_budget,
+            not args.fixed_concurrency,
+            not args.skip_preflight,
+            args.hedge,
+        )
+
+        metrics.stop()
+        tracing.stop()
+
+    print(queue.get_status().to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
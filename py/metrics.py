@@ -0,0 +1,242 @@
+import re
+import threading
+
+from utils import get_provider
+
+# optional Prometheus/OpenMetrics instrumentation of a run. metrics are off
+# unless start() is called (--metrics-port / --metrics-file), so runs
+# without them do not need prometheus_client. they are served on a local
+# http endpoint for a Prometheus server to scrape, and/or written to a
+# textfile every TEXTFILE_INTERVAL seconds for node_exporter's textfile
+# collector. turn is the data type of a request: considerations, policies
+# or reasons.
+NAMESPACE = "drillm"
+TEXTFILE_INTERVAL = 15  # seconds
+METRICS_HOST = "127.0.0.1"
+
+# request latency, from seconds to reasoning models' minutes
+LATENCY_BUCKETS = [0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1200]
+TOKENS_PER_SECOND_BUCKETS = [5, 10, 20, 50, 100, 200, 500, 1000]
+
+_metrics = None
+_lock = threading.Lock()
+
+
+def get_prometheus_client():
+    try:
+        import prometheus_client
+    except ImportError as e:
+        raise ImportError(
+            "Metrics require prometheus_client, install it with "
+            "`pipenv install prometheus-client`."
+        ) from e
+    return prometheus_client
+
+
+class Metrics:
+    """
+    The run's metrics in their own registry.
+
+    Args:
+      textfile: optional path of the textfile export.
+    """
+
+    def __init__(self, textfile=None):
+        prom = get_prometheus_client()
+
+        self.prom = prom
+        self.registry = prom.CollectorRegistry()
+        self.textfile = textfile
+        self.stopped = threading.Event()
+
+        def counter(name, doc, labels):
+            return prom.Counter(
+                name, doc, labels, namespace=NAMESPACE, registry=self.registry
+            )
+
+        def gauge(name, doc, labels):
+            return prom.Gauge(
+                name, doc, labels, namespace=NAMESPACE, registry=self.registry
+            )
+
+        def histogram(name, doc, labels, buckets):
+            return prom.Histogram(
+                name,
+                doc,
+                labels,
+                namespace=NAMESPACE,
+                registry=self.registry,
+                buckets=buckets,
+            )
+
+        turn_labels = ["provider", "model", "turn"]
+
+        self.requests = counter(
+            "requests",
+            "LLM requests by outcome: success, cached, throttled, timeout or error.",
+            turn_labels + ["outcome"],
+        )
+        self.latency = histogram(
+            "request_latency_seconds",
+            "Latency of successful LLM requests.",
+            turn_labels,
+            LATENCY_BUCKETS,
+        )
+        self.tokens = counter(
+            "tokens", "Tokens of LLM requests.", ["provider", "model", "direction"]
+        )
+        self.tokens_per_second = histogram(
+            "output_tokens_per_second",
+            "Output tokens per second of successful LLM requests.",
+            ["provider", "model"],
+            TOKENS_PER_SECOND_BUCKETS,
+        )
+        self.invalid = counter(
+            "invalid_responses",
+            "Responses that failed validation, by reason.",
+            turn_labels + ["reason"],
+        )
+        self.repairs = counter(
+            "repairs", "Repair turns sent to fix invalid responses.", turn_labels
+        )
+        self.hedges = counter(
+            "hedges", "Duplicates sent for requests slower than the p95.", turn_labels
+        )
+        self.deadline_timeouts = counter(
+            "deadline_timeouts",
+            "Requests that ran past their turn's deadline.",
+            turn_labels,
+        )
+        self.retries = counter(
+            "retries",
+            "Failed completions returned to the job queue, for the next run.",
+            ["provider", "model"],
+        )
+        self.completions = counter(
+            "completions",
+            "Handled completions by outcome: success, invalid, error or skipped.",
+            ["provider", "model", "outcome"],
+        )
+        self.waiting = gauge(
+            "queue_depth", "Completions waiting for a concurrency slot.", ["api"]
+        )
+        self.in_flight = gauge("in_flight", "Completions in flight.", ["api"])
+        self.concurrency = gauge(
+            "concurrency_limit", "Current concurrency limit.", ["api"]
+        )
+
+    def write_textfile(self):
+        if self.textfile:
+            self.prom.write_to_textfile(self.textfile, self.registry)
+
+    def export(self):
+        # write periodically until stopped
+        while not self.stopped.wait(TEXTFILE_INTERVAL):
+            self.write_textfile()
+
+
+def start(port=None, textfile=None):
+    """Turns metrics on, served on port and/or written to textfile."""
+
+    global _metrics
+
+    if port is None and textfile is None:
+        return None
+
+    with _lock:
+        if _metrics is None:
+            _metrics = Metrics(textfile)
+
+            if port is not None:
+                _metrics.prom.start_http_server(
+                    port, addr=METRICS_HOST, registry=_metrics.registry
+                )
+                print(f"Metrics: http://{METRICS_HOST}:{port}/metrics")
+
+            if textfile is not None:
+                threading.Thread(
+                    target=_metrics.export, name="metrics-textfile", daemon=True
+                ).start()
+                print(f"Metrics: {textfile}")
+
+    return _metrics
+
+
+def stop():
+    """Writes the final textfile export."""
+
+    if _metrics is None:
+        return
+
+    _metrics.stopped.set()
+    _metrics.write_textfile()
+
+
+def get_reason(error):
+    # drop counts, e.g. "Policies length mismatch (4/5)." -> "Policies length mismatch"
+    return re.sub(r"\s*\(.*?\)", "", str(error)).strip().rstrip(".")
+
+
+def observe_request(
+    model, turn, outcome, latency=None, input_tokens=0, output_tokens=0
+):
+    if _metrics is None:
+        return
+
+    provider = get_provider(model)
+    _metrics.requests.labels(provider, model, turn, outcome).inc()
+
+    if outcome != "success":
+        return
+
+    _metrics.latency.labels(provider, model, turn).observe(latency)
+    _metrics.tokens.labels(provider, model, "input").inc(input_tokens)
+    _metrics.tokens.labels(provider, model, "output").inc(output_tokens)
+    if latency > 0:
+        _metrics.tokens_per_second.labels(provider, model).observe(
+            output_tokens / latency
+        )
+
+
+def observe_invalid(model, turn, error):
+    if _metrics is None:
+        return
+    _metrics.invalid.labels(get_provider(model), model, turn, get_reason(error)).inc()
+
+
+def observe_repair(model, turn):
+    if _metrics is None:
+        return
+    _metrics.repairs.labels(get_provider(model), model, turn).inc()
+
+
+def observe_hedge(model, turn):
+    if _metrics is None:
+        return
+    _metrics.hedges.labels(get_provider(model), model, turn).inc()
+
+
+def observe_deadline_timeout(model, turn):
+    if _metrics is None:
+        return
+    _metrics.deadline_timeouts.labels(get_provider(model), model, turn).inc()
+
+
+def observe_retry(model):
+    if _metrics is None:
+        return
+    _metrics.retries.labels(get_provider(model), model).inc()
+
+
+def observe_completion(model, outcome):
+    if _metrics is None:
+        return
+    _metrics.completions.labels(get_provider(model), model, outcome).inc()
+
+
+def set_queue(api, waiting, in_flight, limit):
+    if _metrics is None:
+        return
+    _metrics.waiting.labels(api).set(waiting)
+    _metrics.in_flight.labels(api).set(in_flight)
+    _metrics.concurrency.labels(api).set(limit)
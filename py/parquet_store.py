@@ -0,0 +1,314 @@
+import argparse
+import glob
+import json
+import os
+import re
+import time
+import uuid
+from urllib.parse import quote
+
+import pandas as pd
+
+from utils import CONSIDERATIONS, OUTPUT_DIR, POLICIES, REASONS, get_provider
+from writer import get_writer
+
+# optional columnar copy of the generated data, one hive-partitioned parquet
+# dataset per data type:
+#   {PARQUET_DIR}/{data_type}/provider=/model=/survey=/prompt_uid=/part-*.parquet
+# every writer flush appends one part file (a single row group) to each
+# partition it touched, and a partition is compacted into one file once it
+# has COMPACT_PARTS parts. pyarrow is only imported when the store is used.
+PARQUET_DIR = "llm_data_parquet"
+PARQUET_FORMAT = "parquet"
+COMPACT_PARTS = 16
+PARTITIONS = ["provider", "model", "survey", "prompt_uid"]
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"  # pyarrow's default for nulls
+
+# statement columns are stored as P1.. / C1.., their text is kept in the
+# file metadata under this key
+STATEMENTS_KEY = b"statements"
+
+
+def get_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "The parquet store requires pyarrow, install it with `pipenv install pyarrow`."
+        ) from e
+    return pa, pq, ds
+
+
+def get_partition_value(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return NULL_PARTITION
+    # model names may contain path separators, e.g. meta-llama/Llama-3
+    return quote(str(value), safe="")
+
+
+def get_partition_path(
+    data_type, provider, model, survey, prompt_uid, root=PARQUET_DIR
+):
+    values = [provider, model, survey, prompt_uid]
+    return os.path.join(
+        root,
+        data_type,
+        *[f"{name}={get_partition_value(v)}" for name, v in zip(PARTITIONS, values)],
+    )
+
+
+def append_data_to_dataset(survey, model, new_df, data_type, root=PARQUET_DIR):
+    """Queues rows for the parquet dataset, like utils.append_data_to_file."""
+
+    provider = get_provider(model)
+
+    for row in new_df.to_dict(orient="records"):
+        path = get_partition_path(
+            data_type, provider, model, survey, row["prompt_uid"], root
+        )
+        get_writer(OUTPUT_DIR).write(
+            path, new_df.columns, list(row.values()), PARQUET_FORMAT
+        )
+
+
+def get_schema(columns):
+    pa, _, _ = get_pyarrow()
+
+    types = {
+        "cuid": pa.string(),
+        "created_at": pa.timestamp("us", tz="UTC"),
+        "temperature": pa.float64(),
+        "input_tokens": pa.int32(),
+        "output_tokens": pa.int32(),
+        "reason": pa.string(),
+        "repairs": pa.int16(),
+    }
+
+    # ranks and likert ratings are small integers
+    return pa.schema([(c, types.get(c, pa.int8())) for c in columns])
+
+
+def encode_rows(rows):
+    """Converts writer rows of (columns, values) to a compact arrow table."""
+
+    pa, _, _ = get_pyarrow()
+
+    df = pd.DataFrame([dict(zip(columns, values)) for columns, values in rows])
+
+    # partition columns are encoded in the path
+    df = df.drop(columns=[c for c in PARTITIONS if c in df.columns])
+
+    statements = {}
+    names = {}
+    for column in df.columns:
+        match = re.match(r"^([PC]\d+)\. ", column)
+        if match:
+            names[column] = match.group(1)
+            statements[match.group(1)] = column[match.end() :]
+    df = df.rename(columns=names)
+
+    # rows recovered from the journal have string dates
+    df["created_at"] = pd.to_datetime(df["created_at"], utc=True, format="ISO8601")
+
+    schema = get_schema(df.columns).with_metadata(
+        {STATEMENTS_KEY: json.dumps(statements, ensure_ascii=False)}
+    )
+
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def get_parts(path):
+    return sorted(glob.glob(os.path.join(path, "part-*.parquet")))
+
+
+def write_part(path, table):
+    _, pq, _ = get_pyarrow()
+
+    os.makedirs(path, exist_ok=True)
+
+    # readers skip dot files, so a part is only visible once fully written
+    name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+    tmp_path = os.path.join(path, f".{name}")
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, os.path.join(path, name))
+
+
+def append_rows(path, rows):
+    """Appends rows to a partition as a new part file. Called by the writer."""
+
+    write_part(path, encode_rows(rows))
+
+    if len(get_parts(path)) >= COMPACT_PARTS:
+        compact_partition(path)
+
+
+def compact_partition(path):
+    """
+    Merges the part files of a partition into one file.
+
+    Returns:
+      The number of merged part files.
+    """
+
+    pa, pq, _ = get_pyarrow()
+
+    parts = get_parts(path)
+    if len(parts) < 2:
+        return 0
+
+    tables = [pq.read_table(part, partitioning=None) for part in parts]
+    table = pa.concat_tables(tables, promote_options="default")
+    table = table.replace_schema_metadata(tables[-1].schema.metadata)
+
+    # a compaction interrupted before removing its parts leaves duplicates,
+    # which are dropped on the next one
+    df = table.to_pandas().drop_duplicates("cuid", keep="first")
+    table = pa.Table.from_pandas(df, schema=table.schema, preserve_index=False)
+
+    write_part(path, table)
+    for part in parts:
+        os.remove(part)
+
+    return len(parts)
+
+
+def compact(root=PARQUET_DIR, min_parts=2):
+    """Compacts every partition with at least min_parts part files."""
+
+    num_partitions = 0
+    num_parts = 0
+
+    for dir_path, _, file_names in os.walk(root):
+        if sum([name.startswith("part-") for name in file_names]) < min_parts:
+            continue
+        num_parts += compact_partition(dir_path)
+        num_partitions += 1
+
+    print(f"Compacted {num_parts} part file(s) in {num_partitions} partition(s).")
+
+
+def get_filter(filters):
+    _, _, ds = get_pyarrow()
+
+    expression = None
+    for name, value in filters.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            condition = ds.field(name).isin(list(value))
+        else:
+            condition = ds.field(name) == value
+        expression = condition if expression is None else expression & condition
+
+    return expression
+
+
+def read_data(
+    data_type,
+    model=None,
+    survey=None,
+    temperature=None,
+    prompt_uid=None,
+    provider=None,
+    columns=None,
+    root=PARQUET_DIR,
+):
+    """
+    Reads a data type into a dataframe. Filters take a value or a list of
+    values. Partition filters (provider, model, survey, prompt_uid) skip
+    whole directories, the temperature filter skips row groups by their
+    statistics. Partition columns are returned as categoricals.
+    """
+
+    pa, _, ds = get_pyarrow()
+
+    base_dir = os.path.join(root, data_type)
+    if not os.path.isdir(base_dir):
+        return pd.DataFrame()
+
+    partitioning = ds.partitioning(
+        pa.schema([(name, pa.string()) for name in PARTITIONS]), flavor="hive"
+    )
+
+    # list the matching partitions' files
+    dataset = ds.dataset(base_dir, format="parquet", partitioning=partitioning)
+    partition_filter = get_filter(
+        {
+            "provider": provider,
+            "model": model,
+            "survey": survey,
+            "prompt_uid": prompt_uid,
+        }
+    )
+    fragments = list(dataset.get_fragments(filter=partition_filter))
+    if not fragments:
+        return pd.DataFrame()
+
+    # surveys have different numbers of statements
+    schema = pa.unify_schemas(
+        [fragment.physical_schema for fragment in fragments] + [partitioning.schema]
+    )
+    dataset = ds.dataset(
+        [fragment.path for fragment in fragments],
+        schema=schema,
+        format="parquet",
+        partitioning=partitioning,
+        partition_base_dir=base_dir,
+    )
+
+    row_filter = get_filter({"temperature": temperature})
+    if partition_filter is not None:
+        row_filter = (
+            partition_filter if row_filter is None else partition_filter & row_filter
+        )
+
+    df = dataset.to_table(columns=columns, filter=row_filter).to_pandas()
+
+    for name in PARTITIONS:
+        if name in df.columns:
+            df[name] = df[name].astype("category")
+
+    return df.drop_duplicates("cuid") if "cuid" in df.columns else df
+
+
+def get_statements(
+    data_type, provider, model, survey, prompt_uid=None, root=PARQUET_DIR
+):
+    """Returns the statement text of each P/C column of a partition."""
+
+    _, pq, _ = get_pyarrow()
+
+    path = get_partition_path(data_type, provider, model, survey, prompt_uid, root)
+    parts = get_parts(path)
+    if not parts:
+        return {}
+
+    metadata = pq.read_schema(parts[-1]).metadata or {}
+    return json.loads(metadata.get(STATEMENTS_KEY, b"{}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compacts the part files of the parquet datasets."
+    )
+    parser.add_argument(
+        "--root",
+        type=str,
+        required=False,
+        default=PARQUET_DIR,
+        help="parquet datasets directory",
+    )
+
+    args = parser.parse_args()
+
+    for data_type in [POLICIES, CONSIDERATIONS, REASONS]:
+        path = os.path.join(args.root, data_type)
+        if os.path.isdir(path):
+            print(f"{data_type}:")
+            compact(path)
+
+
+if __name__ == "__main__":
+    main()
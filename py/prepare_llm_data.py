@@ -2,7 +2,7 @@ import pandas as pd
 import os
 
 from utils import LLM_INFO_PATH
-from surveys import SURVEYS_PATH
+from surveys import get_survey_names
 
 
 def get_models(file_path=LLM_INFO_PATH):
@@ -29,14 +29,6 @@ def get_models_with_data(file_path=LLM_INFO_PATH):
     return list(df[["provider", "model"]].itertuples(index=False, name=None))
 
 
-def get_survey_names(file_path=SURVEYS_PATH):
-    # Load the Excel file
-    excel_file = pd.ExcelFile(file_path)
-
-    # Return the sheet names
-    return excel_file.sheet_names
-
-
 def get_data_file_name(provider, model, survey, file_type):
     return f"llm_data/{provider}/{model}/{survey}_{file_type}.csv"
 
@@ -0,0 +1,181 @@
+import json
+import os
+
+import pandas as pd
+
+# each {provider}/{model}/{survey} output directory keeps a small sidecar with
+# the number of completions in its policies file by temperature and
+# prompt_uid, so progress reports do not read the data files. the sidecar
+# records the size and mtime of the file it was built from, the writer
+# updates it after every append, and a sidecar that does not match its file,
+# e.g. after a manual edit, is rebuilt from the file.
+INDEX_FILE = ".progress_index.json"
+INDEXED_FILE = "policies.csv"  # all data types have the same rows
+
+
+def get_stat(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def get_key(temperature, prompt_uid):
+    temperature = None if pd.isna(temperature) else float(temperature)
+    prompt_uid = None if pd.isna(prompt_uid) else str(prompt_uid)
+    return temperature, prompt_uid
+
+
+def read_index(dir_path):
+
+    index_path = os.path.join(dir_path, INDEX_FILE)
+    if not os.path.isfile(index_path):
+        return None
+
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    groups = {}
+    for group in index["groups"]:
+        key = (group["temperature"], group["prompt_uid"])
+        groups[key] = [group["rows"], group["last_created_at"]]
+
+    return {"stat": index["stat"], "groups": groups}
+
+
+def write_index(dir_path, index):
+
+    data = {
+        "source": INDEXED_FILE,
+        "stat": index["stat"],
+        "groups": [
+            {
+                "temperature": temperature,
+                "prompt_uid": prompt_uid,
+                "rows": rows,
+                "last_created_at": last_created_at,
+            }
+            for (temperature, prompt_uid), (rows, last_created_at) in index[
+                "groups"
+            ].items()
+        ],
+    }
+
+    index_path = os.path.join(dir_path, INDEX_FILE)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, index_path)
+
+
+def add_rows(groups, rows):
+    """Adds (temperature, prompt_uid, created_at) rows to the group counts."""
+
+    for temperature, prompt_uid, created_at in rows:
+        key = get_key(temperature, prompt_uid)
+        group = groups.setdefault(key, [0, None])
+        group[0] += 1
+        if pd.notna(created_at):
+            created_at = str(created_at)
+            if group[1] is None or created_at > group[1]:
+                group[1] = created_at
+
+
+def scan(dir_path):
+    """Rebuilds a directory's index from its policies file."""
+
+    file_path = os.path.join(dir_path, INDEXED_FILE)
+    stat = get_stat(file_path)
+
+    groups = {}
+    if stat is not None:
+        df = pd.read_csv(file_path)
+        for column in ["temperature", "prompt_uid", "created_at"]:
+            if column not in df.columns:
+                df[column] = None
+        add_rows(
+            groups,
+            df[["temperature", "prompt_uid", "created_at"]].itertuples(
+                index=False, name=None
+            ),
+        )
+
+    index = {"stat": stat, "groups": groups}
+    if stat is not None:
+        write_index(dir_path, index)
+
+    return index
+
+
+def update(file_path, header, data, stat_before):
+    """
+    Counts rows the writer appended to a policies file.
+
+    Args:
+      header: the file's columns.
+      data: the appended rows, aligned to header.
+      stat_before: the file's [size, mtime_ns] before the append, or None.
+    """
+
+    dir_path = os.path.dirname(file_path)
+    index = read_index(dir_path)
+
+    if stat_before is None:
+        # new file, nothing to read
+        index = {"stat": None, "groups": {}}
+    elif index is None or index["stat"] != stat_before:
+        scan(dir_path)
+        return
+
+    positions = [
+        header.index(column) if column in header else None
+        for column in ["temperature", "prompt_uid", "created_at"]
+    ]
+    add_rows(
+        index["groups"],
+        [[None if i is None else row[i] for i in positions] for row in data],
+    )
+
+    index["stat"] = get_stat(file_path)
+    write_index(dir_path, index)
+
+
+def get_index(dir_path):
+    """Returns the directory's index, rebuilt only if it is stale."""
+
+    index = read_index(dir_path)
+    if index is not None and index["stat"] == get_stat(
+        os.path.join(dir_path, INDEXED_FILE)
+    ):
+        return index
+
+    return scan(dir_path)
+
+
+def get_progress(dir_path, temperature=None, prompt_uid=None):
+    """
+    Returns (completions, last created_at) of an output directory, optionally
+    for one temperature and system prompt. last created_at is None without
+    completions.
+    """
+
+    index = get_index(dir_path)
+
+    num_rows = 0
+    last_created_at = None
+    for (g_temperature, g_prompt_uid), (rows, created_at) in index["groups"].items():
+        if temperature is not None and g_temperature != float(temperature):
+            continue
+        if prompt_uid is not None and g_prompt_uid != prompt_uid:
+            continue
+        num_rows += rows
+        if created_at is not None and (
+            last_created_at is None or created_at > last_created_at
+        ):
+            last_created_at = created_at
+
+    return num_rows, last_created_at
@@ -1,14 +1,19 @@
-import pandas as pd
+import registry
 from utils import PROMPT_S
 
+PROMPTS_PATH = "prompts/prompts.csv"
+
+
+def get_prompts_table():
+    return registry.get_table(PROMPTS_PATH, keys=("uid",))
+
 
 def get_system_prompts():
-    return pd.read_csv("prompts/prompts.csv")
+    return get_prompts_table().get_df()
 
 
 def get_prompt_uids():
-    prompts_df = get_system_prompts()
-    return prompts_df["uid"].tolist()
+    return get_prompts_table().get_df()["uid"].tolist()
 
 
 def build_system_prompt(uid):
@@ -17,19 +22,17 @@ def build_system_prompt(uid):
     if uid == "all":
         return None
 
-    prompts_df = get_system_prompts()
-
     # get row with uid
-    row = prompts_df[prompts_df["uid"] == uid]
+    row = get_prompts_table().get("uid", uid)
 
     # check if row is empty
-    if row.empty:
+    if row is None:
         raise ValueError(f"Prompt with uid {uid} not found in prompts.csv")
 
     # get role and description
-    role = row["role"].values[0]
-    description = row["description"].values[0]
-    article = row["article"].values[0]
+    role = row["role"]
+    description = row["description"]
+    article = row["article"]
 
     # build system prompt
     system_prompt = PROMPT_S.format(article, role, description)
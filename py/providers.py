@@ -0,0 +1,70 @@
+import importlib
+import threading
+
+from aimd import is_throttled
+from utils import get_api
+
+# adapter module of each API, as named in the "api" column of LLM_INFO_PATH.
+# modules are imported on first use, so a run only loads the SDK it needs.
+PROVIDER_MODULES = {
+    "Anthropic API": "data_anthropic",
+    "Cohere API": "data_cohere",
+    "DeepSeek API": "data_deepseek",
+    "Google Could": "data_google",
+    "ollama": "data_ollama",
+    "Mistral AI API": "data_mistral",
+    "OpenAI API": "data_openai",
+    "Alibaba Cloud": "data_alibaba",
+    "Together AI": "data_together",
+    "xAI API": "data_xai",
+}
+
+_import_lock = threading.Lock()
+
+# preflight result of each model in this process, None if it passed
+_probes = {}
+
+
+def get_api_module(api):
+
+    if api not in PROVIDER_MODULES:
+        raise ValueError(f"The API {api} is not setup!")
+
+    with _import_lock:
+        return importlib.import_module(PROVIDER_MODULES[api])
+
+
+def get_llm_provider(model):
+    """
+    Returns the adapter module of the model's API, which exports a
+    DataGenerator as `generator` and its `generate_data`.
+    """
+    try:
+        return get_api_module(get_api(model))
+    except ValueError as e:
+        raise ValueError(f"The API for {model} is not setup!") from e
+
+
+def probe_model(model):
+    """
+    Sends one tiny request to the model, once per process, so bad
+    credentials or model names fail before a run. Returns None if the model
+    can be used, or the error. A throttled or overloaded API passes, the
+    circuit breaker takes care of outages.
+    """
+
+    if model in _probes:
+        return _probes[model]
+
+    try:
+        get_llm_provider(model).generator.probe(model)
+        error = None
+    except Exception as e:
+        if is_throttled(e):
+            print(f"Preflight of {model} was throttled, continuing: {e}")
+            error = None
+        else:
+            error = e
+
+    _probes[model] = error
+    return error
@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+import pandas as pd
+
+from utils import get_api, get_llm_info
+
+# rate limits are read from the "rpm" (requests per minute) and "tpm"
+# (tokens per minute) columns in utils.LLM_INFO_PATH. limits apply per API, so
+# when several models share an API the strictest value is used. without a
+# column there is no limit of its kind, model lists from before rate limits
+# run as they did. once a column is added, APIs left empty in it fall back to
+# the defaults below.
+RPM_COLUMN = "rpm"
+TPM_COLUMN = "tpm"
+DEFAULT_RPM = 60
+DEFAULT_TPM = None  # no token limit
+
+# rough token estimate used before the real usage is known
+CHARS_PER_TOKEN = 4
+EXPECTED_OUTPUT_TOKENS = 256
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Bucket that refills continuously up to `per_minute` units per minute.
+    The level may go negative when actual usage exceeds an estimate, which
+    delays later requests until the debt is repaid.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(
+            self.capacity, self.level + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        # requests larger than the bucket only wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount):
+        self.level -= amount
+
+
+class RateLimiter:
+    """
+    Thread-safe requests-per-minute and tokens-per-minute limiter for one API.
+
+    Args:
+      rpm: max requests per minute, or None for no limit.
+      tpm: max tokens per minute, or None for no limit.
+    """
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.lock = threading.Lock()
+
+    def acquire(self, estimate=0):
+
+        while True:
+            with self.lock:
+                wait = 0
+                for bucket, amount in [(self.requests, 1), (self.tokens, estimate)]:
+                    if bucket is not None:
+                        bucket.refill()
+                        wait = max(wait, bucket.wait_time(amount))
+
+                if wait == 0:
+                    if self.requests is not None:
+                        self.requests.consume(1)
+                    if self.tokens is not None:
+                        self.tokens.consume(estimate)
+                    return
+
+            # sleep outside the lock so other threads can refill
+            time.sleep(wait)
+
+    def settle(self, estimate, used):
+        # correct the token bucket once the actual usage is known
+        if self.tokens is None or used is None:
+            return
+        with self.lock:
+            self.tokens.consume(used - estimate)
+
+
+def read_limit(df, column, default):
+
+    if column not in df.columns:
+        return None
+
+    values = df[column].dropna()
+    if values.empty:
+        return default
+
+    return int(values.min())
+
+
+def get_limiter(api):
+
+    with _limiters_lock:
+        if api not in _limiters:
+            df = pd.DataFrame(get_llm_info().get_all("api", api))
+            _limiters[api] = RateLimiter(
+                rpm=read_limit(df, RPM_COLUMN, DEFAULT_RPM),
+                tpm=read_limit(df, TPM_COLUMN, DEFAULT_TPM),
+            )
+        return _limiters[api]
+
+
+def estimate_tokens(messages, system_prompt=None):
+    text = json.dumps(messages, default=str) + (system_prompt or "")
+    return len(text) // CHARS_PER_TOKEN + EXPECTED_OUTPUT_TOKENS
+
+
+def acquire(model, messages, system_prompt=None):
+    """
+    Blocks until the model's API has budget for one more request, and
+    returns the token estimate to pass to settle().
+    """
+    estimate = estimate_tokens(messages, system_prompt)
+    get_limiter(get_api(model)).acquire(estimate)
+    return estimate
+
+
+def settle(model, estimate, used):
+    get_limiter(get_api(model)).settle(estimate, used)
@@ -0,0 +1,77 @@
+import os
+import threading
+
+import pandas as pd
+
+# in-memory copies of the csv files that are looked up on every request
+# (models, system prompts, deliberative cases). each file is parsed once,
+# indexed by its key columns, and parsed again only when its mtime changes.
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+class Table:
+    """
+    A csv file indexed by one or more key columns.
+
+    Args:
+      path: csv file path.
+      keys: columns to index, for O(1) lookups by value.
+    """
+
+    def __init__(self, path, keys=()):
+        self.path = path
+        self.keys = keys
+        self.mtime = None
+        self.df = None
+        self.index = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+
+        mtime = os.stat(self.path).st_mtime_ns
+
+        with self.lock:
+            if mtime == self.mtime:
+                return
+
+            df = pd.read_csv(self.path)
+
+            index = {}
+            records = df.to_dict(orient="records")
+            for key in self.keys:
+                index[key] = {}
+                if key not in df.columns:
+                    continue
+                for record in records:
+                    index[key].setdefault(record[key], []).append(record)
+
+            self.df = df
+            self.index = index
+            self.mtime = mtime
+
+    def get_df(self):
+        self.refresh()
+        # callers may modify the dataframe
+        return self.df.copy()
+
+    def get_all(self, key, value):
+        self.refresh()
+        return [dict(record) for record in self.index[key].get(value, [])]
+
+    def get(self, key, value):
+        records = self.get_all(key, value)
+        return records[0] if records else None
+
+    def get_values(self, key):
+        self.refresh()
+        return list(self.index[key].keys())
+
+
+def get_table(path, keys=()):
+
+    with _tables_lock:
+        if path not in _tables:
+            _tables[path] = Table(path, keys)
+        return _tables[path]
@@ -0,0 +1,386 @@
+import argparse
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from prompts import build_system_prompt, get_prompt_uids
+from surveys import get_survey_params, get_survey_statements
+from utils import (
+    CONSIDERATIONS,
+    OUTPUT_DIR,
+    POLICIES,
+    REASONS,
+    REASONS_COLUMNS,
+    REPAIRS,
+    REPAIRS_COLUMNS,
+    check_considerations,
+    check_policies,
+    get_output_columns,
+    parse_numbers_from_response,
+    parse_reasoning_from_response,
+    split_prompt,
+)
+
+# rebuilds the policies, considerations, reasons and repairs files from the request
+# logs, with the current parser and checks, without any API calls.
+REPLAY_DIR = "llm_data_replay"
+REQUEST_LOG_FILE = "request_log.csv"
+
+# request logs grow across runs, so they are read in chunks. the turns of a
+# completion are kept until all of them are read, concurrent completions
+# interleave in the log
+CHUNK_ROWS = 10000
+
+# request logs written by the R pipeline use other column names
+LOG_ALIASES = {
+    "uuid": "cuid",
+    "created_at_utc": "date",
+    "role_uid": "prompt_uid",
+    "prompt_tokens": "input_tokens",
+    "completion_tokens": "output_tokens",
+}
+
+# completion outcomes
+SUCCESS = "success"
+INVALID = "invalid"
+INCOMPLETE = "incomplete"  # missing turns, e.g. request errors
+UNMATCHED = "unmatched"  # statements no longer match the survey
+
+
+def get_request_logs(input_dir=OUTPUT_DIR):
+    return sorted(glob.glob(os.path.join(input_dir, "*", "*", REQUEST_LOG_FILE)))
+
+
+def read_log(log_file_path, usecols=None):
+    """Yields the request log in chunks, with its columns renamed."""
+
+    def is_used(column):
+        return usecols is None or LOG_ALIASES.get(column, column) in usecols
+
+    for chunk in pd.read_csv(log_file_path, usecols=is_used, chunksize=CHUNK_ROWS):
+        yield chunk.rename(columns=LOG_ALIASES)
+
+
+def get_turn_counts(log_file_path):
+    """Returns the number of logged requests of each completion."""
+
+    counts = {}
+    for chunk in read_log(log_file_path, usecols=["cuid"]):
+        for cuid, n in chunk["cuid"].value_counts().items():
+            counts[cuid] = counts.get(cuid, 0) + n
+
+    return counts
+
+
+def get_completions(log_file_path):
+    """Yields (cuid, rows) for each completion, once all its rows are read."""
+
+    counts = get_turn_counts(log_file_path)
+
+    pending = {}
+    for chunk in read_log(log_file_path):
+        for cuid, rows in chunk.groupby("cuid", sort=False):
+            pending.setdefault(cuid, []).append(rows)
+            counts[cuid] -= len(rows)
+            if counts[cuid] == 0:
+                yield cuid, pd.concat(pending.pop(cuid))
+
+
+def get_prompt_uids_by_text():
+
+    # map system prompts back to their uids
+    prompt_uids = {}
+    for uid in get_prompt_uids():
+        prompt_uids[build_system_prompt(uid)] = uid
+
+    return prompt_uids
+
+
+def read_survey_params():
+
+    surveys = get_survey_params(deliberative_cases=True)
+
+    survey_params = {}
+    for survey in surveys:
+        try:
+            survey_params[survey] = get_survey_statements(surveys[survey])
+        except Exception as e:
+            print(f"ERROR: {survey} not formatted correctly: {e}")
+
+    return survey_params
+
+
+def parse_statements(prompt):
+
+    # shuffled statements are listed after the prompt's instructions
+    _, statements = split_prompt(prompt)
+
+    return [
+        re.sub(r"^\d+\. ", "", line) for line in statements.split("\n") if line.strip()
+    ]
+
+
+def get_indexes(shuffled, statements):
+    """
+    Returns the original index of each shuffled statement, or None if the
+    statements do not match, e.g. the survey was edited after the request.
+    """
+
+    if len(shuffled) != len(statements):
+        return None
+
+    positions = {}
+    for i, statement in enumerate(statements):
+        positions.setdefault(statement, []).append(i)
+
+    indexes = []
+    for statement in shuffled:
+        if not positions.get(statement):
+            return None
+        indexes.append(positions[statement].pop(0))
+
+    return indexes
+
+
+def get_prompt_uid(rows, prompt_uids):
+
+    if "prompt_uid" in rows.columns:
+        prompt_uid = rows["prompt_uid"].iloc[0]
+        return prompt_uid if pd.notna(prompt_uid) else None
+
+    if "system_prompt" in rows.columns:
+        system_prompt = rows["system_prompt"].iloc[0]
+        if pd.notna(system_prompt):
+            return prompt_uids.get(system_prompt)
+
+    return None
+
+
+def replay_completion(
+    cuid, rows, survey_params, prompt_uids, provider, model, reason=True
+):
+    """
+    Re-parses and re-validates the logged turns of one completion.
+
+    Args:
+      reason: whether the reasons turn was requested, runs request it unless
+        reasons were turned off in generate_llm_data.
+
+    Returns:
+      A tuple of (outcome, output rows by data type or None).
+    """
+
+    policies, considerations, scale_max, q_method = survey_params
+
+    turns = {
+        data_type: rows[rows["type"] == data_type]
+        for data_type in [CONSIDERATIONS, POLICIES, REASONS]
+    }
+
+    if turns[CONSIDERATIONS].empty:
+        return INCOMPLETE, None
+
+    # the first prompt of a turn lists the shuffled statements, and the last
+    # response is the answer after any repair turns
+    c_indexes = get_indexes(
+        parse_statements(turns[CONSIDERATIONS]["prompt"].iloc[0]), considerations
+    )
+    if c_indexes is None:
+        return UNMATCHED, None
+
+    c_ranks = parse_numbers_from_response(str(turns[CONSIDERATIONS]["response"].iloc[-1]))
+    if check_considerations(c_ranks, considerations, scale_max, q_method):
+        return INVALID, None
+
+    # e.g. request errors after the considerations turn
+    if turns[POLICIES].empty:
+        return INCOMPLETE, None
+
+    p_indexes = get_indexes(parse_statements(turns[POLICIES]["prompt"].iloc[0]), policies)
+    if p_indexes is None:
+        return UNMATCHED, None
+
+    p_ranks = parse_numbers_from_response(str(turns[POLICIES]["response"].iloc[-1]))
+    if check_policies(p_ranks, policies):
+        return INVALID, None
+
+    if turns[REASONS].empty:
+        # e.g. request errors after the policies turn
+        if reason:
+            return INCOMPLETE, None
+        reason_text = "Reasoning was not requested."
+    else:
+        reason_text = parse_reasoning_from_response(
+            str(turns[REASONS]["response"].iloc[-1])
+        )
+
+    # sort ranks based on original order
+    p_ranks = [x for _, x in sorted(zip(p_indexes, p_ranks))]
+    c_ranks = [x for _, x in sorted(zip(c_indexes, c_ranks))]
+
+    meta = [
+        rows["date"].iloc[0],
+        provider,
+        model,
+        rows["temperature"].iloc[0] if "temperature" in rows.columns else None,
+        int(rows["input_tokens"].fillna(0).sum()),
+        int(rows["output_tokens"].fillna(0).sum()),
+    ]
+    prompt_uid = get_prompt_uid(rows, prompt_uids)
+
+    outputs = {
+        POLICIES: [cuid] + meta + [prompt_uid] + p_ranks,
+        CONSIDERATIONS: [cuid] + meta + [prompt_uid] + c_ranks,
+        REASONS: [cuid] + meta + [prompt_uid] + [reason_text],
+    }
+
+    # repair turns repeat the type of the turn they repair
+    repairs = sum([max(len(t) - 1, 0) for t in turns.values()])
+    if repairs:
+        outputs[REPAIRS] = [cuid, repairs]
+
+    return SUCCESS, outputs
+
+
+def replay_log(
+    log_file_path, survey_params, prompt_uids, output_dir=REPLAY_DIR, reason=True
+):
+    """
+    Rebuilds the output files of one model from its request log.
+
+    Returns:
+      A dict with the number of completions by outcome.
+    """
+
+    # logs are stored as {OUTPUT_DIR}/{provider}/{model}/request_log.csv
+    model_dir = os.path.dirname(log_file_path)
+    model = os.path.basename(model_dir)
+    provider = os.path.basename(os.path.dirname(model_dir))
+
+    stats = {"log": log_file_path, SUCCESS: 0, INVALID: 0, INCOMPLETE: 0, UNMATCHED: 0}
+
+    # output rows by survey and data type
+    outputs = {}
+
+    for cuid, rows in get_completions(log_file_path):
+
+        survey = rows["survey"].iloc[0]
+        if survey not in survey_params:
+            stats[UNMATCHED] += 1
+            continue
+
+        outcome, data = replay_completion(
+            cuid, rows, survey_params[survey], prompt_uids, provider, model, reason
+        )
+        stats[outcome] += 1
+
+        if data is None:
+            continue
+
+        for data_type, row in data.items():
+            outputs.setdefault((survey, data_type), []).append(row)
+
+    for (survey, data_type), rows in outputs.items():
+
+        output_path = os.path.join(output_dir, provider, model, survey)
+        os.makedirs(output_path, exist_ok=True)
+
+        if data_type == REPAIRS:
+            df = pd.DataFrame(rows, columns=REPAIRS_COLUMNS)
+        else:
+            policies, considerations, _, _ = survey_params[survey]
+            statements = {
+                POLICIES: policies,
+                CONSIDERATIONS: considerations,
+                REASONS: REASONS_COLUMNS,
+            }[data_type]
+            df = pd.DataFrame(rows, columns=get_output_columns(statements, data_type))
+            df = df.sort_values("created_at", kind="stable")
+        df.to_csv(os.path.join(output_path, f"{data_type}.csv"), index=False)
+
+    return stats
+
+
+def replay(input_dir=OUTPUT_DIR, output_dir=REPLAY_DIR, workers=None, reason=True):
+    """
+    Replays every request log under input_dir in parallel, one process per
+    log, and writes the rebuilt files under output_dir.
+    """
+
+    if os.path.abspath(input_dir) == os.path.abspath(output_dir):
+        raise ValueError("Replay output must not overwrite the generated data.")
+
+    log_files = get_request_logs(input_dir)
+    if not log_files:
+        print(f"No request logs found in {input_dir}.")
+        return []
+
+    # read surveys and prompts once for all workers
+    survey_params = read_survey_params()
+    prompt_uids = get_prompt_uids_by_text()
+
+    print(f"Replaying {len(log_files)} request log(s) into {output_dir}:")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                replay_log, log, survey_params, prompt_uids, output_dir, reason
+            )
+            for log in log_files
+        ]
+        for future in futures:
+            stats = future.result()
+            results.append(stats)
+            print(
+                f"- {stats['log']}: {stats[SUCCESS]} success, {stats[INVALID]} invalid, "
+                f"{stats[INCOMPLETE]} incomplete, {stats[UNMATCHED]} unmatched"
+            )
+
+    total = sum([stats[SUCCESS] for stats in results])
+    print(f"Replayed {total} valid completion(s).")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuilds the LLM data files from the request logs, without API calls."
+    )
+    parser.add_argument(
+        "--input",
+        type=str,
+        required=False,
+        default=OUTPUT_DIR,
+        help="directory with {provider}/{model}/request_log.csv files",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=False,
+        default=REPLAY_DIR,
+        help="directory to write the rebuilt files to",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        required=False,
+        default=None,
+        help="number of processes, defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--no-reasons",
+        action="store_true",
+        help="the logs are of runs without the reasons turn",
+    )
+
+    args = parser.parse_args()
+
+    replay(args.input, args.output, args.workers, not args.no_reasons)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ from utils import (
 )
 from surveys import get_survey_names
 from prompts import get_prompt_uids
+import progress_index
+import results_store
 import os
 import pandas as pd
 
@@ -21,16 +23,26 @@ models = get_models(include_all=True)
 prompts = get_prompt_uids()
 
 
-def reset_progress(quiet=False, temperature=0, custom_prompts=False):
+def reset_progress(quiet=False, temperature=0, custom_prompts=False, store=False):
 
     progress_file_path = os.path.join(OUTPUT_DIR, PROGRESS_FILE)
-    progress_df = pd.DataFrame()
+    progress_data = []
 
     # create output directory if it doesn't exist
     progress_dir = os.path.dirname(progress_file_path)
     if not os.path.exists(progress_dir):
         os.makedirs(progress_dir)
 
+    # with the results store, progress is one query instead of reading
+    # every policies file
+    store_progress = None
+    if store:
+        store_progress = (
+            results_store.get_store()
+            .get_progress(temperature)
+            .set_index(["model", "survey"])
+        )
+
     for _, model_info in models.sort_values("model").iterrows():
 
         provider = model_info.provider
@@ -42,38 +54,41 @@ def reset_progress(quiet=False, temperature=0, custom_prompts=False):
         for survey in surveys:
 
             # check only policies file, assume all are the same length
-            policy_file = f"{POLICIES}.csv"
-            file_path = os.path.join(OUTPUT_DIR, provider, model, survey, policy_file)
-
-            if os.path.exists(file_path):
-                s_df = pd.read_csv(file_path)
-
-                # make sure to check for temp == 0
-                s_df = s_df[s_df["temperature"] == temperature]
-
-                num_rows = len(s_df)
-                last_updated = s_df["created_at"].max()
+            survey_dir = os.path.join(OUTPUT_DIR, provider, model, survey)
+            file_path = os.path.join(survey_dir, f"{POLICIES}.csv")
+
+            if store_progress is not None:
+                if (model, survey) in store_progress.index:
+                    num_rows = store_progress.loc[(model, survey), "completions"]
+                    last_updated = store_progress.loc[(model, survey), "last_updated"]
+                else:
+                    num_rows = 0
+                    last_updated = get_utc_time()
+            elif os.path.exists(file_path):
+                # read from the directory's index, the file is only read
+                # again if it changed outside the writer
+                num_rows, last_updated = progress_index.get_progress(
+                    survey_dir, temperature
+                )
             else:
                 num_rows = 0
                 last_updated = get_utc_time()
 
-            progress_data = {
-                "provider": provider,
-                "model": model,
-                "api": api,
-                "survey": survey,
-                "completions": num_rows,
-                "min_iterations": min_iterations,
-                "completions_left": min_iterations - num_rows,
-                "done": True if num_rows >= min_iterations else False,
-                "last_updated": last_updated,
-            }
-
-            if progress_df.empty:
-                progress_df = pd.DataFrame([progress_data])
-            else:
-                progress_df.loc[len(progress_df)] = progress_data
+            progress_data.append(
+                {
+                    "provider": provider,
+                    "model": model,
+                    "api": api,
+                    "survey": survey,
+                    "completions": num_rows,
+                    "min_iterations": min_iterations,
+                    "completions_left": min_iterations - num_rows,
+                    "done": True if num_rows >= min_iterations else False,
+                    "last_updated": last_updated,
+                }
+            )
 
+    progress_df = pd.DataFrame(progress_data)
     progress_df.to_csv(progress_file_path, index=False)
 
     if quiet:
@@ -209,16 +224,23 @@ def main():
     parser.add_argument(
         "--temp", type=float, required=False, default=0, help="temperature"
     )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="read progress from the SQLite results store",
+    )
 
     # Parse the arguments
     args = parser.parse_args()
 
     if args.model:
-        progress_df = reset_progress(quiet=True, temperature=args.temp)
+        progress_df = reset_progress(
+            quiet=True, temperature=args.temp, store=args.store
+        )
         print_model_summary(args.model, progress_df)
 
     else:
-        reset_progress(temperature=args.temp)
+        reset_progress(temperature=args.temp, store=args.store)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from utils import OUTPUT_DIR
+
+# on-disk cache of LLM responses, keyed by a hash of the full request.
+# only deterministic requests (temperature 0) are cached, since sampling at
+# higher temperatures is expected to return different responses.
+CACHE_FILE = "response_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # least recently used entries are evicted
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_key(model, messages, temperature, system_prompt=None):
+    request = {
+        "model": model,
+        "system_prompt": system_prompt,
+        "messages": messages,
+        "temperature": temperature,
+    }
+    data = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(temperature):
+    return temperature == 0
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU cache of responses in a SQLite file, shared by all
+    threads of a run.
+
+    Args:
+      path: SQLite file path.
+      max_bytes: max total size of cached responses.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # the total size is kept in meta by triggers, in the transaction of
+        # each write, so a put does not sum the whole cache
+        self.conn.executescript(
+            """
+            BEGIN IMMEDIATE;
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            -- caches from before meta are summed once
+            INSERT OR IGNORE INTO meta (name, value)
+                SELECT 'size', COALESCE(SUM(size), 0) FROM responses;
+            CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses
+            BEGIN
+                UPDATE meta SET value = value + NEW.size WHERE name = 'size';
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_update
+            AFTER UPDATE OF size ON responses
+            BEGIN
+                UPDATE meta SET value = value + NEW.size - OLD.size
+                WHERE name = 'size';
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses
+            BEGIN
+                UPDATE meta SET value = value - OLD.size WHERE name = 'size';
+            END;
+            COMMIT;
+            """
+        )
+
+    def get(self, key):
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            self.conn.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+
+        return json.loads(row[0])
+
+    def put(self, key, value):
+
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        size = len(data.encode("utf-8"))
+
+        with self.lock:
+            # an upsert, REPLACE would delete the old row without its trigger
+            self.conn.execute(
+                """
+                INSERT INTO responses (key, value, size, last_used)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET value = excluded.value,
+                    size = excluded.size, last_used = excluded.last_used
+                """,
+                (key, data, size, time.time()),
+            )
+            self.evict()
+            self.conn.commit()
+
+    def evict(self):
+
+        total = self.get_size()
+        if total <= self.max_bytes:
+            return
+
+        # drop least recently used entries until the cache fits, only those
+        # are read
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_used")
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def get_size(self):
+        """Returns the total size of cached responses."""
+        return self.conn.execute(
+            "SELECT value FROM meta WHERE name = 'size'"
+        ).fetchone()[0]
+
+
+class CacheSession:
+    """
+    A run's view of the shared cache, counting its own hits and misses.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+
+        value = self.cache.get(key)
+
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        self.cache.put(key, value)
+
+
+def get_cache(path=None, max_bytes=DEFAULT_MAX_BYTES):
+
+    path = path if path else os.path.join(OUTPUT_DIR, CACHE_FILE)
+
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = ResponseCache(path, max_bytes)
+        return _caches[path]
+
+
+def open_session(path=None, max_bytes=DEFAULT_MAX_BYTES):
+    return CacheSession(get_cache(path, max_bytes))
@@ -0,0 +1,361 @@
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from utils import CONSIDERATIONS, META_DATA, OUTPUT_DIR, POLICIES, REASONS, REPAIRS
+
+# optional SQLite copy of the completions, their request logs and progress
+# counters. a completion is saved in one transaction with its requests and
+# its progress counter, so the counters always match the completions and
+# progress is read with one aggregate query instead of reading every
+# policies.csv file.
+STORE_FILE = "results.sqlite"
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    cuid TEXT PRIMARY KEY,
+    created_at TEXT,
+    provider TEXT,
+    model TEXT NOT NULL,
+    survey TEXT NOT NULL,
+    prompt_uid TEXT,
+    temperature REAL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    repairs INTEGER,
+    reason TEXT,
+    policies TEXT,
+    considerations TEXT
+);
+CREATE INDEX IF NOT EXISTS completions_params
+    ON completions (model, survey, prompt_uid, temperature);
+
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cuid TEXT NOT NULL,
+    date TEXT,
+    provider TEXT,
+    model TEXT,
+    temperature REAL,
+    system_prompt TEXT,
+    survey TEXT,
+    type TEXT,
+    prompt TEXT,
+    response TEXT,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cached_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS requests_cuid ON requests (cuid);
+
+-- prompt_uid is '' without a system prompt, NULLs would not be unique
+CREATE TABLE IF NOT EXISTS progress (
+    model TEXT NOT NULL,
+    survey TEXT NOT NULL,
+    prompt_uid TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    provider TEXT,
+    completions INTEGER NOT NULL,
+    last_updated TEXT,
+    PRIMARY KEY (model, survey, prompt_uid, temperature)
+);
+"""
+
+COMPLETION_COLUMNS = [
+    "cuid",
+    "created_at",
+    "provider",
+    "model",
+    "survey",
+    "prompt_uid",
+    "temperature",
+    "input_tokens",
+    "output_tokens",
+    "repairs",
+    "reason",
+    "policies",
+    "considerations",
+]
+
+REQUEST_COLUMNS = [
+    "cuid",
+    "date",
+    "provider",
+    "model",
+    "temperature",
+    "system_prompt",
+    "survey",
+    "type",
+    "prompt",
+    "response",
+    "input_tokens",
+    "output_tokens",
+    "cached_tokens",
+]
+
+INSERT_COMPLETION = (
+    f"INSERT OR IGNORE INTO completions ({', '.join(COMPLETION_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(COMPLETION_COLUMNS))})"
+)
+
+INSERT_REQUEST = (
+    f"INSERT INTO requests ({', '.join(REQUEST_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(REQUEST_COLUMNS))})"
+)
+
+UPDATE_PROGRESS = """
+INSERT INTO progress
+    (model, survey, prompt_uid, temperature, provider, completions, last_updated)
+VALUES (?, ?, ?, ?, ?, 1, ?)
+ON CONFLICT (model, survey, prompt_uid, temperature) DO UPDATE SET
+    completions = completions + 1,
+    last_updated = MAX(COALESCE(last_updated, ''), excluded.last_updated)
+"""
+
+REBUILD_PROGRESS = """
+INSERT INTO progress
+    (model, survey, prompt_uid, temperature, provider, completions, last_updated)
+SELECT model, survey, COALESCE(prompt_uid, ''), temperature, MAX(provider),
+    COUNT(*), MAX(created_at)
+FROM completions
+GROUP BY model, survey, COALESCE(prompt_uid, ''), temperature
+"""
+
+
+def to_sql(value):
+    # pandas and numpy values from the output dataframes
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if hasattr(value, "item"):
+        return value.item()
+    if not isinstance(value, (str, int, float)):
+        return str(value)
+    return value
+
+
+class ResultsStore:
+    """
+    SQLite store of completions, requests and progress, shared by all
+    threads of a run.
+
+    Args:
+      path: SQLite file path.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        # request rows by cuid, saved with their completion
+        self.pending = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def add_request(self, request):
+        """Keeps a request row until its completion is saved."""
+
+        row = [to_sql(request.get(column)) for column in REQUEST_COLUMNS]
+
+        with self.lock:
+            self.pending.setdefault(request["cuid"], []).append(row)
+
+    def save_completion(self, cuid, completion=None):
+        """
+        Saves a completion's requests and, if it succeeded, the completion
+        and its progress counter, in one transaction.
+
+        Args:
+          completion: dict with COMPLETION_COLUMNS, None for failed ones.
+        """
+
+        with self.lock:
+            requests = self.pending.pop(cuid, [])
+
+            with self.conn:
+                self.conn.executemany(INSERT_REQUEST, requests)
+
+                if completion is None:
+                    return
+
+                row = [to_sql(completion.get(column)) for column in COMPLETION_COLUMNS]
+                inserted = self.conn.execute(INSERT_COMPLETION, row).rowcount
+
+                if inserted:
+                    self.conn.execute(
+                        UPDATE_PROGRESS,
+                        (
+                            completion["model"],
+                            completion["survey"],
+                            completion.get("prompt_uid") or "",
+                            to_sql(completion["temperature"]),
+                            completion["provider"],
+                            to_sql(completion["created_at"]),
+                        ),
+                    )
+
+    def get_progress(self, temperature=None, prompt_uid=None):
+        """
+        Returns a dataframe of completions and last update per provider,
+        model and survey, optionally for one temperature and system prompt.
+        """
+
+        conditions = []
+        params = []
+        if temperature is not None:
+            conditions.append("temperature = ?")
+            params.append(float(temperature))
+        if prompt_uid is not None:
+            conditions.append("prompt_uid = ?")
+            params.append(prompt_uid)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self.lock:
+            rows = self.conn.execute(
+                f"""
+                SELECT MAX(provider), model, survey, SUM(completions), MAX(last_updated)
+                FROM progress {where}
+                GROUP BY model, survey
+                """,
+                params,
+            ).fetchall()
+
+        return pd.DataFrame(
+            rows, columns=["provider", "model", "survey", "completions", "last_updated"]
+        )
+
+    def import_outputs(self, output_dir=OUTPUT_DIR):
+        """
+        Loads completions from the csv output files, e.g. generated before
+        the store was used, and rebuilds the progress counters.
+        """
+
+        file_paths = glob.glob(
+            os.path.join(output_dir, "*", "*", "*", f"{POLICIES}.csv")
+        )
+
+        num_completions = 0
+        for file_path in sorted(file_paths):
+            rows = read_completions(os.path.dirname(file_path))
+            with self.lock, self.conn:
+                num_completions += self.conn.executemany(
+                    INSERT_COMPLETION, rows
+                ).rowcount
+
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM progress")
+            self.conn.execute(REBUILD_PROGRESS)
+
+        print(
+            f"Imported {num_completions} completion(s) from {len(file_paths)} file(s)."
+        )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def read_completions(survey_dir):
+    """Returns completion rows from a {provider}/{model}/{survey} directory."""
+
+    model_dir = os.path.dirname(survey_dir)
+    survey = os.path.basename(survey_dir)
+    model = os.path.basename(model_dir)
+    provider = os.path.basename(os.path.dirname(model_dir))
+
+    dfs = {}
+    for data_type in [POLICIES, CONSIDERATIONS, REASONS]:
+        file_path = os.path.join(survey_dir, f"{data_type}.csv")
+        if os.path.exists(file_path):
+            dfs[data_type] = pd.read_csv(file_path).drop_duplicates("cuid")
+
+    # repair turns of repaired completions, the others had none
+    repairs = {}
+    file_path = os.path.join(survey_dir, f"{REPAIRS}.csv")
+    if os.path.exists(file_path):
+        repairs = pd.read_csv(file_path).set_index("cuid")["repairs"].to_dict()
+
+    p_df = dfs[POLICIES]
+    c_df = dfs.get(CONSIDERATIONS, pd.DataFrame(columns=META_DATA)).set_index("cuid")
+    r_df = dfs.get(REASONS, pd.DataFrame(columns=META_DATA)).set_index("cuid")
+
+    # cuid is the index of considerations and reasons
+    c_columns = c_df.columns[len(META_DATA) - 1 :]
+
+    rows = []
+    for _, p_row in p_df.iterrows():
+        cuid = p_row["cuid"]
+        c_ranks = c_df.loc[cuid, c_columns].tolist() if cuid in c_df.index else []
+        r_row = r_df.loc[cuid] if cuid in r_df.index else {}
+
+        completion = {
+            "cuid": cuid,
+            "created_at": p_row["created_at"],
+            "provider": provider,
+            "model": model,
+            "survey": survey,
+            "prompt_uid": p_row.get("prompt_uid"),
+            "temperature": p_row["temperature"],
+            "input_tokens": p_row["input_tokens"],
+            "output_tokens": p_row["output_tokens"],
+            "repairs": repairs.get(cuid, 0),
+            "reason": r_row.get("reason"),
+            "policies": json.dumps([to_sql(x) for x in p_row[len(META_DATA) :]]),
+            "considerations": json.dumps([to_sql(x) for x in c_ranks]),
+        }
+        rows.append([to_sql(completion[column]) for column in COMPLETION_COLUMNS])
+
+    return rows
+
+
+def get_store(path=None):
+
+    path = path if path else os.path.join(OUTPUT_DIR, STORE_FILE)
+
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ResultsStore(path)
+        return _stores[path]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Loads the csv output files into the SQLite results store."
+    )
+    parser.add_argument(
+        "--input",
+        type=str,
+        required=False,
+        default=OUTPUT_DIR,
+        help="directory with {provider}/{model}/{survey}/*.csv files",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        required=False,
+        default=None,
+        help=f"SQLite file, defaults to {OUTPUT_DIR}/{STORE_FILE}",
+    )
+
+    args = parser.parse_args()
+
+    get_store(args.store).import_outputs(args.input)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import os
+import pandas as pd
+
+import cost_ledger
+import metrics
+import tracing
+from engine import CompletionEngine
+from generate_llm_data import prepare_job, report_job, run_job
+from surveys import get_survey_params
+from utils import get_api
+
+# a manifest is a csv file with one row per job
+MANIFEST_COLUMNS = ["model", "survey", "prompt_uid", "temperature", "n"]
+
+
+def read_manifest(file_path):
+
+    manifest = pd.read_csv(file_path)
+
+    missing = [c for c in MANIFEST_COLUMNS if c not in manifest.columns]
+    if missing:
+        raise ValueError(f"Manifest {file_path} is missing columns: {missing}")
+
+    return manifest
+
+
+def get_jobs(
+    manifest,
+    surveys,
+    max_repairs=0,
+    cache=False,
+    parquet=False,
+    store=False,
+    ledger=None,
+    preflight=True,
+    hedge=False,
+):
+
+    jobs = []
+
+    for _, row in manifest.iterrows():
+
+        # empty survey or prompt_uid means all surveys / no system prompt
+        survey = row["survey"] if pd.notna(row["survey"]) else None
+        prompt_uid = row["prompt_uid"] if pd.notna(row["prompt_uid"]) else None
+        temperature = row["temperature"] if pd.notna(row["temperature"]) else 0
+
+        job = prepare_job(
+            row["model"],
+            int(row["n"]),
+            temperature,
+            survey,
+            prompt_uid,
+            surveys=surveys,
+            max_repairs=max_repairs,
+            cache=cache,
+            parquet=parquet,
+            store=store,
+            ledger=ledger,
+            preflight=preflight,
+            hedge=hedge,
+        )
+
+        if job is not None:
+            jobs.append(job)
+
+    return jobs
+
+
+async def run_jobs(engine, jobs):
+    # jobs share the engine, so each API's concurrency limit holds across
+    # jobs while different APIs run side by side
+    await asyncio.gather(*[run_job(engine, job) for job in jobs])
+
+
+def run_manifest(
+    manifest,
+    concurrency=None,
+    max_repairs=0,
+    cache=False,
+    parquet=False,
+    store=False,
+    budget=None,
+    daily_budget=None,
+    adaptive=True,
+    preflight=True,
+    hedge=False,
+):
+    """
+    Runs every job in a manifest dataframe concurrently in this process.
+
+    Args:
+      manifest: dataframe with MANIFEST_COLUMNS.
+      concurrency: optional dict of API name -> max completions in flight.
+      max_repairs: max repair turns per completion.
+      cache: reuse cached responses to identical requests at temperature 0.
+      parquet: also write the completions to the parquet store.
+      store: also save completions, requests and progress in the SQLite store.
+      budget: max cost of the run in USD, over all jobs.
+      daily_budget: max cost of all runs today (UTC) in USD.
+      adaptive: adapt each API's concurrency to its throttling and latency.
+      preflight: check each model with a tiny request before the run.
+      hedge: send a duplicate of turns slower than the p95 latency.
+    """
+
+    # read surveys once for all jobs
+    surveys = get_survey_params(deliberative_cases=True)
+
+    # one ledger session, so the run budget covers all jobs
+    ledger = cost_ledger.open_session(budget, daily_budget)
+
+    jobs = get_jobs(
+        manifest,
+        surveys,
+        max_repairs,
+        cache,
+        parquet,
+        store,
+        ledger,
+        preflight,
+        hedge,
+    )
+
+    if not jobs:
+        print("No jobs to run.")
+        return []
+
+    engine = CompletionEngine(concurrency, adaptive)
+
+    print(f"\nRunning {len(jobs)} job(s):")
+    for api in sorted(set(job["api"] for job in jobs)):
+        print(f"- {api}: concurrency {engine.get_concurrency(api)}")
+
+    engine.run(run_jobs(engine, jobs))
+
+    for job in jobs:
+        report_job(job)
+
+    return jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs all (model, survey, prompt_uid, temperature, n) jobs in a manifest."
+    )
+
+    parser.add_argument("manifest", type=str, help="path to the manifest csv file")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        required=False,
+        default=None,
+        help="max completions in flight per API, the starting point with adaptive concurrency",
+    )
+    parser.add_argument(
+        "--fixed-concurrency",
+        action="store_true",
+        help="keep the concurrency fixed instead of adapting it to throttling and latency",
+    )
+    parser.add_argument(
+        "--skip-preflight",
+        action="store_true",
+        help="do not check the credentials and models with a tiny request first",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="send a duplicate of turns slower than the p95 latency, first reply wins",
+    )
+    parser.add_argument(
+        "--repairs",
+        type=int,
+        required=False,
+        default=0,
+        help="max follow-up turns per completion to fix invalid responses",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse cached responses to identical requests at temperature 0",
+    )
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help="also write the completions to the partitioned parquet store",
+    )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="also save completions, requests and progress in the SQLite store",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        required=False,
+        default=None,
+        help="max cost of this run in USD, no new requests are sent once reached",
+    )
+    parser.add_argument(
+        "--daily-budget",
+        type=float,
+        required=False,
+        default=None,
+        help="max cost of all runs today (UTC) in USD, across processes",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        required=False,
+        default=None,
+        help="serve Prometheus metrics on this local port while running",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        required=False,
+        default=None,
+        help="write Prometheus metrics to this textfile while running",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        required=False,
+        default=None,
+        help="append spans of each completion to this JSONL file, see tracing.py",
+    )
+
+    args = parser.parse_args()
+
+    manifest = read_manifest(args.manifest)
+
+    concurrency = None
+    if args.concurrency:
+        # apply the same limit to every API in the manifest
+        concurrency = {
+            get_api(model): args.concurrency for model in manifest["model"].unique()
+        }
+
+    metrics.start(args.metrics_port, args.metrics_file)
+    tracing.start(args.trace)
+
+    run_manifest(
+        manifest,
+        concurrency,
+        args.repairs,
+        args.cache,
+        args.parquet,
+        args.store,
+        args.budget,
+        args.daily_budget,
+        not args.fixed_concurrency,
+        not args.skip_preflight,
+        args.hedge,
+    )
+
+    metrics.stop()
+    tracing.stop()
+
+    # audio notification
+    os.system('say "done"')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import argparse
+import os
+
+import pandas as pd
+
+import rate_limit
+from utils import EXEC_LOG_FILE, OUTPUT_DIR, get_api, get_llm_info
+
+# orders pending jobs so that the cheapest (or fastest) ones finish first,
+# with every API's jobs running side by side, and projects the time and cost
+# left. estimates come from past runs in the execution log: tokens and
+# seconds per successful completion of each model, priced with the current
+# prices in utils.LLM_INFO_PATH.
+OBJECTIVES = ["cost", "time"]
+
+# used for models without runs in the execution log
+DEFAULT_SECONDS_PER_COMPLETION = 20
+DEFAULT_INPUT_TOKENS = 2500  # considerations, policies and reasons turns
+DEFAULT_OUTPUT_TOKENS = 400
+
+# considerations -> policies -> reasons
+REQUESTS_PER_COMPLETION = 3
+
+
+def read_exec_log(file_path=None):
+
+    file_path = file_path if file_path else os.path.join(OUTPUT_DIR, EXEC_LOG_FILE)
+    if not os.path.exists(file_path):
+        return pd.DataFrame()
+
+    return pd.read_csv(file_path)
+
+
+def get_observations(exec_log, llm_info):
+    """
+    Returns a dataframe with the tokens and seconds per successful
+    completion of every model in the execution log.
+    """
+
+    if exec_log.empty:
+        return pd.DataFrame()
+
+    df = exec_log.merge(
+        llm_info[["model", "price_1M_input", "price_1M_output"]], on="model", how="left"
+    )
+
+    # older logs only have costs, rounded to cents, priced at the time
+    for side in ["input", "output"]:
+        cost_column = f"{side} cost ($)"
+        tokens_column = f"{side} tokens"
+        price = df[f"price_1M_{side}"].where(df[f"price_1M_{side}"] > 0)
+        derived = df[cost_column] * 1000000 / price
+        if tokens_column in df.columns:
+            df[tokens_column] = df[tokens_column].fillna(derived)
+        else:
+            df[tokens_column] = derived
+
+    df["seconds"] = df["total elapsed time (min)"] * 60
+    df = df[df["num success completions"] > 0]
+
+    totals = df.groupby("model")[
+        ["num success completions", "seconds", "input tokens", "output tokens"]
+    ].sum(min_count=1)
+
+    observations = pd.DataFrame(
+        {
+            "completions": totals["num success completions"],
+            "seconds_per_completion": totals["seconds"]
+            / totals["num success completions"],
+            "input_tokens": totals["input tokens"] / totals["num success completions"],
+            "output_tokens": totals["output tokens"]
+            / totals["num success completions"],
+        }
+    )
+
+    return observations.reset_index()
+
+
+def get_estimates(models, exec_log=None):
+    """
+    Returns a dataframe indexed by model with the estimated cost and seconds
+    per successful completion. Models without runs use the average tokens of
+    all models and the average speed of their API.
+    """
+
+    llm_info = get_llm_info().get_df()
+    exec_log = read_exec_log() if exec_log is None else exec_log
+
+    observations = get_observations(exec_log, llm_info)
+
+    if observations.empty:
+        observations = pd.DataFrame(
+            columns=[
+                "model",
+                "completions",
+                "seconds_per_completion",
+                "input_tokens",
+                "output_tokens",
+            ]
+        )
+
+    observations["api"] = [get_api(model) for model in observations["model"]]
+    observed = observations.set_index("model")
+
+    # prompts are the same for all models, so are input tokens, roughly
+    input_tokens = observations["input_tokens"].mean()
+    output_tokens = observations["output_tokens"].mean()
+    api_seconds = observations.groupby("api")["seconds_per_completion"].mean()
+
+    rows = []
+    for model in models:
+
+        info = llm_info[llm_info["model"] == model].iloc[0]
+        api = info["api"]
+
+        if model in observed.index and pd.notna(
+            observed.loc[model, "seconds_per_completion"]
+        ):
+            source = "observed"
+            seconds = observed.loc[model, "seconds_per_completion"]
+            m_input_tokens = observed.loc[model, "input_tokens"]
+            m_output_tokens = observed.loc[model, "output_tokens"]
+        else:
+            source = "estimated"
+            seconds = api_seconds.get(api, DEFAULT_SECONDS_PER_COMPLETION)
+            m_input_tokens = input_tokens
+            m_output_tokens = output_tokens
+
+        if pd.isna(m_input_tokens):
+            m_input_tokens = DEFAULT_INPUT_TOKENS
+        if pd.isna(m_output_tokens):
+            m_output_tokens = DEFAULT_OUTPUT_TOKENS
+
+        # a completion cannot be faster than the API's rate budget allows
+        limiter = rate_limit.get_limiter(api)
+        if limiter.rpm:
+            seconds = max(seconds, 60 * REQUESTS_PER_COMPLETION / limiter.rpm)
+        if limiter.tpm:
+            tokens = m_input_tokens + m_output_tokens
+            seconds = max(seconds, 60 * tokens / limiter.tpm)
+
+        cost = (m_input_tokens / 1000000) * info["price_1M_input"] + (
+            m_output_tokens / 1000000
+        ) * info["price_1M_output"]
+
+        rows.append(
+            {
+                "model": model,
+                "api": api,
+                "source": source,
+                "seconds_per_completion": seconds,
+                "cost_per_completion": cost,
+            }
+        )
+
+    return pd.DataFrame(rows).set_index("model")
+
+
+def plan(units, objective="cost", estimates=None):
+    """
+    Orders units of work for one run.
+
+    Units of each API are sorted by their projected cost (or time), so the
+    cheapest (or fastest) ones are done first, and the APIs are interleaved
+    so all of them start at once. Jobs on the same API wait for its
+    concurrency slots in this order.
+
+    Args:
+      units: list of dicts with model, survey, prompt_uid, temperature and n,
+        other keys are kept.
+      objective: "cost" or "time".
+
+    Returns:
+      A dataframe with one row per unit, in run order, with its projected
+      cost, seconds and finish time (eta) from the start of the run.
+    """
+
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective {objective}, expected one of {OBJECTIVES}")
+
+    if not units:
+        return pd.DataFrame()
+
+    df = pd.DataFrame(units)
+
+    if estimates is None:
+        estimates = get_estimates(df["model"].unique())
+
+    df["api"] = [estimates.loc[m, "api"] for m in df["model"]]
+    df["cost"] = df["n"] * [
+        estimates.loc[m, "cost_per_completion"] for m in df["model"]
+    ]
+    df["seconds"] = df["n"] * [
+        estimates.loc[m, "seconds_per_completion"] for m in df["model"]
+    ]
+
+    keys = ["cost", "seconds"] if objective == "cost" else ["seconds", "cost"]
+
+    lanes = {}
+    for api, lane in df.groupby("api"):
+        lane = lane.sort_values(keys, kind="stable")
+        lane["eta"] = lane["seconds"].cumsum()
+        lanes[api] = lane
+
+    # interleave, longest lane first
+    apis = sorted(lanes, key=lambda api: -lanes[api]["seconds"].sum())
+    ordered = []
+    for i in range(max([len(lane) for lane in lanes.values()])):
+        for api in apis:
+            if i < len(lanes[api]):
+                ordered.append(lanes[api].iloc[i])
+
+    return pd.DataFrame(ordered).infer_objects().reset_index(drop=True)
+
+
+def format_seconds(seconds):
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    return f"{hours}h{minutes:02d}m"
+
+
+def print_plan(schedule):
+
+    if schedule.empty:
+        print("Nothing to schedule.")
+        return
+
+    print("\n=============== S C H E D U L E ===============")
+
+    df = schedule.copy()
+    df["cost"] = [f"{x:.2f} USD" for x in df["cost"]]
+    df["eta"] = [format_seconds(x) for x in df["eta"]]
+    print(
+        df[["api", "model", "survey", "prompt_uid", "temperature", "n", "cost", "eta"]]
+        .fillna("")
+        .to_string()
+    )
+
+    print("\nProjection per API:")
+    for api, lane in schedule.groupby("api"):
+        print(
+            f"- {api}: {lane['n'].sum()} completion(s), "
+            f"{lane['cost'].sum():.2f} USD, {format_seconds(lane['seconds'].sum())}"
+        )
+
+    # APIs run side by side, the slowest one sets the end of the run
+    total_seconds = schedule.groupby("api")["seconds"].sum().max()
+    print(f"Projected cost to completion: {schedule['cost'].sum():.2f} USD")
+    print(f"Projected time to completion: {format_seconds(total_seconds)}")
+    print("=" * 47)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Projects the cost and time left for the queued jobs, or a manifest."
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        required=False,
+        default=None,
+        help="plan the jobs of a manifest csv file instead of the queue",
+    )
+    parser.add_argument(
+        "--objective",
+        type=str,
+        required=False,
+        default="cost",
+        choices=OBJECTIVES,
+        help="finish the cheapest or the fastest jobs first",
+    )
+
+    args = parser.parse_args()
+
+    # imported here, the queue orders its runs with this module
+    import job_queue
+
+    if args.manifest:
+        from run_manifest import read_manifest
+        from surveys import get_survey_params
+
+        units = job_queue.get_units(
+            read_manifest(args.manifest), get_survey_params(deliberative_cases=True)
+        )
+    else:
+        units = job_queue.get_queue().get_pending()
+
+    print_plan(plan(units, args.objective))
+
+
+if __name__ == "__main__":
+    main()
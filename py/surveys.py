@@ -1,27 +1,149 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
 import pandas as pd
 
+import registry
+
 SURVEYS_PATH = "data/surveys_v5.xlsx"
 DELIBERATIVE_CASES = "data/deliberative_cases.csv"
 
+# reading the workbook takes seconds, so its sheets are compiled once into
+# sorted policies, considerations, scale_max and q_method per survey, and
+# saved next to it. the cache is rebuilt when the workbook's content changes.
+CACHE_SUFFIX = ".cache.json"
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def get_cache_path(file_path=SURVEYS_PATH):
+    return os.path.splitext(file_path)[0] + CACHE_SUFFIX
+
+
+def get_file_hash(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def compile_surveys(file_path=SURVEYS_PATH, file_hash=None):
+    """
+    Reads every sheet of the workbook and saves the compiled surveys to the
+    cache file. Sheets that are not formatted correctly keep their error.
+    """
 
-def get_survey_names(file_path=SURVEYS_PATH, no_template=False):
     xls = pd.ExcelFile(file_path)
-    survey_names = xls.sheet_names
+
+    surveys = {}
+    for sheet_name in xls.sheet_names:
+        try:
+            policies, considerations, scale_max, q_method = (
+                get_policies_and_considerations(pd.read_excel(xls, sheet_name))
+            )
+            surveys[sheet_name] = {
+                "policies": policies,
+                "considerations": considerations,
+                "scale_max": scale_max,
+                "q_method": q_method,
+            }
+        except Exception as e:
+            surveys[sheet_name] = {"error": str(e)}
+
+    compiled = {
+        "hash": file_hash if file_hash else get_file_hash(file_path),
+        "sheet_names": xls.sheet_names,
+        "surveys": surveys,
+    }
+
+    # write to a temporary file first, so readers never see a partial cache
+    cache_path = get_cache_path(file_path)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(compiled, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, cache_path)
+
+    return compiled
+
+
+def get_compiled_surveys(file_path=SURVEYS_PATH):
+
+    stat = os.stat(file_path)
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    with _compiled_lock:
+
+        # already loaded by this process
+        if file_path in _compiled and _compiled[file_path][0] == version:
+            return _compiled[file_path][1]
+
+        file_hash = get_file_hash(file_path)
+
+        compiled = None
+        cache_path = get_cache_path(file_path)
+        if os.path.exists(cache_path):
+            with open(cache_path, encoding="utf-8") as f:
+                compiled = json.load(f)
+
+        if compiled is None or compiled["hash"] != file_hash:
+            print(f"Compiling surveys from {file_path}...")
+            compiled = compile_surveys(file_path, file_hash)
+
+        _compiled[file_path] = (version, compiled)
+
+        return compiled
+
+
+def get_survey_names(file_path=SURVEYS_PATH, no_template=False):
+    survey_names = list(get_compiled_surveys(file_path)["sheet_names"])
     if no_template:
         survey_names.remove("template")
     return survey_names
 
 
+def get_survey_params(file_path=SURVEYS_PATH, deliberative_cases=False):
+    """
+    Returns the compiled surveys by name. Use get_survey_statements() to
+    read the policies, considerations, scale_max and q_method of each.
+    """
+
+    surveys = get_compiled_surveys(file_path)["surveys"]
+
+    if deliberative_cases:
+        cases = set(get_deliberative_cases())
+        surveys = {name: s for name, s in surveys.items() if name in cases}
+
+    return surveys
+
+
+def get_survey_statements(survey):
+
+    if "error" in survey:
+        raise ValueError(survey["error"])
+
+    return (
+        survey["policies"],
+        survey["considerations"],
+        survey["scale_max"],
+        survey["q_method"],
+    )
+
+
+def get_deliberative_cases():
+    return registry.get_table(DELIBERATIVE_CASES, keys=("survey",)).get_values(
+        "survey"
+    )
+
+
 def get_surveys_data(file_path=SURVEYS_PATH, deliberative_cases=False):
     xls = pd.ExcelFile(file_path)
     sheets = {}
     sheet_names = xls.sheet_names
 
     if deliberative_cases:
-        deliberative_cases = pd.read_csv(DELIBERATIVE_CASES)
-        sheet_names = filter(
-            lambda survey: survey in set(deliberative_cases["survey"]), sheet_names
-        )
+        cases = set(get_deliberative_cases())
+        sheet_names = filter(lambda survey: survey in cases, sheet_names)
 
     for sheet_name in sheet_names:
         sheets[sheet_name] = pd.read_excel(xls, sheet_name)
@@ -79,3 +201,29 @@ def get_policies_and_considerations(sheet):
         q_method = False
 
     return policies, considerations, scale_max, q_method
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compiles the surveys workbook into the surveys cache."
+    )
+    parser.add_argument(
+        "--file",
+        type=str,
+        required=False,
+        default=SURVEYS_PATH,
+        help="surveys workbook",
+    )
+
+    args = parser.parse_args()
+
+    compiled = compile_surveys(args.file)
+
+    print(f"Compiled {len(compiled['surveys'])} survey(s) into {get_cache_path(args.file)}")
+    for name, survey in compiled["surveys"].items():
+        if "error" in survey:
+            print(f"- {name}: ERROR: {survey['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import os
+import re
+import sys
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+# the modules are scripts run from py/, imported by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+LLM_INFO = """provider,model,api,included,min_iterations,total_estimate,price_1M_input,price_1M_output,comment
+openai,gpt-4o-mini,OpenAI API,True,5,1.0,0.15,0.6,
+anthropic,claude-3-haiku-20240307,Anthropic API,True,5,2.0,0.25,1.25,
+"""
+
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir(tmp_path_factory):
+    """
+    Runs the tests in a scratch directory with its own model list. Paths
+    like utils.OUTPUT_DIR are relative and the registries are per process,
+    so the directory is set once per session.
+    """
+
+    path = tmp_path_factory.mktemp("drillm")
+    os.makedirs(path / "private")
+    (path / "private" / "llms_v3.csv").write_text(LLM_INFO)
+
+    cwd = os.getcwd()
+    os.chdir(path)
+    yield path
+
+    # rows still buffered, e.g. the execution log of the last run, are
+    # written here and not next to the tests
+    from utils import flush_output
+
+    flush_output()
+    os.chdir(cwd)
+
+
+# columns of execution logs written before the cache, abort and repair counts
+OLD_EXEC_LOG_COLUMNS = [
+    "start time",
+    "provider",
+    "model",
+    "temperature",
+    "prompt",
+    "num surveys",
+    "num iterations",
+    "num completions",
+    "num requests",
+    "input cost ($)",
+    "output cost ($)",
+    "total cost ($)",
+    "num errors",
+    "num fail completions",
+    "num success completions",
+    "success rate (%)",
+    "total elapsed time (min)",
+    "time per completion (s)",
+]
+
+
+@pytest.fixture
+def old_exec_log(workdir):
+    """An execution log with the columns of earlier versions."""
+
+    from utils import EXEC_LOG_FILE, OUTPUT_DIR, flush_output
+
+    flush_output()
+
+    path = os.path.join(OUTPUT_DIR, EXEC_LOG_FILE)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(OLD_EXEC_LOG_COLUMNS) + "\n")
+        f.write(",".join(["2025-01-01", "openai", "gpt-4o"] + ["1"] * 15) + "\n")
+
+    return path
+
+
+def log_execution(**kwargs):
+    """Logs a run of gpt-4o-mini on ccps, kwargs override the counts."""
+
+    from utils import flush_output, log_execution
+
+    args = {
+        "exec_date": "2025-06-01",
+        "provider": "openai",
+        "model": "gpt-4o-mini",
+        "temperature": 0,
+        "prompt_uid": None,
+        "iterations": 2,
+        "num_requests": 6,
+        "num_completions": 2,
+        "elapsed_time": 60,
+        "num_errors": 0,
+        "num_invalid": 0,
+        "success_rate": 100,
+        "time_per_completion": 30,
+        "cost_input": 0.01,
+        "cost_output": 0.02,
+        "surveys_exec": ["ccps"],
+        "surveys_success": {"ccps": 2},
+    }
+    args.update(kwargs)
+    log_execution(**args)
+    flush_output()
+
+
+SURVEY = "ccps"
+
+
+def write_survey(writer, name, num_policies, num_considerations):
+    padding = [None] * (num_considerations - num_policies)
+    pd.DataFrame(
+        {
+            "policies": [f"policy {i}" for i in range(num_policies)] + padding,
+            "policies_order": list(range(num_policies, 0, -1)) + padding,
+            "considerations": [f"consideration {i}" for i in range(num_considerations)],
+            "considerations_order": list(range(1, num_considerations + 1)),
+            "scale_max": [7] + [None] * (num_considerations - 1),
+            "q-method": [None] * num_considerations,
+        }
+    ).to_excel(writer, sheet_name=name, index=False)
+
+
+@pytest.fixture(scope="session")
+def surveys(workdir):
+    """A surveys workbook with SURVEY, 4 policies and 6 considerations."""
+
+    from surveys import DELIBERATIVE_CASES, SURVEYS_PATH
+
+    os.makedirs(os.path.dirname(SURVEYS_PATH), exist_ok=True)
+    with pd.ExcelWriter(SURVEYS_PATH) as writer:
+        write_survey(writer, SURVEY, 4, 6)
+        write_survey(writer, "template", 2, 2)
+
+    pd.DataFrame(
+        [("CCPS ACT Deliberative", SURVEY, 31, "climate", "climate")],
+        columns=["case", "survey", "N", "topic", "subtopic"],
+    ).to_csv(DELIBERATIVE_CASES, index=False)
+
+
+def answer(prompt):
+    """A valid answer to a survey prompt, or to a repair prompt."""
+
+    m = re.search(r"Rate (?:each of )?the (\d+) \[Considerations\]", prompt)
+    if m:
+        return "\n".join([f"{i + 1}. {i % 7 + 1}" for i in range(int(m[1]))])
+
+    m = re.search(r"(?:rank|Rank) the (\d+) \[Policies\]", prompt)
+    if m:
+        return "\n".join([f"{i + 1}. {i + 1}" for i in range(int(m[1]))])
+
+    return "The policies balance costs and benefits."
+
+
+class FakeOpenAI:
+    """
+    Chat completions client that answers the survey prompts. Responses
+    queued in scripted[data_type] are sent first, e.g. invalid ones.
+    """
+
+    def __init__(self, scripted=None):
+        self.scripted = scripted or {}
+        self.prompts = []
+        self.chat = SimpleNamespace(completions=self)
+
+    def create(self, *, model, messages, temperature=None, extra_body=None):
+
+        prompt = messages[-1]["content"]
+        self.prompts.append(prompt)
+
+        data_type = "reasons"
+        if "[Considerations]" in prompt:
+            data_type = "considerations"
+        elif "[Policies]" in prompt:
+            data_type = "policies"
+
+        if self.scripted.get(data_type):
+            content = self.scripted[data_type].pop(0)
+        else:
+            content = answer(prompt)
+
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=100, completion_tokens=10, prompt_tokens_details=None
+            ),
+            model=model,
+        )
+
+
+@pytest.fixture
+def fake_openai(surveys, monkeypatch):
+    """
+    Returns a function that sets a FakeOpenAI as the OpenAI client, for live
+    runs of gpt-4o-mini on SURVEY.
+    """
+
+    import data_openai
+
+    # no audio notification
+    monkeypatch.setattr(os, "system", lambda command: 0)
+
+    def set_client(scripted=None):
+        client = FakeOpenAI(scripted)
+        monkeypatch.setattr(data_openai.generator, "_client", client)
+        return client
+
+    return set_client
+
+
+def read_output(data_type, model="gpt-4o-mini", provider="openai"):
+    """Returns an output file of SURVEY, empty if it does not exist."""
+
+    from utils import OUTPUT_DIR, flush_output
+
+    flush_output()
+
+    path = os.path.join(OUTPUT_DIR, provider, model, SURVEY, f"{data_type}.csv")
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=["cuid"])
+    return pd.read_csv(path)
@@ -0,0 +1,58 @@
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+import batch
+import batch_server
+import data_anthropic
+import data_openai
+from conftest import SURVEY
+from utils import OUTPUT_DIR, POLICIES, flush_output
+
+
+@pytest.fixture(scope="module")
+def server():
+
+    server = batch_server.serve(0, delay=0.1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://localhost:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def apis(server, monkeypatch):
+
+    # the clients are built on first use, from these
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"{server}/v1")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", server)
+    monkeypatch.setattr(data_openai.generator, "_client", None)
+    monkeypatch.setattr(data_anthropic.generator, "_client", None)
+
+    # no audio notification
+    monkeypatch.setattr(os, "system", lambda command: 0)
+
+
+@pytest.mark.parametrize(
+    "provider, model",
+    [("openai", "gpt-4o-mini"), ("anthropic", "claude-3-haiku-20240307")],
+)
+def test_generate_data_batch(surveys, apis, provider, model):
+
+    batch.generate_data_batch(model, 2, 0, SURVEY, poll=0.05)
+    flush_output()
+
+    path = os.path.join(OUTPUT_DIR, provider, model, SURVEY, f"{POLICIES}.csv")
+    df = pd.read_csv(path)
+
+    assert len(df) == 2
+    assert df["cuid"].is_unique
+    assert (df["input_tokens"] > 0).all()
+
+    # every completion ranks the 4 policies
+    ranks = df.filter(like="policy").to_numpy()
+    assert sorted(ranks[0]) == sorted(ranks[1]) == [1, 2, 3, 4]
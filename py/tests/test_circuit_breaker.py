@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import (
+    CLOSED,
+    FAILURE_THRESHOLD,
+    GIVEN_UP,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+)
+
+
+class APIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "BASE_BACKOFF", 0.01)
+
+
+def open_circuit(breaker):
+    for _ in range(FAILURE_THRESHOLD):
+        breaker.on_failure(APIError(500))
+    assert breaker.state == OPEN
+
+
+def test_opens_after_consecutive_failures():
+
+    breaker = CircuitBreaker("test")
+
+    for _ in range(FAILURE_THRESHOLD - 1):
+        breaker.on_failure(APIError(503))
+    breaker.on_success()
+    for _ in range(FAILURE_THRESHOLD - 1):
+        breaker.on_failure(APIError(503))
+
+    assert breaker.state == CLOSED
+
+    breaker.on_failure(APIError(503))
+
+    assert breaker.state == OPEN
+    assert breaker.opened == 1
+
+
+def test_request_errors_do_not_open():
+
+    breaker = CircuitBreaker("test")
+
+    for _ in range(FAILURE_THRESHOLD - 1):
+        breaker.on_failure(APIError(500))
+    for _ in range(FAILURE_THRESHOLD):
+        breaker.on_failure(APIError(400))
+
+    assert breaker.state == CLOSED
+    assert breaker.failures == 0
+
+
+def test_probe_closes_circuit():
+
+    breaker = CircuitBreaker("test")
+    open_circuit(breaker)
+
+    # the first request after the backoff is the probe
+    breaker.acquire()
+    assert breaker.probing
+
+    # other requests wait for the probe's result
+    waiter = threading.Thread(target=breaker.acquire)
+    waiter.start()
+    time.sleep(0.05)
+    assert waiter.is_alive()
+
+    breaker.on_success()
+    waiter.join(1)
+
+    assert not waiter.is_alive()
+    assert breaker.state == CLOSED
+    assert breaker.failed_probes == 0
+
+
+def test_failed_probes_back_off_then_give_up(monkeypatch):
+
+    monkeypatch.setattr(circuit_breaker, "MAX_PROBES", 3)
+
+    breaker = CircuitBreaker("test")
+    open_circuit(breaker)
+
+    for probe in range(1, 3):
+        breaker.acquire()
+        breaker.on_failure(APIError(502))
+        assert breaker.state == OPEN
+        assert breaker.failed_probes == probe
+        assert breaker.get_backoff() == 0.01 * 2**probe
+
+    breaker.acquire()
+    breaker.on_failure(APIError(502))
+
+    assert breaker.state == GIVEN_UP
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
@@ -0,0 +1,60 @@
+import pytest
+
+from cost_ledger import BudgetExceededError, CostLedger, LedgerSession
+
+MODEL = "gpt-4o-mini"  # US$0.15 input, US$0.6 output per 1M tokens
+
+
+def test_run_budget(tmp_path):
+
+    session = LedgerSession(CostLedger(str(tmp_path / "ledger.sqlite")), 0.5)
+
+    session.record(MODEL, 1_000_000, 0)
+    session.check(MODEL)
+
+    session.record(MODEL, 1_000_000, 500_000)
+
+    with pytest.raises(BudgetExceededError) as e:
+        session.check(MODEL)
+
+    assert e.value.scope == "Run"
+    assert e.value.spent == pytest.approx(0.6)
+
+
+def test_daily_budget_is_shared_by_runs(tmp_path):
+
+    ledger = CostLedger(str(tmp_path / "ledger.sqlite"))
+    first = LedgerSession(ledger, daily_budget=1)
+    second = LedgerSession(ledger, daily_budget=1)
+
+    first.record(MODEL, 0, 1_000_000)
+    second.check(MODEL)
+
+    first.record(MODEL, 0, 1_000_000)
+
+    with pytest.raises(BudgetExceededError) as e:
+        second.check(MODEL)
+
+    assert e.value.scope == "Daily"
+    assert ledger.get_spent(run=second.run) == 0
+
+
+def test_price_factor_and_prompt_cache(tmp_path):
+
+    session = LedgerSession(CostLedger(str(tmp_path / "ledger.sqlite")))
+
+    # batch requests at half price
+    session.record(MODEL, 1_000_000, 0, price_factor=0.5)
+    assert session.spent == pytest.approx(0.075)
+
+    # Anthropic cache reads at 0.1x and writes at 1.25x its US$0.25 input
+    session.record(
+        "claude-3-haiku-20240307",
+        2_000_000,
+        0,
+        cached_tokens=1_000_000,
+        cache_write_tokens=1_000_000,
+    )
+    assert session.spent == pytest.approx(0.075 + 0.025 + 0.3125)
+
+    assert session.ledger.get_spent(run=session.run) == pytest.approx(0.4125)
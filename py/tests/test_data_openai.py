@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+
+import data_openai
+
+
+class Completions:
+    """Keyword arguments of the pinned SDK's chat.completions.create."""
+
+    def __init__(self):
+        self.calls = []
+
+    def create(self, *, messages, model, temperature=None, extra_body=None):
+        self.calls.append(
+            {
+                "messages": messages,
+                "model": model,
+                "temperature": temperature,
+                "extra_body": extra_body,
+            }
+        )
+
+
+def test_prompt_cache_key_is_sent_in_the_body(monkeypatch):
+
+    completions = Completions()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    monkeypatch.setattr(data_openai.generator, "_client", client)
+
+    messages = [{"role": "user", "content": "Rate each of the 3 [Considerations]"}]
+    data_openai.generator.send("gpt-4o-mini", messages, 0, "You are a citizen.")
+    data_openai.generator.send("gpt-4o-mini", messages, 0, "You are an expert.")
+
+    keys = [call["extra_body"]["prompt_cache_key"] for call in completions.calls]
+    assert keys[0] != keys[1]
+    assert completions.calls[0]["messages"][0]["role"] == "system"
+
+
+def test_batch_body_keeps_prompt_cache_key():
+
+    params = data_openai.generator.get_params(
+        "gpt-4o-mini", [{"role": "user", "content": "hi"}], 0
+    )
+
+    assert "prompt_cache_key" in params
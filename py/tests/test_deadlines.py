@@ -0,0 +1,108 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import deadlines
+from deadlines import DeadlineExceededError, get_stats
+
+MODEL = "gpt-4o-mini"
+API = "OpenAI API"
+
+
+class FakeGenerator:
+    """Replies after the given delays, one per request, in order."""
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def send(self, model, messages, temperature, system_prompt=None):
+        with self.lock:
+            i = len(self.requests)
+            self.requests.append(messages)
+        time.sleep(self.delays[i])
+        return SimpleNamespace(text=f"reply {i}")
+
+    def get_usage(self, model, res):
+        return 10, 5, 0
+
+    def get_cache_write_tokens(self, model, res):
+        return 0
+
+    def is_reasoning(self, model):
+        return False
+
+
+def wait_for_cost(stat, before):
+    """Waits for the abandoned request to finish and its cost to be recorded."""
+
+    for _ in range(100):
+        if get_stats(API)[stat] > before:
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture(autouse=True)
+def latencies(monkeypatch):
+    # fast observed requests, so deadlines and hedges apply within the tests
+    monkeypatch.setattr(deadlines, "_latencies", {})
+    monkeypatch.setattr(deadlines, "MIN_DEADLINE", 0.2)
+    for _ in range(deadlines.MIN_SAMPLES):
+        deadlines.observe(MODEL, "policies", 0.01)
+
+
+def test_default_deadline_without_samples():
+    assert deadlines.get_deadline(MODEL, "reasons") == deadlines.DEFAULT_DEADLINE
+    assert deadlines.get_deadline(MODEL, "policies") == 0.2
+
+
+def test_exceeded_deadline_raises():
+
+    before = get_stats(API)
+    generator = FakeGenerator([0.5])
+
+    with pytest.raises(DeadlineExceededError):
+        deadlines.send(generator, MODEL, [], 0, None, "policies")
+
+    assert get_stats(API)["timeouts"] == before["timeouts"] + 1
+
+    # still paid for once it finishes
+    assert wait_for_cost("timeout_cost", before["timeout_cost"])
+
+
+def test_hedge_wins_over_slow_request():
+
+    before = get_stats(API)
+    generator = FakeGenerator([0.5, 0])
+    messages = [{"role": "user", "content": "rank"}]
+
+    res = deadlines.send(generator, MODEL, messages, 0, None, "policies", hedge=True)
+
+    assert res.text == "reply 1"
+    stats = get_stats(API)
+    assert stats["hedged"] == before["hedged"] + 1
+    assert stats["hedge_won"] == before["hedge_won"] + 1
+
+    # both requests get their own copy, the caller's list can grow meanwhile
+    first, second = generator.requests
+    assert first == second == messages
+    assert first is not messages and second is not messages and first is not second
+
+    # the slow reply is paid for too
+    assert wait_for_cost("hedge_cost", before["hedge_cost"])
+
+
+def test_no_hedge_for_fast_request():
+
+    before = get_stats(API)["hedged"]
+    generator = FakeGenerator([0])
+
+    res = deadlines.send(generator, MODEL, [], 0, None, "policies", hedge=True)
+
+    assert res.text == "reply 0"
+    assert len(generator.requests) == 1
+    assert get_stats(API)["hedged"] == before
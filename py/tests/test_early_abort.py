@@ -0,0 +1,58 @@
+import pandas as pd
+
+from conftest import SURVEY, log_execution, read_output
+from generate_llm_data import generate_data
+from utils import CONSIDERATIONS, POLICIES, REASONS, PROMPT_R
+
+
+def run(**kwargs):
+    generate_data("gpt-4o-mini", 1, 0, SURVEY, preflight=False, **kwargs)
+
+
+def test_invalid_considerations_stop_the_conversation(fake_openai, old_exec_log):
+
+    client = fake_openai({CONSIDERATIONS: ["1. 9\n2. 9"]})
+    num_rows = len(read_output(POLICIES))
+
+    run()
+
+    # no policies or reasons request was sent
+    assert len(client.prompts) == 1
+    assert len(read_output(POLICIES)) == num_rows
+
+    df = pd.read_csv(old_exec_log)
+    assert df["num aborted completions"].tolist()[-1] == 1
+    assert df["num fail completions"].tolist()[-1] == 1
+    assert df["num requests"].tolist()[-1] == 1
+
+
+def test_invalid_policies_skip_the_reasons_turn(fake_openai):
+
+    client = fake_openai({POLICIES: ["1. 1\n2. 1\n3. 1\n4. 1"]})
+    num_rows = len(read_output(REASONS))
+
+    run()
+
+    assert len(client.prompts) == 2
+    assert PROMPT_R not in client.prompts
+    assert len(read_output(REASONS)) == num_rows
+
+
+def test_valid_conversation_has_every_turn(fake_openai):
+
+    client = fake_openai()
+    num_rows = len(read_output(REASONS))
+
+    run()
+
+    assert len(client.prompts) == 3
+    assert len(read_output(REASONS)) == num_rows + 1
+
+
+def test_abort_counts_reach_existing_exec_log(old_exec_log):
+
+    log_execution(num_aborted=3)
+
+    df = pd.read_csv(old_exec_log)
+    assert pd.isna(df["num aborted completions"].tolist()[0])
+    assert df["num aborted completions"].tolist()[1] == 3
@@ -0,0 +1,139 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+
+import pandas as pd
+
+import job_queue
+from conftest import SURVEY
+from job_queue import DONE, LEASED, PENDING, JobQueue, get_worker_id, run_queue
+from utils import OUTPUT_DIR, POLICIES
+
+MODEL = "gpt-4o-mini"
+
+
+def get_dead_worker_id():
+    # pid of a process that exited
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return f"{socket.gethostname()}:{process.pid}:{uuid.uuid4().hex[:8]}"
+
+
+def write_output(survey, cuids):
+    path = os.path.join(OUTPUT_DIR, "openai", MODEL, survey)
+    os.makedirs(path, exist_ok=True)
+    pd.DataFrame({"cuid": cuids}).to_csv(
+        os.path.join(path, f"{POLICIES}.csv"), index=False
+    )
+
+
+def get_counts(queue):
+    return queue.get_status().iloc[0][[DONE, LEASED, PENDING]].tolist()
+
+
+def test_lease_reserves_slots(tmp_path):
+
+    survey = uuid.uuid4().hex
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    queue.add(MODEL, survey, None, 0, 2)
+
+    worker = get_worker_id()
+    [(unit, cuids)] = queue.lease(worker)
+
+    assert unit == (MODEL, survey, None, 0)
+    assert len(set(cuids)) == 2
+    assert queue.lease(get_worker_id()) == []
+    assert get_counts(queue) == [0, 2, 0]
+
+    queue.complete(cuids[0])
+    queue.release(cuids[1])
+
+    [(_, retry)] = queue.lease(worker)
+    assert retry != [cuids[1]]
+    assert queue.get_status()["retries"].tolist() == [1]
+
+
+def test_reclaim_settles_slots_of_dead_worker(tmp_path):
+
+    survey = uuid.uuid4().hex
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    queue.add(MODEL, survey, None, 0, 3)
+
+    [(_, cuids)] = queue.lease(get_dead_worker_id())
+
+    # the dead run wrote its first completion
+    write_output(survey, [cuids[0]])
+
+    queue.reclaim()
+
+    assert get_counts(queue) == [1, 0, 2]
+
+    [(_, pending)] = queue.lease(get_worker_id())
+    assert len(pending) == 2
+    assert cuids[0] not in pending
+
+
+def test_reclaim_leaves_slots_of_live_worker(tmp_path):
+
+    survey = uuid.uuid4().hex
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    queue.add(MODEL, survey, None, 0, 2)
+
+    queue.lease(get_worker_id())
+    queue.reclaim()
+
+    assert get_counts(queue) == [0, 2, 0]
+
+
+def test_reclaim_settles_expired_leases(tmp_path):
+
+    survey = uuid.uuid4().hex
+    queue = JobQueue(str(tmp_path / "queue.sqlite"), lease_seconds=-1)
+    queue.add(MODEL, survey, None, 0, 2)
+
+    [(_, cuids)] = queue.lease(get_worker_id())
+    write_output(survey, cuids)
+
+    queue.reclaim()
+
+    assert get_counts(queue) == [2, 0, 0]
+
+
+def test_lease_is_bounded(tmp_path):
+
+    survey = uuid.uuid4().hex
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    queue.add(MODEL, survey, None, 0, 5)
+
+    worker = get_worker_id()
+    [(_, first)] = queue.lease(worker, limit=2)
+    assert len(first) == 2
+    assert get_counts(queue) == [0, 2, 3]
+
+    # slots released after the run started are left for the next run
+    started = time.time()
+    queue.release(first[0])
+
+    [(_, second)] = queue.lease(worker, limit=2, before=started)
+    [(_, third)] = queue.lease(worker, limit=2, before=started)
+    assert len(second) == 2 and len(third) == 1
+    assert queue.lease(worker, limit=2, before=started) == []
+    assert get_counts(queue) == [0, 4, 1]
+
+
+
+def test_run_queue_leases_in_chunks(fake_openai, tmp_path, monkeypatch):
+
+    monkeypatch.setattr(job_queue, "LEASE_SLOTS", 1)
+    fake_openai()
+
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    queue.add(MODEL, SURVEY, None, 0, 3)
+
+    jobs = run_queue(queue, preflight=False)
+
+    assert len(jobs) == 3
+    assert get_counts(queue) == [3, 0, 0]
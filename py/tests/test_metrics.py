@@ -0,0 +1,122 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import deadlines
+import metrics
+from conftest import SURVEY
+from job_queue import JobQueue, run_queue
+
+MODEL = "gpt-4o-mini"
+
+
+class SlowGenerator:
+    """Replies after the given delays, one per request, in order."""
+
+    def __init__(self, delays):
+        self.delays = list(delays)
+
+    def send(self, model, messages, temperature, system_prompt=None):
+        time.sleep(self.delays.pop(0))
+        return SimpleNamespace()
+
+    def get_usage(self, model, res):
+        return 10, 5, 0
+
+    def get_cache_write_tokens(self, model, res):
+        return 0
+
+    def is_reasoning(self, model):
+        return False
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Turns metrics on for the test, returns their registry."""
+
+    monkeypatch.setattr(metrics, "_metrics", metrics.Metrics())
+    return metrics._metrics.registry
+
+
+def get_value(registry, name, **labels):
+    return registry.get_sample_value(f"{metrics.NAMESPACE}_{name}", labels) or 0
+
+
+@pytest.fixture
+def latencies(monkeypatch):
+    # fast observed requests, so deadlines and hedges apply within the tests
+    monkeypatch.setattr(deadlines, "_latencies", {})
+    monkeypatch.setattr(deadlines, "MIN_DEADLINE", 0.2)
+    for _ in range(deadlines.MIN_SAMPLES):
+        deadlines.observe(MODEL, "policies", 0.01)
+
+
+def test_counts_requests_and_tokens(registry):
+
+    metrics.observe_request(MODEL, "policies", "success", 2, 100, 10)
+    metrics.observe_request(MODEL, "policies", "throttled")
+
+    labels = {"provider": "openai", "model": MODEL, "turn": "policies"}
+    assert get_value(registry, "requests_total", outcome="success", **labels) == 1
+    assert get_value(registry, "requests_total", outcome="throttled", **labels) == 1
+    assert get_value(registry, "request_latency_seconds_count", **labels) == 1
+    assert (
+        get_value(
+            registry, "tokens_total", provider="openai", model=MODEL, direction="output"
+        )
+        == 10
+    )
+
+
+def test_invalid_reasons_drop_counts(registry):
+
+    metrics.observe_invalid(MODEL, "policies", "Policies length mismatch (4/5).")
+
+    assert (
+        get_value(
+            registry,
+            "invalid_responses_total",
+            provider="openai",
+            model=MODEL,
+            turn="policies",
+            reason="Policies length mismatch",
+        )
+        == 1
+    )
+
+
+def test_counts_hedges_and_deadline_timeouts(registry, latencies):
+
+    labels = {"provider": "openai", "model": MODEL, "turn": "policies"}
+
+    deadlines.send(SlowGenerator([0.3, 0]), MODEL, [], 0, None, "policies", True)
+    assert get_value(registry, "hedges_total", **labels) == 1
+
+    with pytest.raises(deadlines.DeadlineExceededError):
+        deadlines.send(SlowGenerator([0.3]), MODEL, [], 0, None, "policies")
+    assert get_value(registry, "deadline_timeouts_total", **labels) == 1
+
+    # let the abandoned requests finish before the test directory is gone
+    time.sleep(0.4)
+
+
+def test_counts_retried_completions(registry, fake_openai, tmp_path):
+
+    # every policies answer is invalid, so the completion fails
+    fake_openai({"policies": ["1. 1\n2. 1\n3. 1\n4. 1"]})
+
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    queue.add(MODEL, SURVEY, None, 0, 1)
+    run_queue(queue, preflight=False)
+
+    assert get_value(registry, "retries_total", provider="openai", model=MODEL) == 1
+
+
+def test_off_without_start():
+
+    assert metrics.start() is None
+
+    # no-ops without metrics
+    metrics.observe_retry(MODEL)
+    metrics.observe_hedge(MODEL, "policies")
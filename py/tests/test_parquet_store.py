@@ -0,0 +1,107 @@
+import os
+
+import pandas as pd
+import pytest
+
+import parquet_store
+from conftest import SURVEY, read_output
+from generate_llm_data import generate_data
+from parquet_store import (
+    PARQUET_DIR,
+    append_rows,
+    compact_partition,
+    get_partition_path,
+    get_parts,
+    get_statements,
+    read_data,
+)
+from utils import POLICIES, flush_output
+
+COLUMNS = [
+    "cuid",
+    "created_at",
+    "provider",
+    "model",
+    "temperature",
+    "input_tokens",
+    "output_tokens",
+    "prompt_uid",
+    "P1. policy 0",
+    "P2. policy 1",
+]
+
+
+def row(cuid, temperature, ranks=(1, 2)):
+    values = [cuid, "2025-01-01 10:00:00", "meta", "meta-llama/Llama-3"]
+    return COLUMNS, values + [temperature, 100, 10, None, *ranks]
+
+
+@pytest.fixture
+def partition(tmp_path):
+    root = str(tmp_path)
+    path = get_partition_path(
+        POLICIES, "meta", "meta-llama/Llama-3", SURVEY, None, root
+    )
+    return root, path
+
+
+def test_reads_partitions_and_statements(partition):
+
+    root, path = partition
+    append_rows(path, [row("c0", 0), row("c1", 1)])
+
+    # the model's separator does not nest directories
+    assert os.path.basename(os.path.dirname(os.path.dirname(path))) == (
+        "model=meta-llama%2FLlama-3"
+    )
+
+    df = read_data(POLICIES, model="meta-llama/Llama-3", root=root)
+    assert sorted(df["cuid"]) == ["c0", "c1"]
+    assert df["model"].unique().tolist() == ["meta-llama/Llama-3"]
+    assert df["P1"].dtype == "int8"
+
+    df = read_data(POLICIES, survey=SURVEY, temperature=1, root=root)
+    assert df["cuid"].tolist() == ["c1"]
+
+    assert read_data(POLICIES, survey="other", root=root).empty
+    assert get_statements(
+        POLICIES, "meta", "meta-llama/Llama-3", SURVEY, root=root
+    ) == {"P1": "policy 0", "P2": "policy 1"}
+
+
+def test_compacts_parts(partition, monkeypatch):
+
+    root, path = partition
+    monkeypatch.setattr(parquet_store, "COMPACT_PARTS", 3)
+
+    append_rows(path, [row("c0", 0)])
+    append_rows(path, [row("c1", 0)])
+    assert len(get_parts(path)) == 2
+
+    # compacted once it has COMPACT_PARTS parts
+    append_rows(path, [row("c2", 0)])
+    assert len(get_parts(path)) == 1
+    assert sorted(read_data(POLICIES, root=root)["cuid"]) == ["c0", "c1", "c2"]
+
+
+def test_compaction_drops_duplicates(partition):
+
+    root, path = partition
+
+    # e.g. a compaction interrupted before removing its parts
+    append_rows(path, [row("c0", 0)])
+    append_rows(path, [row("c0", 0)])
+
+    assert compact_partition(path) == 2
+    assert read_data(POLICIES, root=root)["cuid"].tolist() == ["c0"]
+
+
+def test_run_writes_completions(fake_openai):
+
+    fake_openai()
+    generate_data("gpt-4o-mini", 1, 0, SURVEY, preflight=False, parquet=True)
+    flush_output()
+
+    df = read_data(POLICIES, model="gpt-4o-mini", survey=SURVEY, root=PARQUET_DIR)
+    assert set(df["cuid"]) <= set(read_output(POLICIES)["cuid"])
+    assert len(df) >= 1
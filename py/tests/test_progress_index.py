@@ -0,0 +1,80 @@
+import os
+
+import pandas as pd
+import pytest
+
+import progress_index
+from progress_index import INDEX_FILE, INDEXED_FILE, get_progress
+from writer import OutputWriter
+
+COLUMNS = ["cuid", "created_at", "temperature", "prompt_uid", "policy 0"]
+
+
+def append(dir_path, rows):
+    w = OutputWriter().start()
+    for row in rows:
+        w.write(os.path.join(dir_path, INDEXED_FILE), COLUMNS, row)
+    w.close()
+
+
+def test_counts_appended_rows(tmp_path, monkeypatch):
+
+    dir_path = str(tmp_path)
+    append(
+        dir_path,
+        [
+            ["c0", "2025-01-01 10:00:00", 0, None, 1],
+            ["c1", "2025-01-02 10:00:00", 0, "p1", 1],
+        ],
+    )
+
+    assert os.path.exists(os.path.join(dir_path, INDEX_FILE))
+
+    # later appends update the index without reading the file
+    def fail(*args):
+        raise AssertionError("rescanned")
+
+    monkeypatch.setattr(progress_index, "scan", fail)
+
+    append(dir_path, [["c2", "2025-01-03 10:00:00", 1, None, 1]])
+
+    assert get_progress(dir_path) == (3, "2025-01-03 10:00:00")
+    assert get_progress(dir_path, temperature=0) == (2, "2025-01-02 10:00:00")
+    assert get_progress(dir_path, temperature=0, prompt_uid="p1") == (
+        1,
+        "2025-01-02 10:00:00",
+    )
+    assert get_progress(dir_path, temperature=2) == (0, None)
+
+
+def test_rebuilds_stale_index(tmp_path):
+
+    dir_path = str(tmp_path)
+    append(dir_path, [["c0", "2025-01-01 10:00:00", 0, None, 1]])
+
+    # edited by hand, the index no longer matches the file
+    file_path = os.path.join(dir_path, INDEXED_FILE)
+    df = pd.read_csv(file_path)
+    pd.concat([df, df.assign(cuid="c1", temperature=1)]).to_csv(file_path, index=False)
+
+    assert get_progress(dir_path) == (2, "2025-01-01 10:00:00")
+    assert get_progress(dir_path, temperature=1) == (1, "2025-01-01 10:00:00")
+
+
+@pytest.mark.parametrize("content", [None, "{not json"])
+def test_missing_or_corrupt_index(tmp_path, content):
+
+    dir_path = str(tmp_path)
+    append(dir_path, [["c0", "2025-01-01 10:00:00", 0, None, 1]])
+
+    index_path = os.path.join(dir_path, INDEX_FILE)
+    os.remove(index_path)
+    if content is not None:
+        with open(index_path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+    assert get_progress(dir_path) == (1, "2025-01-01 10:00:00")
+
+
+def test_empty_directory(tmp_path):
+    assert get_progress(str(tmp_path)) == (0, None)
@@ -0,0 +1,29 @@
+import pandas as pd
+
+import rate_limit
+from rate_limit import DEFAULT_RPM, RPM_COLUMN, TPM_COLUMN, read_limit
+
+
+def test_no_limit_without_columns(monkeypatch):
+
+    # the test model list has no rpm or tpm columns
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    limiter = rate_limit.get_limiter("OpenAI API")
+
+    assert limiter.rpm is None and limiter.requests is None
+    assert limiter.tpm is None and limiter.tokens is None
+
+
+def test_strictest_limit_of_api():
+
+    df = pd.DataFrame({RPM_COLUMN: [500, None, 100], TPM_COLUMN: [None] * 3})
+
+    assert read_limit(df, RPM_COLUMN, DEFAULT_RPM) == 100
+    assert read_limit(df, TPM_COLUMN, None) is None
+
+
+def test_default_for_empty_values():
+
+    df = pd.DataFrame({RPM_COLUMN: [None, None]})
+
+    assert read_limit(df, RPM_COLUMN, DEFAULT_RPM) == DEFAULT_RPM
@@ -0,0 +1,65 @@
+import os
+
+import pandas as pd
+
+from registry import Table, get_table
+
+
+def write_models(path, models, mtime_ns):
+    pd.DataFrame({"model": models, "api": ["OpenAI API"] * len(models)}).to_csv(
+        path, index=False
+    )
+    # the same size and second would not tell the versions apart otherwise
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_lookups_by_key(tmp_path):
+
+    path = str(tmp_path / "llms.csv")
+    write_models(path, ["gpt-4o", "gpt-4o-mini"], 1_000_000_000)
+
+    table = Table(path, keys=("model", "api", "provider"))
+
+    assert table.get("model", "gpt-4o-mini")["api"] == "OpenAI API"
+    assert len(table.get_all("api", "OpenAI API")) == 2
+    assert table.get("model", "o3") is None
+    assert table.get_values("model") == ["gpt-4o", "gpt-4o-mini"]
+
+    # key columns the file does not have index nothing
+    assert table.get_all("provider", "openai") == []
+
+
+def test_reloads_once_modified(tmp_path):
+
+    path = str(tmp_path / "llms.csv")
+    write_models(path, ["gpt-4o"], 1_000_000_000)
+
+    table = Table(path, keys=("model",))
+    assert table.get("model", "gpt-4o") is not None
+
+    write_models(path, ["o3"], 2_000_000_000)
+
+    assert table.get("model", "gpt-4o") is None
+    assert table.get("model", "o3") is not None
+
+
+def test_returns_copies(tmp_path):
+
+    path = str(tmp_path / "llms.csv")
+    write_models(path, ["gpt-4o"], 1_000_000_000)
+
+    # callers may modify them
+    table = Table(path, keys=("model",))
+    table.get("model", "gpt-4o")["api"] = "changed"
+    df = table.get_df()
+    df["api"] = "changed"
+
+    assert table.get("model", "gpt-4o")["api"] == "OpenAI API"
+    assert table.get_df()["api"].tolist() == ["OpenAI API"]
+
+
+def test_one_table_per_path(tmp_path):
+
+    path = str(tmp_path / "llms.csv")
+
+    assert get_table(path, ("model",)) is get_table(path, ("model",))
@@ -0,0 +1,75 @@
+import os
+
+from conftest import SURVEY, read_output
+from generate_llm_data import generate_data
+from replay import read_survey_params, replay_log
+from results_store import read_completions
+from utils import (
+    META_DATA,
+    OUTPUT_DIR,
+    POLICIES,
+    REASONS,
+    REASONS_COLUMNS,
+    REPAIRS,
+    REPAIRS_COLUMNS,
+)
+
+INVALID_POLICIES = "1. 1\n2. 1\n3. 1\n4. 1"
+
+
+def run(**kwargs):
+    generate_data("gpt-4o-mini", 1, 0, SURVEY, preflight=False, **kwargs)
+
+
+def get_new_cuids(data_type, before):
+    return set(read_output(data_type)["cuid"]) - before
+
+
+def test_repaired_completion_is_listed(fake_openai, tmp_path):
+
+    client = fake_openai({POLICIES: [INVALID_POLICIES]})
+    before = set(read_output(POLICIES)["cuid"])
+
+    run(max_repairs=1)
+
+    [cuid] = get_new_cuids(POLICIES, before)
+    assert any(["Your ranks above are invalid" in p for p in client.prompts])
+
+    repairs = read_output(REPAIRS)
+    assert repairs.columns.tolist() == REPAIRS_COLUMNS
+    assert repairs.set_index("cuid")["repairs"][cuid] == 1
+
+    # reasons keep their columns
+    assert read_output(REASONS).columns.tolist() == META_DATA + REASONS_COLUMNS
+
+    survey_dir = os.path.join(OUTPUT_DIR, "openai", "gpt-4o-mini", SURVEY)
+    completions = {row[0]: row for row in read_completions(survey_dir)}
+    assert completions[cuid][9] == 1
+
+    # replay counts the repeated turns
+    log_path = os.path.join(OUTPUT_DIR, "openai", "gpt-4o-mini", "request_log.csv")
+    replay_log(log_path, read_survey_params(), {}, str(tmp_path))
+    replayed = os.path.join(tmp_path, "openai", "gpt-4o-mini", SURVEY, "repairs.csv")
+    assert cuid in open(replayed).read()
+
+
+def test_clean_completion_is_not_listed(fake_openai):
+
+    fake_openai()
+    before = set(read_output(POLICIES)["cuid"])
+
+    run(max_repairs=1)
+
+    [cuid] = get_new_cuids(POLICIES, before)
+    assert cuid not in set(read_output(REPAIRS)["cuid"])
+
+
+def test_no_repair_without_max_repairs(fake_openai):
+
+    client = fake_openai({POLICIES: [INVALID_POLICIES]})
+    before = set(read_output(POLICIES)["cuid"])
+
+    run()
+
+    assert get_new_cuids(POLICIES, before) == set()
+    assert len(client.prompts) == 2
@@ -0,0 +1,71 @@
+import os
+
+import pandas as pd
+import pytest
+
+import replay
+from conftest import SURVEY, read_output
+from generate_llm_data import generate_data
+from replay import INCOMPLETE, SUCCESS, read_survey_params, replay_log
+from utils import OUTPUT_DIR, POLICIES, REASONS
+
+LOG_PATH = os.path.join(OUTPUT_DIR, "openai", "gpt-4o-mini", "request_log.csv")
+
+
+@pytest.fixture
+def logged(fake_openai):
+    """Runs two completions, returns their cuids."""
+
+    fake_openai()
+    before = set(read_output(POLICIES)["cuid"])
+    generate_data("gpt-4o-mini", 2, 0, SURVEY, preflight=False)
+
+    return set(read_output(POLICIES)["cuid"]) - before
+
+
+def read_replayed(output_dir, data_type):
+    path = os.path.join(output_dir, "openai", "gpt-4o-mini", SURVEY, f"{data_type}.csv")
+    return pd.read_csv(path)
+
+
+def test_replays_completions_across_chunks(logged, tmp_path, monkeypatch):
+
+    # the turns of a completion span several chunks
+    monkeypatch.setattr(replay, "CHUNK_ROWS", 2)
+
+    stats = replay_log(LOG_PATH, read_survey_params(), {}, str(tmp_path))
+
+    replayed = read_replayed(str(tmp_path), POLICIES).set_index("cuid")
+    generated = read_output(POLICIES).drop_duplicates("cuid").set_index("cuid")
+
+    assert stats[SUCCESS] == len(generated)
+    assert logged <= set(replayed.index)
+    ranks = [column for column in generated.columns if column.startswith("policy")]
+    assert replayed.loc[generated.index, ranks].equals(generated[ranks])
+
+
+def test_missing_reasons_turn_is_incomplete(logged, tmp_path):
+
+    # e.g. the reasons request failed
+    cuid = sorted(logged)[0]
+    log = pd.read_csv(LOG_PATH)
+    log = log[~((log["cuid"] == cuid) & (log["type"] == REASONS))]
+
+    log_path = tmp_path / "logs" / "openai" / "gpt-4o-mini" / "request_log.csv"
+    os.makedirs(log_path.parent)
+    log.to_csv(log_path, index=False)
+
+    output_dir = str(tmp_path / "replay")
+    stats = replay_log(str(log_path), read_survey_params(), {}, output_dir)
+
+    assert stats[INCOMPLETE] == 1
+    assert cuid not in set(read_replayed(output_dir, POLICIES)["cuid"])
+
+    # runs without the reasons turn
+    stats = replay_log(
+        str(log_path), read_survey_params(), {}, output_dir, reason=False
+    )
+
+    assert stats[INCOMPLETE] == 0
+    reasons = read_replayed(output_dir, REASONS).set_index("cuid")
+    assert reasons.loc[cuid, "reason"] == "Reasoning was not requested."
@@ -0,0 +1,114 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from conftest import log_execution
+from data_llm import DataGenerator
+from response_cache import CacheSession, ResponseCache, get_key
+
+
+class EchoGenerator(DataGenerator):
+    """Answers with the last prompt, counting requests."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = 0
+
+    def send(self, model, messages, temperature, system_prompt=None):
+        self.requests += 1
+        return messages[-1]["content"]
+
+    def get_text(self, model, res):
+        return f"echo: {res}"
+
+    def get_usage(self, model, res):
+        return 10, 2, 0
+
+
+def test_put_and_get(tmp_path):
+
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    key = get_key("gpt-4o-mini", [{"role": "user", "content": "hi"}], 0)
+
+    assert cache.get(key) is None
+
+    cache.put(key, {"response": "hello", "model_version": "gpt-4o-mini-2024"})
+
+    assert cache.get(key) == {"response": "hello", "model_version": "gpt-4o-mini-2024"}
+    assert key != get_key("gpt-4o-mini", [{"role": "user", "content": "hi"}], 0, "sp")
+
+
+def test_evicts_least_recently_used(tmp_path):
+
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_bytes=30)
+
+    # 10 bytes each
+    for key in ["a", "b", "c"]:
+        cache.put(key, "x" * 8)
+    cache.get("a")
+    cache.put("d", "x" * 8)
+
+    assert [cache.get(key) is not None for key in "abcd"] == [True, False, True, True]
+    assert cache.get_size() == 30
+
+
+def test_size_follows_writes(tmp_path):
+
+    path = str(tmp_path / "cache.sqlite")
+
+    # a cache from before the size was kept
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+        "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+    )
+    conn.execute("INSERT INTO responses VALUES ('a', '\"aaa\"', 5, 0)")
+    conn.commit()
+    conn.close()
+
+    cache = ResponseCache(path, max_bytes=100)
+    assert cache.get_size() == 5
+
+    cache.put("a", "a" * 8)  # replaced
+    cache.put("b", "b" * 18)
+    assert cache.get_size() == 30
+
+    cache.put("c", "c" * 98)  # evicts a and b
+    assert cache.get_size() == 100
+    assert cache.get("a") is None and cache.get("b") is None
+
+    assert ResponseCache(path).get_size() == 100
+
+
+def test_send_turn_answers_from_cache(tmp_path):
+
+    session = CacheSession(ResponseCache(str(tmp_path / "cache.sqlite")))
+    generator = EchoGenerator()
+    messages = [{"role": "user", "content": "hi"}]
+
+    first = generator.send_turn("gpt-4o-mini", messages, 0, cache=session)
+    second = generator.send_turn("gpt-4o-mini", messages, 0, cache=session)
+
+    assert first == ("echo: hi", 10, 2, 0, 0, "gpt-4o-mini")
+    # cache hits cost nothing
+    assert second == ("echo: hi", 0, 0, 0, 0, "gpt-4o-mini")
+    assert generator.requests == 1
+    assert (session.hits, session.misses) == (1, 1)
+
+    # sampled requests are never cached
+    generator.send_turn("gpt-4o-mini", messages, 1, cache=session)
+    generator.send_turn("gpt-4o-mini", messages, 1, cache=session)
+    assert generator.requests == 3
+    assert (session.hits, session.misses) == (1, 1)
+
+
+def test_cache_counts_reach_existing_exec_log(old_exec_log):
+
+    log_execution(cache_hits=4, cache_misses=2)
+
+    df = pd.read_csv(old_exec_log)
+    assert len(df) == 2
+    assert df["cache hits"].tolist()[1] == 4
+    assert df["cache misses"].tolist()[1] == 2
+    assert pd.isna(df["cache hits"].tolist()[0])
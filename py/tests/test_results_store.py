@@ -0,0 +1,98 @@
+import os
+import shutil
+
+from conftest import SURVEY, read_output
+from generate_llm_data import generate_data
+from results_store import ResultsStore, get_store
+from utils import OUTPUT_DIR, POLICIES
+
+MODEL = "gpt-4o-mini"
+
+
+def completion(cuid, temperature=0, prompt_uid=None):
+    return {
+        "cuid": cuid,
+        "created_at": f"2025-01-01 10:00:0{cuid[-1]}",
+        "provider": "openai",
+        "model": MODEL,
+        "survey": SURVEY,
+        "prompt_uid": prompt_uid,
+        "temperature": temperature,
+        "input_tokens": 300,
+        "output_tokens": 30,
+        "repairs": 0,
+        "reason": "The policies balance costs and benefits.",
+        "policies": "[1, 2, 3, 4]",
+        "considerations": "[1, 2, 3, 4, 5, 6]",
+    }
+
+
+def request(cuid, data_type):
+    return {"cuid": cuid, "model": MODEL, "type": data_type, "response": "1. 1"}
+
+
+def count_requests(store, cuid):
+    return store.conn.execute(
+        "SELECT COUNT(*) FROM requests WHERE cuid = ?", (cuid,)
+    ).fetchone()[0]
+
+
+def test_saves_completions_with_their_requests(tmp_path):
+
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+
+    store.add_request(request("c1", "considerations"))
+    store.add_request(request("c1", "policies"))
+    store.save_completion("c1", completion("c1"))
+
+    # failed completions keep their requests only
+    store.add_request(request("c2", "considerations"))
+    store.save_completion("c2")
+
+    # saved once, e.g. a recovered duplicate
+    store.save_completion("c1", completion("c1"))
+
+    store.save_completion("c3", completion("c3", temperature=1, prompt_uid="p1"))
+
+    assert count_requests(store, "c1") == 2
+    assert count_requests(store, "c2") == 1
+
+    progress = store.get_progress()
+    assert progress[["model", "survey", "completions"]].values.tolist() == [
+        [MODEL, SURVEY, 2]
+    ]
+    assert progress["last_updated"].tolist() == ["2025-01-01 10:00:03"]
+
+    assert store.get_progress(temperature=0)["completions"].tolist() == [1]
+    assert store.get_progress(prompt_uid="p1")["completions"].tolist() == [1]
+    assert store.get_progress(temperature=2).empty
+
+    store.close()
+
+
+def test_run_saves_completions_and_imports_outputs(fake_openai, tmp_path):
+
+    fake_openai()
+    store = get_store()
+    before = store.get_progress()["completions"].sum()
+
+    generate_data(MODEL, 1, 0, SURVEY, preflight=False, store=True)
+
+    assert store.get_progress()["completions"].sum() == before + 1
+    [cuid] = store.conn.execute(
+        "SELECT cuid FROM completions ORDER BY created_at DESC LIMIT 1"
+    ).fetchone()
+    assert count_requests(store, cuid) == 3
+
+    # the csv outputs of every run so far, with and without the store
+    survey_dir = os.path.join("openai", MODEL, SURVEY)
+    shutil.copytree(os.path.join(OUTPUT_DIR, survey_dir), tmp_path / survey_dir)
+
+    imported = ResultsStore(str(tmp_path / "results.sqlite"))
+    imported.import_outputs(str(tmp_path))
+
+    num_completions = read_output(POLICIES)["cuid"].nunique()
+    progress = imported.get_progress()
+    assert progress.set_index("model").loc[MODEL, "completions"] == num_completions
+
+    imported.close()
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from scheduler import plan
+
+ESTIMATES = pd.DataFrame(
+    [
+        # model, api, cost and seconds per completion
+        ("cheap-slow", "A", 0.001, 60),
+        ("pricey-fast", "A", 0.01, 5),
+        ("mid", "A", 0.005, 20),
+        ("other", "B", 0.002, 10),
+    ],
+    columns=["model", "api", "cost_per_completion", "seconds_per_completion"],
+).set_index("model")
+
+
+def get_units(*models, n=10):
+    return [
+        {"model": m, "survey": "ccps", "prompt_uid": None, "temperature": 0, "n": n}
+        for m in models
+    ]
+
+
+def test_cost_orders_each_api_cheapest_first():
+
+    units = get_units("pricey-fast", "mid", "cheap-slow")
+    schedule = plan(units, "cost", ESTIMATES)
+
+    assert schedule["model"].tolist() == ["cheap-slow", "mid", "pricey-fast"]
+    assert schedule["eta"].tolist() == [600, 800, 850]
+    assert schedule["cost"].tolist() == pytest.approx([0.01, 0.05, 0.1])
+
+
+def test_time_orders_each_api_fastest_first():
+
+    units = get_units("cheap-slow", "mid", "pricey-fast")
+    schedule = plan(units, "time", ESTIMATES)
+
+    assert schedule["model"].tolist() == ["pricey-fast", "mid", "cheap-slow"]
+
+
+def test_interleaves_apis_longest_first():
+
+    units = get_units("other", "mid", "cheap-slow") + get_units("other", n=1)
+    schedule = plan(units, "cost", ESTIMATES)
+
+    # A has the most seconds, so it leads each round
+    assert list(zip(schedule["api"], schedule["model"], schedule["n"])) == [
+        ("A", "cheap-slow", 10),
+        ("B", "other", 1),
+        ("A", "mid", 10),
+        ("B", "other", 10),
+    ]
+
+
+def test_keeps_other_keys():
+
+    units = [dict(u, label="x") for u in get_units("mid")]
+
+    assert plan(units, "cost", ESTIMATES)["label"].tolist() == ["x"]
+
+
+def test_rejects_unknown_objective():
+
+    with pytest.raises(ValueError):
+        plan(get_units("mid"), "speed", ESTIMATES)
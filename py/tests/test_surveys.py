@@ -0,0 +1,73 @@
+import os
+
+import pandas as pd
+import pytest
+
+import surveys
+from conftest import SURVEY, write_survey
+from surveys import get_cache_path, get_compiled_surveys, get_survey_statements
+
+
+def write_workbook(path, num_policies=4, broken=False):
+    with pd.ExcelWriter(path) as writer:
+        write_survey(writer, SURVEY, num_policies, 6)
+        if broken:
+            pd.DataFrame({"policies": ["policy 0"]}).to_excel(
+                writer, sheet_name="broken", index=False
+            )
+
+
+@pytest.fixture
+def workbook(tmp_path, monkeypatch):
+    # a fresh process, nothing loaded yet
+    monkeypatch.setattr(surveys, "_compiled", {})
+    path = str(tmp_path / "surveys.xlsx")
+    write_workbook(path, broken=True)
+    return path
+
+
+def test_compiles_sorted_statements(workbook):
+
+    compiled = get_compiled_surveys(workbook)
+
+    assert os.path.exists(get_cache_path(workbook))
+    assert compiled["sheet_names"] == [SURVEY, "broken"]
+
+    policies, considerations, scale_max, q_method = get_survey_statements(
+        compiled["surveys"][SURVEY]
+    )
+    # policies_order is reversed in the sheet
+    assert policies == ["policy 3", "policy 2", "policy 1", "policy 0"]
+    assert considerations == [f"consideration {i}" for i in range(6)]
+    assert scale_max == 7 and q_method is False
+
+    # sheets that are not formatted correctly keep their error
+    with pytest.raises(ValueError):
+        get_survey_statements(compiled["surveys"]["broken"])
+
+
+def test_reads_cache_of_unchanged_workbook(workbook, monkeypatch):
+
+    get_compiled_surveys(workbook)
+
+    # another process reads the saved cache, without reading the workbook
+    monkeypatch.setattr(surveys, "_compiled", {})
+
+    def fail(*args):
+        raise AssertionError("recompiled")
+
+    monkeypatch.setattr(surveys, "compile_surveys", fail)
+
+    compiled = get_compiled_surveys(workbook)
+    assert len(compiled["surveys"][SURVEY]["policies"]) == 4
+
+
+def test_recompiles_changed_workbook(workbook):
+
+    get_compiled_surveys(workbook)
+
+    write_workbook(workbook, num_policies=5)
+
+    compiled = get_compiled_surveys(workbook)
+    assert compiled["sheet_names"] == [SURVEY]
+    assert len(compiled["surveys"][SURVEY]["policies"]) == 5
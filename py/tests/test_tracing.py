@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def trace_path(tmp_path, monkeypatch):
+    """Turns tracing on for the test, returns the trace file path."""
+
+    path = str(tmp_path / "trace.jsonl")
+    monkeypatch.setattr(tracing, "_exporter", tracing.Exporter(path))
+    return path
+
+
+def test_spans_nest_in_their_trace(trace_path):
+
+    with tracing.span("completion", "c1"):
+        with tracing.span("turn", turn="policies") as turn:
+            with tracing.span("send"):
+                pass
+    with tracing.span("completion", "c2"):
+        pass
+    tracing.stop()
+
+    df = tracing.read_trace(trace_path).set_index("name", drop=False)
+    completion = df[df["trace_id"] == "c1"].loc["completion"]
+
+    assert df.loc["send", "parent_id"] == turn.span_id
+    assert df.loc["turn", "parent_id"] == completion["span_id"]
+    assert df.loc["turn", "attributes"] == {"turn": "policies"}
+    assert pd.isna(completion["parent_id"])
+    assert sorted(df["trace_id"]) == ["c1", "c1", "c1", "c2"]
+
+
+def test_records_errors(trace_path):
+
+    with pytest.raises(ValueError):
+        with tracing.span("completion", "c1"):
+            raise ValueError("Policies length mismatch")
+    tracing.stop()
+
+    [error] = tracing.read_trace(trace_path)["error"]
+    assert error == "ValueError: Policies length mismatch"
+
+
+def test_breakdown_by_phase(trace_path):
+
+    for cuid in ["c1", "c2"]:
+        with tracing.span("completion", cuid):
+            with tracing.span("turn", turn="policies"):
+                pass
+            with tracing.span("turn", turn="reasons"):
+                pass
+    tracing.stop()
+
+    breakdown = tracing.get_breakdown(tracing.read_trace(trace_path))
+
+    assert sorted(breakdown.index) == ["completion", "turn:policies", "turn:reasons"]
+    assert breakdown["spans"].tolist() == [2, 2, 2]
+    assert (breakdown["self_s"] <= breakdown["total_s"]).all()
+
+
+def test_off_without_start():
+
+    assert tracing._exporter is None
+
+    with tracing.span("completion", "c1") as s:
+        assert s is None
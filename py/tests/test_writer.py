@@ -0,0 +1,199 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import writer
+from writer import OutputWriter, get_journal_path
+
+
+def write_journal(path, entries):
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+def row(path, batch, values):
+    return {
+        "format": "csv",
+        "path": path,
+        "batch": batch,
+        "columns": ["cuid", "rank"],
+        "values": values,
+    }
+
+
+def flushed(path, batch):
+    return {"format": "csv", "flushed": path, "batch": batch}
+
+
+def test_recovers_rows_of_dead_journal(tmp_path):
+
+    a = str(tmp_path / "a.csv")
+    b = str(tmp_path / "b.csv")
+
+    # a's batch 0 was flushed and batch 1 was not. b's batch 0 failed and
+    # its batch 1 was flushed, so only b's batch 0 is pending
+    dead = tmp_path / ".write_journal-1-dead.jsonl"
+    write_journal(
+        dead,
+        [
+            row(a, 0, ["a0", 1]),
+            row(b, 0, ["b0", 1]),
+            flushed(a, 0),
+            row(a, 1, ["a1", 2]),
+            row(b, 1, ["b1", 2]),
+            flushed(b, 1),
+        ],
+    )
+    with open(dead, "a", encoding="utf-8") as f:
+        f.write('{"format": "csv", "path"')  # partial line of a crash
+
+    w = OutputWriter(get_journal_path(str(tmp_path))).start()
+    w.close()
+
+    assert pd.read_csv(a)["cuid"].tolist() == ["a1"]
+    assert pd.read_csv(b)["cuid"].tolist() == ["b0"]
+    assert not dead.exists()
+    assert not os.path.exists(w.journal_path)
+
+
+def test_leaves_journal_of_live_writer(tmp_path):
+
+    path = str(tmp_path / "a.csv")
+
+    live = OutputWriter(
+        get_journal_path(str(tmp_path)), flush_rows=100, flush_seconds=60
+    ).start()
+    live.write(path, ["cuid", "rank"], ["a0", 1])
+    live.flush()
+    live.write(path, ["cuid", "rank"], ["a1", 2])
+
+    # the second writer's lock is on its own open file, so it conflicts
+    # with the live writer's even in the same process
+    other = OutputWriter(get_journal_path(str(tmp_path))).start()
+    other.recover_journals()
+    other.close()
+
+    assert os.path.exists(live.journal_path)
+    assert pd.read_csv(path)["cuid"].tolist() == ["a0"]
+
+    live.close()
+
+    assert pd.read_csv(path)["cuid"].tolist() == ["a0", "a1"]
+    assert not os.path.exists(live.journal_path)
+
+
+def test_close_without_journal_file(tmp_path):
+
+    w = OutputWriter(get_journal_path(str(tmp_path))).start()
+    os.remove(w.journal_path)
+    w.close()
+    w.thread.join(5)
+
+    assert w.journal is None
+    assert not w.thread.is_alive()
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_flush_raises_once_writer_died(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(writer, "WAIT_SECONDS", 0.01)
+
+    w = OutputWriter(get_journal_path(str(tmp_path))).start()
+
+    def fail(*args):
+        raise OSError("No space left on device")
+
+    w.buffer = fail
+    w.write(str(tmp_path / "a.csv"), ["cuid"], ["a0"])
+    w.thread.join(5)
+
+    with pytest.raises(RuntimeError, match="output writer stopped"):
+        w.flush()
+    with pytest.raises(RuntimeError, match="output writer stopped"):
+        w.close()
+
+
+def test_adds_new_columns_to_existing_file(tmp_path):
+
+    path = str(tmp_path / "request_log.csv")
+    pd.DataFrame({"cuid": ["a0", "a1"], "response": ["1. 2\n2. 3", 'say "hi"']}).to_csv(
+        path, index=False
+    )
+
+    w = OutputWriter(get_journal_path(str(tmp_path))).start()
+    w.write(path, ["cuid", "response", "cached_tokens"], ["a2", "ok", 128])
+    w.close()
+
+    df = pd.read_csv(path)
+    assert df.columns.tolist() == ["cuid", "response", "cached_tokens"]
+    assert df["response"].tolist() == ["1. 2\n2. 3", 'say "hi"', "ok"]
+    assert df["cached_tokens"].tolist()[2] == 128
+    assert df["cached_tokens"].isna().tolist() == [True, True, False]
+
+
+def test_retries_failed_rows_on_next_flush(tmp_path):
+
+    path = str(tmp_path / "a.csv")
+
+    w = OutputWriter(
+        get_journal_path(str(tmp_path)), flush_rows=100, flush_seconds=60
+    ).start()
+
+    # the first flush fails, e.g. a full disk
+    append_rows = w.append_rows
+    calls = []
+
+    def fail_once(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise OSError("No space left on device")
+        append_rows(*args)
+
+    w.append_rows = fail_once
+
+    w.write(path, ["cuid", "rank"], ["a0", 1])
+    w.flush()
+
+    assert not os.path.exists(path)
+    assert w.failed
+    assert os.path.getsize(w.journal_path) > 0
+
+    # written with the next batch, in order, then the journal starts over
+    w.write(path, ["cuid", "rank"], ["a1", 2])
+    w.flush()
+
+    assert pd.read_csv(path)["cuid"].tolist() == ["a0", "a1"]
+    assert not w.failed
+    assert os.path.getsize(w.journal_path) == 0
+
+    w.close()
+
+    assert pd.read_csv(path)["cuid"].tolist() == ["a0", "a1"]
+    assert not os.path.exists(w.journal_path)
+
+
+def test_failed_rows_stay_journaled(tmp_path):
+
+    path = str(tmp_path / "a.csv")
+    journal_path = get_journal_path(str(tmp_path))
+
+    w = OutputWriter(journal_path, flush_rows=100, flush_seconds=60).start()
+
+    def fail(*args):
+        raise OSError("No space left on device")
+
+    w.append_rows = fail
+    w.write(path, ["cuid", "rank"], ["a0", 1])
+    w.flush()
+    w.write(path, ["cuid", "rank"], ["a1", 2])
+    w.close()
+
+    # kept for the next start, both batches are pending
+    with open(journal_path, encoding="utf-8") as f:
+        pending = writer.read_journal(f)
+    assert pending == {
+        ("csv", path): [(["cuid", "rank"], ["a0", 1]), (["cuid", "rank"], ["a1", 2])]
+    }
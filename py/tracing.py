@@ -0,0 +1,206 @@
+import argparse
+import atexit
+import contextvars
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+# span tracing of each completion, written to a JSONL file (--trace). every
+# span has a name, its completion uid as trace id, its parent span, start
+# time, duration and attributes, e.g. the turn of a request. the current
+# span is a context variable, so spans nest across the engine's threads.
+# a completion's trace is:
+#   build_prompts                  shuffles and prompts, when the job is prepared
+#   completion                     from dispatch to the last response
+#     slot_wait                    waiting for a concurrency slot
+#     turn (turn, attempt)         one request of the conversation
+#       cache                      response cache lookup
+#       circuit_wait               waiting while the API's circuit is open
+#       rate_limit_wait            waiting for rate limit budget
+#       send                       the API call, with deadline and hedging
+#       log_request                request log append
+#       validate                   turn check
+#     parse                        ranks and reason parsing
+#   handle                         on the event loop, after the completion
+#     validate                     completion check
+#     write                        output rows to the writer
+#     finish                       results store and job queue
+# `python tracing.py trace.jsonl` prints the time spent per phase.
+FLUSH_SPANS = 1000  # spans buffered before writing
+
+_current = contextvars.ContextVar("span", default=None)
+_exporter = None
+_lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.start_counter = time.perf_counter()
+        self.error = None
+
+
+class Exporter:
+    """Buffers finished spans and appends them to a JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.buffer = []
+
+    def export(self, span, duration):
+
+        line = json.dumps(
+            {
+                "trace_id": span.trace_id,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "name": span.name,
+                "start": span.start,
+                "duration_ms": round(duration * 1000, 3),
+                "thread": threading.current_thread().name,
+                "attributes": span.attributes,
+                "error": span.error,
+            },
+            default=str,
+        )
+
+        with self.lock:
+            self.buffer.append(line)
+            if len(self.buffer) >= FLUSH_SPANS:
+                self.flush_locked()
+
+    def flush_locked(self):
+        if not self.buffer:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(self.buffer) + "\n")
+        self.buffer = []
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+
+def start(path=None):
+    """Turns tracing on, spans are appended to path."""
+
+    global _exporter
+
+    if path is None:
+        return
+
+    with _lock:
+        if _exporter is None:
+            _exporter = Exporter(path)
+            atexit.register(stop)
+            print(f"Trace: {path}")
+
+
+def stop():
+    if _exporter is not None:
+        _exporter.flush()
+
+
+@contextmanager
+def span(name, cuid=None, **attributes):
+    """
+    Records the enclosed code as a span, child of the current one. cuid
+    starts a new trace, otherwise the parent's trace is used.
+    """
+
+    if _exporter is None:
+        yield None
+        return
+
+    parent = _current.get()
+    trace_id = cuid if cuid else (parent.trace_id if parent else None)
+    parent_id = parent.span_id if parent and parent.trace_id == trace_id else None
+
+    s = Span(name, trace_id, parent_id, attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        _exporter.export(s, time.perf_counter() - s.start_counter)
+
+
+def read_trace(file_path):
+
+    with open(file_path, encoding="utf-8") as f:
+        df = pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+    return df
+
+
+def get_breakdown(df):
+    """
+    Returns the time per phase: a span's name, and its turn for requests.
+    self_ms is the span's time minus its children's, where the time goes.
+    """
+
+    turns = [(a or {}).get("turn") for a in df["attributes"]]
+    df = df.assign(
+        phase=[f"{n}:{t}" if t else n for n, t in zip(df["name"], turns)],
+    )
+
+    children = df.groupby("parent_id")["duration_ms"].sum()
+    df["self_ms"] = df["duration_ms"] - df["span_id"].map(children).fillna(0)
+
+    breakdown = df.groupby("phase").agg(
+        spans=("span_id", "count"),
+        errors=("error", "count"),
+        total_s=("duration_ms", lambda x: x.sum() / 1000),
+        self_s=("self_ms", lambda x: x.sum() / 1000),
+        mean_ms=("duration_ms", "mean"),
+        p50_ms=("duration_ms", "median"),
+        p95_ms=("duration_ms", lambda x: x.quantile(0.95)),
+        max_ms=("duration_ms", "max"),
+    )
+    breakdown["self_%"] = breakdown["self_s"] * 100 / breakdown["self_s"].sum()
+
+    return breakdown.sort_values("self_s", ascending=False).round(2)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Prints the time per phase of the completions in a trace file."
+    )
+    parser.add_argument("trace", type=str, help="path to the JSONL trace file")
+    parser.add_argument(
+        "--cuid",
+        type=str,
+        required=False,
+        default=None,
+        help="only the spans of one completion",
+    )
+
+    args = parser.parse_args()
+
+    df = read_trace(args.trace)
+    if args.cuid:
+        df = df[df["trace_id"] == args.cuid]
+
+    if df.empty:
+        print("No spans found.")
+        return
+
+    print(f"Completions: {df['trace_id'].nunique()}, spans: {len(df)}\n")
+    print(get_breakdown(df).to_string())
+
+
+if __name__ == "__main__":
+    main()
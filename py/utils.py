@@ -5,10 +5,22 @@ import random
 import sys
 import numpy as np
 
+import progress_index
+import registry
+from writer import get_writer
+
 LLM_INFO_PATH = "private/llms_v3.csv"
 OUTPUT_DIR = "llm_data"
 PROGRESS_FILE = "progress.csv"
 EXEC_LOG_FILE = "exec_log.csv"
+
+# prompt cache tokens are billed apart from other input tokens. prices per 1M
+# tokens come from these optional columns of LLM_INFO_PATH, or else from the
+# provider's price factors of price_1M_input (cache reads, cache writes).
+# providers without factors bill cached tokens at the input price here.
+CACHE_READ_PRICE_COLUMN = "price_1M_cache_read"
+CACHE_WRITE_PRICE_COLUMN = "price_1M_cache_write"
+CACHE_PRICE_FACTORS = {"anthropic": (0.1, 1.25)}
 META_DATA = [
     "cuid",
     "created_at",
@@ -24,6 +36,13 @@ POLICIES = "policies"
 CONSIDERATIONS = "considerations"
 REASONS = "reasons"
 
+# reasons files keep their original columns, the repair turns of repaired
+# completions are listed in a repairs file next to them, by cuid. completions
+# that are not in it had no repair turns.
+REASONS_COLUMNS = ["reason"]
+REPAIRS = "repairs"
+REPAIRS_COLUMNS = ["cuid", "repairs"]
+
 # https://ai.google.dev/gemini-api/docs/prompting-intro
 
 # generic considerations prompt
@@ -70,6 +89,9 @@ following the format in the [Example output].
 ## [Policies]:
 """
 
+# headers after which the shuffled statements are listed
+STATEMENTS_HEADERS = ["## [Considerations]:\n", "## [Policies]:\n"]
+
 PROMPT_R = """## Instructions:
 - In a single line, explain your ratings above within 100 characters or less.
 - Do not include any additional formatting, such as bullets or special characters.
@@ -78,22 +100,43 @@ PROMPT_R = """## Instructions:
 
 PROMPT_S = "Answer the following prompts as {0} {1}, who {2}."
 
+# follow-up prompts for invalid responses, {0} is what was wrong
+PROMPT_C_REPAIR = """Your ratings above are invalid: {0}
+
+## Instructions:
+- Rate the {1} [Considerations] again, in the same order, from 1 to {2}.{3}
+- Your response must have exactly {1} lines in total, one rating per line.
+- Do NOT include any additional text in your response.
+"""
+
+PROMPT_P_REPAIR = """Your ranks above are invalid: {0}
+
+## Instructions:
+- Rank the {1} [Policies] again, in the same order, from 1 to {1}.
+- Use each rank from 1 to {1} exactly once, with no duplicate ranks.
+- Your response must have exactly {1} lines in total, one rank per line.
+- Do NOT include any additional text in your response.
+"""
+
 # Rate the considerations using a ranked based sort choice sorting process.
 Q_METHOD_INSTRUCTION = """
 - Using the Q Methodology, rate the statements following a Fixed Quasi-Normal Distribution between 1 and {0}."""
 
 
+def get_llm_info():
+    return registry.get_table(LLM_INFO_PATH, keys=("model", "provider", "api"))
+
+
 def get_models(include_all=True):
-    models = pd.read_csv(LLM_INFO_PATH)
+    models = get_llm_info().get_df()
     models = models if include_all else models[models["included"] == True]
     return models
 
 
 def get_model_info(model):
-    df = pd.read_csv(LLM_INFO_PATH)
-    model_data = df[df["model"] == model].to_dict(orient="records")
+    model_data = get_llm_info().get("model", model)
     if model_data:
-        return model_data[0]
+        return model_data
     else:
         raise ValueError(f"Model {model} not found in {LLM_INFO_PATH}")
 
@@ -108,9 +151,42 @@ def get_api(model):
     return model_info["api"]
 
 
+def get_cost(
+    model, input_tokens, output_tokens, cached_tokens=0, cache_write_tokens=0
+):
+    """
+    Returns the (input, output) cost in USD. input_tokens is the full prompt
+    size, cached_tokens (cache reads) and cache_write_tokens are part of it.
+
+    Args:
+      model: model name in LLM_INFO_PATH.
+    """
+
+    model_info = get_model_info(model)
+    price_input = model_info["price_1M_input"]
+    factors = CACHE_PRICE_FACTORS.get(model_info["provider"], (1, 1))
+
+    price_read = model_info.get(CACHE_READ_PRICE_COLUMN)
+    if price_read is None or pd.isna(price_read):
+        price_read = price_input * factors[0]
+
+    price_write = model_info.get(CACHE_WRITE_PRICE_COLUMN)
+    if price_write is None or pd.isna(price_write):
+        price_write = price_input * factors[1]
+
+    uncached_tokens = input_tokens - cached_tokens - cache_write_tokens
+    cost_input = (
+        uncached_tokens * price_input
+        + cached_tokens * price_read
+        + cache_write_tokens * price_write
+    ) / 1000000
+    cost_output = (output_tokens / 1000000) * model_info["price_1M_output"]
+
+    return cost_input, cost_output
+
+
 def get_provider_info(provider):
-    df = pd.read_csv(LLM_INFO_PATH)
-    provider_data = df[df["provider"] == provider]
+    provider_data = pd.DataFrame(get_llm_info().get_all("provider", provider))
     if not provider_data.empty:
         return provider_data[["model", "api", "total_estimate"]]
     else:
@@ -180,7 +256,19 @@ def append_data_to_file(survey, model, new_df, data_type):
     output_file_path = os.path.join(output_path, output_file_name)
 
     # append data to file
-    new_df.to_csv(output_file_path, mode="a", header=False, index=False)
+    for values in new_df.itertuples(index=False, name=None):
+        get_writer(OUTPUT_DIR).write(output_file_path, new_df.columns, values)
+
+
+def get_output_columns(columns, data_type):
+
+    # prefix columns based on data_type
+    if data_type == POLICIES:
+        columns = [f"P{i+1}. {col}" for i, col in enumerate(columns)]
+    elif data_type == CONSIDERATIONS:
+        columns = [f"C{i+1}. {col}" for i, col in enumerate(columns)]
+
+    return META_DATA + columns
 
 
 def get_or_create_single_output(survey, model, columns, data_type):
@@ -199,16 +287,10 @@ def get_or_create_single_output(survey, model, columns, data_type):
     output_file_name = f"{data_type}.csv"
     output_file_path = os.path.join(output_path, output_file_name)
 
-    # prefix columns based on data_type
-    if data_type == POLICIES:
-        columns = [f"P{i+1}. {col}" for i, col in enumerate(columns)]
-    elif data_type == CONSIDERATIONS:
-        columns = [f"C{i+1}. {col}" for i, col in enumerate(columns)]
-
     # create file if it doesn't exist
     if not os.path.exists(output_file_path):
         print(f"Creating output file: {output_file_path}")
-        pd.DataFrame([], columns=META_DATA + columns).to_csv(
+        pd.DataFrame([], columns=get_output_columns(columns, data_type)).to_csv(
             output_file_path, index=False
         )
 
@@ -221,7 +303,7 @@ def get_or_create_output(survey, model, policies, considerations):
     # get empty dataframes
     p_df = get_or_create_single_output(survey, model, policies, POLICIES)
     c_df = get_or_create_single_output(survey, model, considerations, CONSIDERATIONS)
-    r_df = get_or_create_single_output(survey, model, ["reason"], REASONS)
+    r_df = get_or_create_single_output(survey, model, REASONS_COLUMNS, REASONS)
 
     return p_df, c_df, r_df
 
@@ -259,6 +341,8 @@ def log_request(
     input_tokens=0,
     output_tokens=0,
     model_version=None,
+    cached_tokens=0,
+    store=None,
 ):
     log_file_path = os.path.join(OUTPUT_DIR, provider, model, "request_log.csv")
     log_data = {
@@ -274,13 +358,24 @@ def log_request(
         "response": response,
         "input_tokens": input_tokens,
         "output_tokens": output_tokens,
+        "cached_tokens": cached_tokens,
     }
-    log_df = pd.DataFrame([log_data])
+    append_log(pd.DataFrame([log_data]), log_file_path)
+
+    # saved with the completion, see results_store
+    if store is not None:
+        store.add_request(log_data)
 
-    if os.path.isfile(log_file_path):
-        log_df.to_csv(log_file_path, mode="a", header=False, index=False)
-    else:
-        log_df.to_csv(log_file_path, mode="w", header=True, index=False)
+
+def append_log(log_df, log_file_path):
+    # the writer adds new columns to existing logs, see writer.add_columns
+    for values in log_df.itertuples(index=False, name=None):
+        get_writer(OUTPUT_DIR).write(log_file_path, log_df.columns, values)
+
+
+def flush_output():
+    """Blocks until all rows written so far are on disk."""
+    get_writer(OUTPUT_DIR).flush()
 
 
 def log_execution(
@@ -301,6 +396,13 @@ def log_execution(
     cost_output,
     surveys_exec,
     surveys_success,
+    num_aborted=0,
+    num_repaired=0,
+    cache_hits=None,
+    cache_misses=None,
+    input_tokens=None,
+    output_tokens=None,
+    concurrency=None,
 ):
 
     # get output file path
@@ -319,8 +421,17 @@ def log_execution(
         "input cost ($)": round(cost_input, 2),
         "output cost ($)": round(cost_output, 2),
         "total cost ($)": round(cost_input + cost_output, 2),
+        "input tokens": input_tokens,
+        "output tokens": output_tokens,
         "num errors": num_errors,
         "num fail completions": num_invalid,
+        "num aborted completions": num_aborted,
+        "num repaired completions": num_repaired,
+        "cache hits": cache_hits,
+        "cache misses": cache_misses,
+        "final concurrency": concurrency["limit"] if concurrency else None,
+        "peak concurrency": concurrency["peak"] if concurrency else None,
+        "throttled requests": concurrency["throttled"] if concurrency else None,
         "num success completions": sum([surveys_success[s] for s in surveys_success]),
         "success rate (%)": round(success_rate, 2),
         "total elapsed time (min)": round(elapsed_time / 60, 2),
@@ -338,10 +449,7 @@ def log_execution(
             row_value = ""
         log_df[column_name] = row_value
 
-    if os.path.isfile(log_file_path):
-        log_df.to_csv(log_file_path, mode="a", header=False, index=False)
-    else:
-        log_df.to_csv(log_file_path, mode="w", header=True, index=False)
+    append_log(log_df, log_file_path)
 
 
 def parse_numbers_from_response(response: str):
@@ -397,6 +505,21 @@ def parse_reasoning_from_response(response: str):
     return reason_text
 
 
+def split_prompt(prompt):
+    """
+    Splits a considerations or policies prompt into its instructions, which
+    are the same for every iteration of a survey, and the shuffled statements.
+    Useful as a cache breakpoint for providers with prompt caching.
+    """
+
+    for header in STATEMENTS_HEADERS:
+        if header in prompt:
+            instructions, statements = prompt.split(header, 1)
+            return instructions + header, statements
+
+    return prompt, ""
+
+
 def get_prompts(policies, considerations, likert, q_method):
 
     q_instr = Q_METHOD_INSTRUCTION.format(likert) if q_method else ""
@@ -424,7 +547,7 @@ def get_or_create_progress_tracker(survey_names):
 
     sys.stdout.write("Updating data generation progress...")
     sys.stdout.flush()
-    df = pd.read_csv(LLM_INFO_PATH)
+    df = get_models()
     for _, row in df.iterrows():
         provider = row["provider"]
         model = row["model"]
@@ -432,13 +555,11 @@ def get_or_create_progress_tracker(survey_names):
 
         for survey in survey_names:
             # check only policies file, assume all are the same length
-            policy_file = f"{POLICIES}.csv"
-            file_path = os.path.join(OUTPUT_DIR, provider, model, survey, policy_file)
+            survey_dir = os.path.join(OUTPUT_DIR, provider, model, survey)
+            file_path = os.path.join(survey_dir, f"{POLICIES}.csv")
 
             if os.path.exists(file_path):
-                s_df = pd.read_csv(file_path)
-                num_rows = len(s_df)
-                last_updated = s_df["created_at"].max()
+                num_rows, last_updated = progress_index.get_progress(survey_dir)
             else:
                 num_rows = 0
                 last_updated = get_utc_time()
@@ -529,44 +650,106 @@ def check_params(progress_df, provider, model, surveys_exec, iterations):
         exit(-1)
 
 
-def is_valid_response(c_ranks, p_ranks, considerations, policies, likert, q_method):
-    # check if data is valid -- this is a common issue
-    if len(c_ranks) != len(considerations):
-        print(
-            f"ERROR: Considerations length mismatch ({len(c_ranks)}/{len(considerations)})."
-        )
-        return False
+class InvalidTurnError(Exception):
+    """
+    Raised when a turn's response cannot pass the validity checks, so the
+    rest of the conversation is skipped.
+    """
+
+    def __init__(self, data_type, error, num_requests):
+        super().__init__(f"{error} Aborted after {data_type}.")
+        self.data_type = data_type
+        self.num_requests = num_requests
+
+
+def check_considerations(c_ranks, considerations, likert, q_method):
+    """
+    Returns why considerations ranks are invalid, or None if they are valid.
+    """
 
     # check if data is valid -- this is a common issue
-    if len(p_ranks) != len(policies):
-        print(f"ERROR: Policies length mismatch ({len(p_ranks)}/{len(policies)}).")
-        return False
+    if len(c_ranks) != len(considerations):
+        return f"Considerations length mismatch ({len(c_ranks)}/{len(considerations)})."
 
     # check if c_ranks contains values greater than likert
     if any(rank > likert or rank < 1 for rank in c_ranks):
-        print(f"ERROR: Consideration ranks contain invalid values.")
-        return False
-
-    # check if p_ranks contains values greater than the length of p_ranks
-    if any(rank > len(p_ranks) or rank < 1 for rank in p_ranks):
-        print(f"ERROR: Policy ranks contain invalid values.")
-        return False
-
-    # check if p_ranks has duplicate values
-    if len(p_ranks) != len(set(p_ranks)):
-        print(f"ERROR: Policy ranks contains duplicate values.")
-        return False
+        return f"Consideration ranks contain invalid values."
 
     # check for normality
     if q_method and not quasi_normality_check(c_ranks):
-        print(f"ERROR: Considerations do not follow a Fixed Quasi-Normal Distribution.")
-        return False
+        return f"Considerations do not follow a Fixed Quasi-Normal Distribution."
 
     # check if all considerations are the same value
     # NOTE: this is technically valid according to the instructions,
     # but unlikely in the human context.
     if len(set(c_ranks)) == 1:
-        print(f"ERROR: All considerations have the same rank.")
+        return f"All considerations have the same rank."
+
+    return None
+
+
+def check_policies(p_ranks, policies):
+    """
+    Returns why policy ranks are invalid, or None if they are valid.
+    """
+
+    # check if data is valid -- this is a common issue
+    if len(p_ranks) != len(policies):
+        return f"Policies length mismatch ({len(p_ranks)}/{len(policies)})."
+
+    # check if p_ranks contains values greater than the length of p_ranks
+    if any(rank > len(p_ranks) or rank < 1 for rank in p_ranks):
+        return f"Policy ranks contain invalid values."
+
+    # check if p_ranks has duplicate values
+    if len(p_ranks) != len(set(p_ranks)):
+        return f"Policy ranks contains duplicate values."
+
+    return None
+
+
+def check_turn(data_type, response, considerations, policies, likert, q_method):
+    """
+    Checks the ranks parsed from one turn of the conversation, so invalid
+    completions can stop before the next turn is paid for. Returns why the
+    turn is invalid, or None if it is valid or not checked.
+    """
+
+    if data_type == CONSIDERATIONS:
+        c_ranks = parse_numbers_from_response(response)
+        return check_considerations(c_ranks, considerations, likert, q_method)
+
+    if data_type == POLICIES:
+        p_ranks = parse_numbers_from_response(response)
+        return check_policies(p_ranks, policies)
+
+    return None
+
+
+def get_repair_prompt(data_type, error, considerations, policies, likert, q_method):
+    """
+    Returns a follow-up prompt that tells the model what was wrong with its
+    response to a turn, and what a valid response looks like.
+    """
+
+    if data_type == CONSIDERATIONS:
+        q_instr = Q_METHOD_INSTRUCTION.format(likert) if q_method else ""
+        return PROMPT_C_REPAIR.format(error, len(considerations), likert, q_instr)
+
+    if data_type == POLICIES:
+        return PROMPT_P_REPAIR.format(error, len(policies))
+
+    return None
+
+
+def is_valid_response(c_ranks, p_ranks, considerations, policies, likert, q_method):
+
+    error = check_considerations(c_ranks, considerations, likert, q_method)
+    if error is None:
+        error = check_policies(p_ranks, policies)
+
+    if error is not None:
+        print(f"ERROR: {error}")
         return False
 
     return True
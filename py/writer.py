@@ -0,0 +1,461 @@
+import atexit
+import csv
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+import progress_index
+
+try:
+    import fcntl
+except ImportError:
+    # no file locks, e.g. on windows
+    fcntl = None
+
+# all output rows (completions, request logs, execution logs) go through a
+# single writer thread, which batches them per file and appends them on a
+# size or time threshold. rows are appended to csv files, or as part files to
+# a partition of the parquet store. buffered rows are journaled first, so rows that
+# were not flushed when the process died are written on the next start.
+# every process has its own journal, locked while the process runs, so a
+# journal is only recovered once its process is gone. csv appends are locked
+# too, so concurrent runs can write to the same files. rows with columns a
+# file does not have, e.g. a log from an older version, add the columns to
+# the file instead of being cut to its header.
+FLUSH_ROWS = 200
+FLUSH_SECONDS = 2
+JOURNAL_PREFIX = ".write_journal"  # .write_journal-{pid}-{id}.jsonl
+JOURNAL_SUFFIX = ".jsonl"
+CSV_FORMAT = "csv"
+WAIT_SECONDS = 1  # how often flush and close check that the writer is alive
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class OutputWriter:
+    """
+    Single-writer actor that appends rows to csv files or parquet partitions.
+
+    Args:
+      journal_path: file where buffered rows are journaled, or None.
+      flush_rows: flush once this many rows are buffered.
+      flush_seconds: flush once the oldest buffered row is this old.
+    """
+
+    def __init__(
+        self, journal_path=None, flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS
+    ):
+        self.journal_path = journal_path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+
+        # rows by (format, file path), in arrival order
+        self.buffers = {}
+        self.num_rows = 0
+        self.oldest = None
+
+        # rows that could not be written, as (batch, rows) by (format, file
+        # path). they are retried on every flush, and the journal is kept
+        # until they are written
+        self.failed = {}
+
+        # sequence id of the buffered rows, flushed files are marked per batch
+        self.batch = 0
+
+        self.queue = queue.Queue()
+        self.journal = None
+        self.thread = None
+
+    def start(self):
+
+        if self.journal_path:
+            os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+            # locked under a temporary name, so no other process sees it
+            # unlocked. the lock is held until the process exits, see
+            # recover_journal
+            tmp_path = f"{self.journal_path}.tmp"
+            self.journal = open(tmp_path, "a", encoding="utf-8")
+            lock_file(self.journal)
+            os.replace(tmp_path, self.journal_path)
+            self.recover()
+
+        self.thread = threading.Thread(
+            target=self.run, name="output-writer", daemon=True
+        )
+        self.thread.start()
+
+        return self
+
+    def write(self, path, columns, values, file_format=CSV_FORMAT):
+        """Queues one row. columns is the header used if the file is new."""
+        self.queue.put(("row", (file_format, path), list(columns), list(values)))
+
+    def call(self, fn):
+        """
+        Queues fn() to run on the writer thread once every row queued so far
+        is journaled, e.g. to mark work done only after its rows are durable.
+        """
+        self.queue.put(("call", fn))
+
+    def flush(self):
+        """Blocks until every row queued so far is written."""
+        done = threading.Event()
+        self.queue.put(("flush", done))
+        self.wait(done)
+
+    def recover_journals(self):
+        """Writes the rows journaled by processes that died, then flushes."""
+        if self.journal_path:
+            self.call(self.recover)
+        self.flush()
+
+    def close(self):
+        if self.thread is None:
+            return
+        done = threading.Event()
+        self.queue.put(("close", done))
+        self.wait(done)
+
+    def wait(self, done):
+        # the writer thread may have died, e.g. on a full disk
+        while not done.wait(WAIT_SECONDS):
+            if not self.thread.is_alive():
+                message = "The output writer stopped"
+                if self.journal_path:
+                    message += f", unwritten rows are kept in {self.journal_path}"
+                raise RuntimeError(message)
+
+    def run(self):
+
+        while True:
+
+            timeout = None
+            if self.oldest is not None:
+                timeout = max(0, self.oldest + self.flush_seconds - time.monotonic())
+
+            try:
+                message = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                self.flush_buffers()
+                continue
+
+            kind = message[0]
+
+            if kind == "row":
+                _, target, columns, values = message
+                self.buffer(target, columns, values)
+                if self.num_rows >= self.flush_rows:
+                    self.flush_buffers()
+
+            elif kind == "call":
+                try:
+                    message[1]()
+                except Exception as e:
+                    print(f"ERROR: writer callback failed: {e}")
+
+            elif kind == "flush":
+                self.flush_buffers()
+                message[1].set()
+
+            elif kind == "close":
+                self.flush_buffers()
+                if self.journal is not None:
+                    # clean shutdown, nothing to recover. removed before the
+                    # lock is released, so no other process recovers it
+                    if not self.failed:
+                        try:
+                            os.remove(self.journal_path)
+                        except FileNotFoundError:
+                            pass
+                    self.journal.close()
+                    self.journal = None
+                message[1].set()
+                return
+
+    def buffer(self, target, columns, values):
+
+        file_format, path = target
+        self.log_journal(
+            {
+                "format": file_format,
+                "path": path,
+                "batch": self.batch,
+                "columns": columns,
+                "values": values,
+            }
+        )
+
+        self.buffers.setdefault(target, []).append((columns, values))
+        self.num_rows += 1
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+
+    def flush_buffers(self):
+
+        targets = list(self.failed)
+        targets += [target for target in self.buffers if target not in self.failed]
+
+        failed = {}
+        for target in targets:
+            file_format, path = target
+
+            # rows of failed flushes go first, in arrival order
+            batches = list(self.failed.get(target, []))
+            if target in self.buffers:
+                batches.append((self.batch, self.buffers[target]))
+            rows = [row for _, batch_rows in batches for row in batch_rows]
+
+            try:
+                self.append_rows(path, rows, file_format)
+            except Exception as e:
+                # kept journaled, they are retried on the next flush or start
+                print(f"ERROR: could not write {len(rows)} row(s) to {path}: {e}")
+                failed[target] = batches
+            else:
+                for batch, _ in batches:
+                    self.log_journal(
+                        {"format": file_format, "flushed": path, "batch": batch}
+                    )
+
+        self.failed = failed
+        self.buffers = {}
+        self.num_rows = 0
+        # failed rows are retried once flush_seconds pass
+        self.oldest = time.monotonic() if failed else None
+        self.batch += 1
+
+        # every row is on disk, start a new journal
+        if self.journal is not None and not self.failed:
+            self.journal.seek(0)
+            self.journal.truncate()
+
+    def append_rows(self, path, rows, file_format=CSV_FORMAT):
+
+        if file_format != CSV_FORMAT:
+            # imported here, the store needs pyarrow and imports utils
+            import parquet_store
+
+            parquet_store.append_rows(path, rows)
+            return
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        while True:
+            # other processes append whole batches too
+            f = open_locked(path)
+
+            stat_before = progress_index.get_stat(path)
+            if stat_before[0] > 0:
+                # read every time, other processes may have added columns
+                header = pd.read_csv(path, nrows=0).columns.tolist()
+                write_header = False
+            else:
+                header = []
+                write_header = True
+                # the empty file was just created by open
+                stat_before = None
+
+            # columns the file does not have yet, e.g. from a newer version
+            added = []
+            for columns, _ in rows:
+                added += [c for c in columns if c not in header and c not in added]
+            header = header + added
+
+            if write_header or not added:
+                break
+
+            # existing rows get the new columns empty, then the rows are
+            # appended to the rewritten file
+            print(f"Adding columns {added} to {path}")
+            add_columns(path, header)
+            f.close()
+
+        with f:
+            data = []
+            for columns, values in rows:
+                if columns != header:
+                    # align rows to the file's header by column name
+                    row = dict(zip(columns, values))
+                    values = [row.get(column) for column in header]
+                data.append(values)
+
+            pd.DataFrame(data, columns=header).to_csv(
+                f, header=write_header, index=False
+            )
+            f.flush()
+
+            if os.path.basename(path) == progress_index.INDEXED_FILE:
+                try:
+                    progress_index.update(path, header, data, stat_before)
+                except Exception as e:
+                    # the rows are written, a stale index is rebuilt when read
+                    print(
+                        f"WARNING: could not update the progress index of {path}: {e}"
+                    )
+
+    def log_journal(self, entry):
+        if self.journal is None:
+            return
+        self.journal.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        self.journal.flush()
+
+    def recover(self):
+        """Writes rows that were journaled but not flushed by processes that died."""
+
+        pattern = os.path.join(
+            os.path.dirname(self.journal_path), f"{JOURNAL_PREFIX}*{JOURNAL_SUFFIX}"
+        )
+        for journal_path in sorted(glob.glob(pattern)):
+            if journal_path != self.journal_path:
+                self.recover_journal(journal_path)
+
+    def recover_journal(self, journal_path):
+
+        if fcntl is None:
+            # without locks a running process' journal cannot be told apart
+            return
+
+        try:
+            f = open(journal_path, encoding="utf-8")
+        except FileNotFoundError:
+            # recovered by another process
+            return
+
+        with f:
+            # the owner holds the lock while it runs
+            if not lock_file(f, blocking=False):
+                return
+
+            # recovered and removed by another process before the lock
+            try:
+                if os.stat(journal_path).st_ino != os.fstat(f.fileno()).st_ino:
+                    return
+            except FileNotFoundError:
+                return
+
+            for (file_format, path), rows in read_journal(f).items():
+                print(f"Recovering {len(rows)} unwritten row(s) for {path}")
+                self.append_rows(path, rows, file_format)
+
+            os.remove(journal_path)
+
+
+def read_journal(f):
+    """Returns the rows of a journal that were not flushed, by file."""
+
+    rows = []
+    flushed = set()
+    markers = {}  # flushed markers per file, batches of older journals
+    for line in f:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            # partial line from a crash
+            continue
+        # journals from before the parquet store have no format
+        file_format = entry.get("format", CSV_FORMAT)
+        target = (file_format, entry.get("flushed", entry.get("path")))
+        batch = entry.get("batch", markers.get(target, 0))
+        if "flushed" in entry:
+            flushed.add((*target, batch))
+            markers[target] = markers.get(target, 0) + 1
+        else:
+            rows.append(((*target, batch), entry))
+
+    # rows of a batch that failed stay pending, even if a later batch of the
+    # same file was flushed
+    pending = {}
+    for (file_format, path, batch), entry in rows:
+        if (file_format, path, batch) not in flushed:
+            pending.setdefault((file_format, path), []).append(
+                (entry["columns"], entry["values"])
+            )
+
+    return pending
+
+
+def lock_file(f, blocking=True, shared=False):
+    """
+    Locks an open file until it is closed. Returns False if blocking is
+    False and another process holds the lock.
+    """
+
+    if fcntl is None:
+        return True
+
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+
+    try:
+        fcntl.flock(f.fileno(), operation)
+    except BlockingIOError:
+        return False
+
+    return True
+
+
+def open_locked(path):
+    """
+    Opens a csv file to append to, locked. Another process may replace the
+    file while this one waits for the lock, see add_columns, then the new
+    file is opened.
+    """
+
+    while True:
+        f = open(path, "a", newline="", encoding="utf-8")
+        lock_file(f)
+        try:
+            if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        f.close()
+
+
+def add_columns(path, header):
+    """
+    Rewrites a csv file with a wider header, its rows get the added columns
+    empty. Called with the file locked, the rewritten file replaces it.
+    """
+
+    # responses can be longer than the default field limit
+    csv.field_size_limit(2**31 - 1)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(path, newline="", encoding="utf-8") as src, open(
+        tmp_path, "w", newline="", encoding="utf-8"
+    ) as dst:
+        reader = csv.reader(src)
+        out = csv.writer(dst, lineterminator=os.linesep)
+        next(reader)
+        out.writerow(header)
+        for row in reader:
+            out.writerow(row + [""] * (len(header) - len(row)))
+
+    os.replace(tmp_path, path)
+
+
+def get_journal_path(output_dir):
+    journal_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    return os.path.join(output_dir, f"{JOURNAL_PREFIX}-{journal_id}{JOURNAL_SUFFIX}")
+
+
+def get_writer(output_dir=None):
+    """Returns the process' writer, started on first use."""
+
+    global _writer
+
+    with _writer_lock:
+        if _writer is None:
+            journal_path = get_journal_path(output_dir) if output_dir else None
+            _writer = OutputWriter(journal_path).start()
+            atexit.register(_writer.close)
+        return _writer